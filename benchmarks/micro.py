@@ -0,0 +1,208 @@
+"""Micro-benchmarks of the components and service hot paths.
+
+    python benchmarks/micro.py [-r REPEAT] [-t MIN_TIME] [-o report.json] [--compare old.json] [-k FILTER]
+
+Every benchmark is timed by timeit: the number of loops is chosen to last at least MIN_TIME seconds
+and the measure is repeated REPEAT times. The JSON report has the best and median seconds per call of
+every benchmark together with the python version and the git commit, so reports of different commits
+can be compared by --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from scratch.components import parse_description, Block
+from scratch.extension import ExtensionDefinition, ExtensionBase, ExtensionService, render_args
+from scratch.receiver14 import tokenizer
+
+__author__ = 'michele'
+
+MENU_SIZE = 100
+COMPONENTS = (10, 100)
+
+_benchmarks = []
+_services = []
+
+
+def benchmark(name):
+    """Register a setup function that return the callable to measure"""
+    def register(setup):
+        _benchmarks.append((name, setup))
+        return setup
+    return register
+
+
+def _menu(size, prefix="e"):
+    return ["{}{}".format(prefix, i) for i in range(size)]
+
+
+def _reporter(nargs, size=3):
+    """A reporter with nargs menus arguments of size elements"""
+    ExtensionDefinition._unregister_all()
+    ed = ExtensionDefinition("bench")
+    menus = {"m{}".format(i): _menu(size) for i in range(nargs)}
+    description = " ".join(["r"] + ["%m.m{}".format(i) for i in range(nargs)])
+    ed.add_reporter("r", value=0, description=description, **menus)
+    return ExtensionBase(ed).get_component("r")
+
+
+@benchmark("parse_description")
+def _parse_description():
+    menus = {"a": _menu(10), "b": {"x": 1, "y": 2}}
+    return lambda: parse_description("move %n steps to %m.a and %d.b with %s and %b", **menus)
+
+
+for _n in range(4):
+    def _get(n=_n):
+        r = _reporter(n)
+        args = ["e1"] * n
+        return lambda: r.get(*args)
+
+    def _set(n=_n):
+        r = _reporter(n)
+        args = ["e1"] * n
+        return lambda: r.set(1, *args)
+
+    benchmark("Reporter.get/{}".format(_n))(_get)
+    benchmark("Reporter.set/{}".format(_n))(_set)
+
+
+@benchmark("Reporter._values_dict/{}x{}".format(MENU_SIZE, MENU_SIZE))
+def _values_dict():
+    r = _reporter(2, MENU_SIZE)
+    for a in r.signature[0].elements:
+        for b in r.signature[1].elements:
+            r.set(1, a, b)
+    return lambda: r._values_dict(flat=True)
+
+
+def _service(components):
+    ExtensionDefinition._unregister_all()
+    ExtensionService._unregister_all()
+    ed = ExtensionDefinition("bench")
+    for i in range(components):
+        ed.add_reporter("r{}".format(i), value=i, description="r{} %m.a".format(i), a=_menu(3))
+    s = ExtensionService(ExtensionBase(ed), "bench", address="127.0.0.1")
+    _services.append(s)
+    return s
+
+
+@benchmark("ExtensionService.poll_dict_render/{}".format(MENU_SIZE))
+def _poll_dict_render():
+    s = _service(MENU_SIZE // 3)
+    values = s.extension.poll()
+    return lambda: s.poll_dict_render(values)
+
+
+@benchmark("render_args")
+def _render_args():
+    return lambda: render_args("hello world", 12, 3.5, True, "a/b")
+
+
+@benchmark("Block._get_request_data")
+def _get_request_data():
+    return lambda: Block._get_request_data("/reporter/hello%20world/12/3.5/true")
+
+
+for _n in COMPONENTS:
+    def _resolve(n=_n):
+        s = _service(n)
+        path = "/r{}/e1".format(n - 1)
+        return lambda: s._resolve_components_cgi(path)
+
+    benchmark("ExtensionService._resolve_components_cgi/{}".format(_n))(_resolve)
+
+
+@benchmark("receiver14.tokenizer")
+def _tokenizer():
+    message = 'sensor-update "a" 1 "b b" 2.5 "c ""quoted""" -3 d e'
+    return lambda: list(tokenizer(message))
+
+
+def _close(service):
+    """Services of older commits have no close(): stop them and close the socket"""
+    close = getattr(service, "close", None)
+    if close is not None:
+        close()
+        return
+    service.stop()
+    service._http.server_close()
+
+
+def measure(setup, repeat, min_time):
+    f = setup()
+    timer = timeit.Timer(f)
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time:
+            break
+        number *= 2
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {"best": min(times), "median": statistics.median(times), "loops": number}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(repeat=5, min_time=0.05, pattern=None):
+    report = {"python": platform.python_version(), "commit": _git_commit(), "benchmarks": {}}
+    for name, setup in _benchmarks:
+        if pattern and pattern not in name:
+            continue
+        report["benchmarks"][name] = measure(setup, repeat, min_time)
+    while _services:
+        _close(_services.pop())
+    ExtensionDefinition._unregister_all()
+    return report
+
+
+def compare(old, new):
+    """Lines with old and new best time and the ratio new/old of the common benchmarks"""
+    lines = []
+    for name, b in new["benchmarks"].items():
+        o = old["benchmarks"].get(name)
+        if o is None:
+            continue
+        lines.append("{:50} {:10.2f}us {:10.2f}us {:6.2f}x".format(name, o["best"] * 1e6, b["best"] * 1e6,
+                                                               b["best"] / o["best"]))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="scratch micro-benchmarks")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("-t", "--min-time", type=float, default=0.05, help="min seconds of every measure")
+    parser.add_argument("-k", "--filter", help="run just benchmarks with this substring")
+    parser.add_argument("-o", "--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="JSON report to compare with")
+    args = parser.parse_args(argv)
+    report = run(args.repeat, args.min_time, args.filter)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print("{} -> {}".format(old.get("commit"), report["commit"]), file=sys.stderr)
+        for line in compare(old, report):
+            print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Startup benchmark: import time of the scratch modules measured in fresh interpreters.
+
+    python benchmarks/startup.py [-n RUNS] [--importtime] [module ...]
+
+Print a JSON report with min/median/max seconds for every module; --importtime adds the slowest
+imports of the last run reported by python -X importtime (cumulative microseconds).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+__author__ = 'michele'
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["scratch.components", "scratch.extension", "scratch.definition"]
+
+_CODE = "import time; t = time.perf_counter(); import {}; print(time.perf_counter() - t)"
+
+
+def _run(module, importtime=False):
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", _CODE.format(module)]
+    p = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(p.stdout.strip()), p.stderr
+
+
+def _slowest(importtime, count=10):
+    """The count slowest imports from a -X importtime output"""
+    ret = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self, cumulative, name = line[len("import time:"):].split("|")
+        ret.append((int(cumulative), name.strip()))
+    return sorted(ret, reverse=True)[:count]
+
+
+def measure(module, runs=10):
+    """min, median and max import time in seconds of module in runs fresh interpreters"""
+    _run(module)  # Warm up bytecode cache
+    times = [_run(module)[0] for _ in range(runs)]
+    return {"min": min(times), "median": statistics.median(times), "max": max(times), "runs": runs}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="scratch import time benchmark")
+    parser.add_argument("-n", "--runs", type=int, default=10)
+    parser.add_argument("--importtime", action="store_true", help="report the slowest imports")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args(argv)
+    report = {"python": sys.version.split()[0], "modules": {}}
+    for m in args.modules:
+        report["modules"][m] = measure(m, args.runs)
+        if args.importtime:
+            report["modules"][m]["slowest"] = _slowest(_run(m, importtime=True)[1])
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
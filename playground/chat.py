@@ -1,10 +1,10 @@
 import json
 import logging
-from queue import Queue, Empty
-import threading
 import time
 from scratch.components import Command, BooleanBlock, Requester
 from scratch.extension import Extension, ExtensionService
+from scratch.mailbox import Mailbox
+from scratch.ports import PortPool
 
 logging.getLogger().setLevel(logging.DEBUG)
 
@@ -14,71 +14,6 @@ DEFAULT_PORT = 33445
 __author__ = 'michele'
 
 
-class SelectQueue():
-    _reset_sentinel = object()
-
-    def __init__(self):
-        self._cond = threading.Condition()
-        self._data = None
-        self._init_data()
-
-    def _init_data(self):
-        self._data = []
-
-    def put_nowait(self, d):
-        with self._cond:
-            self._data.append(d)
-            self._cond.notify_all()
-
-    def empty(self, condition=None):
-        with self._cond:
-            if self._data and len(self._data) == 1 and self._data[0] == self._reset_sentinel:
-                self._init_data()
-                return True
-            if condition is not None:
-                return not any(map(condition, self._data))
-            else:
-                return bool(self._data)
-
-    def _no_block_get(self, condition=None):
-        if condition is None:
-            if self._data:
-                return self._data.pop(0)
-            return None
-        for i, e in enumerate(self._data):
-            if e is self._reset_sentinel or condition(e):
-                del self._data[i]
-                return e
-        return None
-
-    def _block_get(self, condition=None):
-        ret = self._no_block_get(condition=condition)
-        while ret is None:
-            self._cond.wait()
-            ret = self._no_block_get(condition=condition)
-        logging.debug("$$$$$$$$$ ret = {}".format(ret))
-
-        return ret
-
-    def get(self, block=True, condition=None):
-        with self._cond:
-            if self._data and self._data[0] is self._reset_sentinel:
-                self._data.pop(0)
-            if block:
-                ret = self._block_get(condition=condition)
-            else:
-                ret = self._no_block_get(condition=condition)
-            if ret is self._reset_sentinel:
-                return None
-            return ret
-
-    def reset(self):
-        with self._cond:
-            self._init_data()
-            self._data.append(self._reset_sentinel)
-            self._cond.notify_all()
-
-
 class ChatUser(Extension):
     users = {}
     timeout = 5
@@ -87,9 +22,16 @@ class ChatUser(Extension):
         self._username = username
         ChatUser.users[self._username] = self
         self._last_register = 0
-        self._incoming_message = SelectQueue()
+        self._incoming_message = Mailbox()
         self._all_users = all_users
         super().__init__()
+        self.bus.subscribe("chat", self._deliver)
+        self.bus.subscribe("chat/{}".format(self._username), self._deliver)
+
+    def _deliver(self, messages):
+        for sender, msg in messages:
+            if sender != self._username:
+                self._incoming_message.put(sender, msg)
 
     def _reset_incomin_message(self):
         self._incoming_message.reset()
@@ -110,35 +52,20 @@ class ChatUser(Extension):
         self._last_register = time.time() - 2 * self.timeout
         self._reset_incomin_message()
 
-    def _get_groups_dicts(self):
-        """User defined groups and general group not implemented yet"""
-        return [{name: [ex] for name, ex in self.users.items()}]
-
-    def _resolve_destination(self, who):
-        who = who.lower()
-        if who in ["", "all", "tutti", "bradcast", "sparpaglia"]:
-            return self.users.values()
-        for d in self._get_groups_dicts():
-            try:
-                return d[who]
-            except KeyError:
-                pass
-        logging.warning("Utente sconosciuto {}".format(who))
-
     def _send_to(self, msg, who):
-        destinations = self._resolve_destination(who)
-        for dst in destinations:
-            if dst is not self:
-                logging.info("############ invia {} a {}".format(msg, dst.username))
-                dst._incoming_message.put_nowait((self._username, msg))
+        """Fan-out to the destinations is done by the bus"""
+        if who.lower() in ["", "all", "tutti", "bradcast", "sparpaglia"]:
+            self.publish("chat", (self._username, msg))
+        elif who in self.users:
+            self.publish("chat/{}".format(who), (self._username, msg))
+        else:
+            logging.warning("Utente sconosciuto {}".format(who))
 
     def _incoming_mail(self, who=""):
-        condition = lambda e: e[0] == who if who else None
-        return not self._incoming_message.empty(condition=condition)
+        return not self._incoming_message.empty(who or None)
 
     def _get_message(self, who=""):
-        condition = lambda e: e[0] == who if who else None
-        ret = self._incoming_message.get(block=True, condition=condition)
+        ret = self._incoming_message.get(who or None)
         if ret is None:
             return ""
         u, m = ret
@@ -192,7 +119,8 @@ if __name__ == "__main__":
     print("Utenti presenti:\n{}\n".format("\n".join(utenti)))
     chats = [ChatUser(username=utente, all_users=utenti) for utente in utenti]
     port = 33445
-    chat_services = [ExtensionService(c, c.username, port=port + i) for i, c in enumerate(chats)]
+    pool = PortPool(port, port + len(chats) - 1)
+    chat_services = [ExtensionService(c, c.username, port_pool=pool) for c in chats]
     for s in chat_services:
         with open("chat_{}.sed".format(s.name), "w") as f:
             d = s.description
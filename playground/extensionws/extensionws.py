@@ -1,6 +1,5 @@
 import socket
 from apport.fileutils import get_recent_crashes
-import flask
 
 __author__ = 'michele'
 
@@ -31,10 +30,8 @@ def show_entries():
 @app.route('/<ex_name>.sed')
 def get_extension_file(ex_name):
     e = ExtensionService.get_registered(ex_name)
-    d = e.description
     my_ip = get_local_address(request.remote_addr)
-    d["host"] = my_ip
-    response = make_response(flask.json.dumps(d))
+    response = make_response(e.description_json(my_ip))
     response.headers["Content-Disposition"] = "attachment; filename{}.sed".format(ex_name)
     return response
 
@@ -27,6 +27,13 @@ class Positions():
 
 
 class Slave(Extension):
+    def listen(self, topic):
+        """Follow the positions published on topic"""
+        self.bus.subscribe(topic, self._on_positions)
+
+    def _on_positions(self, positions):
+        self.update(*positions[-1])
+
     def do_init_components(self):
         self.x = Sensor.create(self, name="x")
         self.y = Sensor.create(self, name="y")
@@ -43,20 +50,17 @@ class Slave(Extension):
 
 
 class MasterBase(Extension):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, topic="mirror", **kwargs):
         super().__init__(*args, **kwargs)
-        self._slave = None
+        self._topic = topic
 
     @property
-    def slave(self):
-        return self._slave
-
-    @slave.setter
-    def slave(self, value):
-        self._slave = value
+    def topic(self):
+        """The bus topic where the positions are published"""
+        return self._topic
 
     def update(self, x=None, y=None, direction=None):
-        self.slave.update(x, y, direction)
+        self.publish(self.topic, (x, y, direction))
 
     def do_command(self, x, y, direction):
         self.update(float(x), float(y), float(direction))
@@ -111,9 +115,9 @@ def create_services(base_name, port=EXTENSION_DEFAULT_PORT, simple=False):
     port_master = port
     port_slave = 0 if port_master == 0 else port_master + 1
     slave = Slave
-    m = master()
+    m = master(topic=base_name)
     s = slave()
-    m.slave = s
+    s.listen(m.topic)
     es_m = ExtensionService(m, base_name+"-Master", port=port_master)
     es_s = ExtensionService(s, base_name+"-Slave", port=port_slave)
     return [es_m, es_s]
@@ -0,0 +1,155 @@
+import collections
+import logging
+import threading
+
+__author__ = 'michele'
+
+DEFAULT_BUFFER_SIZE = 1000
+DEFAULT_BATCH_SIZE = 100
+
+
+class Subscription():
+    """A subscriber of a topic: the bus appends the messages in a bounded buffer (when full the oldest
+    messages are dropped and counted in dropped). If the subscription has a callback the bus calls it
+    with the list of buffered messages (at most batch_size for each call), otherwise the subscriber
+    takes the messages by drain()."""
+
+    def __init__(self, bus, topic, callback=None, buffer_size=DEFAULT_BUFFER_SIZE, batch_size=DEFAULT_BATCH_SIZE):
+        self._bus = bus
+        self._topic = topic
+        self._callback = callback
+        self._buffer = collections.deque(maxlen=buffer_size)
+        self._batch_size = batch_size
+        self._dropped = 0
+        self._cond = threading.Condition()
+
+    @property
+    def topic(self):
+        return self._topic
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def cancel(self):
+        self._bus.unsubscribe(self)
+
+    def _put(self, messages):
+        """Called by the bus dispatcher"""
+        with self._cond:
+            overflow = len(self._buffer) + len(messages) - self._buffer.maxlen
+            if overflow > 0:
+                self._dropped += overflow
+            self._buffer.extend(messages)
+            self._cond.notify_all()
+        if self._callback is not None:
+            while self._buffer:
+                batch = self.drain(self._batch_size)
+                if batch:
+                    self._callback(batch)
+
+    def drain(self, count=None, timeout=0):
+        """Remove and return at most count (all if None) buffered messages: wait at most timeout seconds
+        (None means forever) if there are none"""
+        with self._cond:
+            if timeout != 0:
+                self._cond.wait_for(lambda: self._buffer, timeout)
+            n = len(self._buffer) if count is None else min(count, len(self._buffer))
+            return [self._buffer.popleft() for _ in range(n)]
+
+
+class Bus():
+    """In process publish/subscribe: publish() just append the message to the bus queue and a
+    dispatcher thread delivers the pending messages in batches, doing the fan-out once for all
+    subscribers of a topic. The dispatcher starts at the first publish and ends when the bus is idle.
+    """
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        :param buffer_size: default subscription buffer size
+        :param batch_size: default max number of messages for each subscription callback call
+        """
+        self._buffer_size = buffer_size
+        self._batch_size = batch_size
+        self._queue = collections.deque()
+        self._subscriptions = {}
+        self._lock = threading.Condition()
+        self._dispatcher = None
+
+    def subscribe(self, topic, callback=None, buffer_size=None, batch_size=None):
+        """Return the Subscription to topic. callback(messages) will be called by the dispatcher thread
+        with a list of messages."""
+        s = Subscription(self, topic, callback,
+                         buffer_size=buffer_size if buffer_size is not None else self._buffer_size,
+                         batch_size=batch_size if batch_size is not None else self._batch_size)
+        with self._lock:
+            self._subscriptions[topic] = self._subscriptions.get(topic, ()) + (s,)
+        return s
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = tuple(s for s in self._subscriptions.get(subscription.topic, ()) if s is not subscription)
+            if subscriptions:
+                self._subscriptions[subscription.topic] = subscriptions
+            else:
+                self._subscriptions.pop(subscription.topic, None)
+
+    def subscribers(self, topic):
+        with self._lock:
+            return len(self._subscriptions.get(topic, ()))
+
+    def connect(self, topic, component):
+        """Subscribe a component to topic: hats are flagged by every message, sensors, reporters and
+        requesters are set to the last message"""
+        if hasattr(component, "flag"):
+            return self.subscribe(topic, lambda messages: component.flag())
+        return self.subscribe(topic, lambda messages: component.set(messages[-1]))
+
+    def publish(self, topic, message):
+        self._queue.append((topic, message))
+        with self._lock:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(name="Bus dispatcher", target=self._run)
+                self._dispatcher.daemon = True
+                self._dispatcher.start()
+            self._lock.notify()
+
+    def flush(self, timeout=None):
+        """Wait until all published messages are delivered. Return False on timeout"""
+        with self._lock:
+            return self._lock.wait_for(lambda: not self._queue and self._dispatcher is None, timeout)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._dispatcher = None
+                    self._lock.notify_all()
+                    return
+                subscriptions = self._subscriptions
+            batches = collections.OrderedDict()
+            while self._queue:
+                topic, message = self._queue.popleft()
+                batches.setdefault(topic, []).append(message)
+            for topic, messages in batches.items():
+                for s in subscriptions.get(topic, ()):
+                    try:
+                        s._put(messages)
+                    except Exception as e:
+                        logging.exception(e)
+
+
+_default_bus = None
+_default_lock = threading.Lock()
+
+
+def default_bus():
+    """The process wide bus"""
+    global _default_bus
+    with _default_lock:
+        if _default_bus is None:
+            _default_bus = Bus()
+        return _default_bus
@@ -0,0 +1,49 @@
+import collections
+import threading
+
+__author__ = 'michele'
+
+
+class BusyRegistry():
+    """Extension wide index of the busy ids: components update it when they add or remove a busy id and
+    the poll path reads it by one snapshot. The same id can be busy in more components: it is removed
+    when no component has it anymore.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = collections.Counter()
+        self._count = 0
+
+    @property
+    def count(self):
+        """How many distinct busy ids: read it without lock"""
+        return self._count
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, busy):
+        with self._lock:
+            return busy in self._counts
+
+    def add(self, busy):
+        with self._lock:
+            self._counts[busy] += 1
+            self._count = len(self._counts)
+
+    def remove(self, busy):
+        with self._lock:
+            n = self._counts.get(busy, 0)
+            if n > 1:
+                self._counts[busy] = n - 1
+            elif n:
+                del self._counts[busy]
+            self._count = len(self._counts)
+
+    def snapshot(self):
+        """The set of busy ids: in the idle case it doesn't take the lock"""
+        if not self._count:
+            return set()
+        with self._lock:
+            return set(self._counts)
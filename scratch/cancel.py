@@ -0,0 +1,56 @@
+import logging
+import threading
+
+__author__ = 'michele'
+
+
+class Cancelled(Exception):
+    pass
+
+
+class CancelToken():
+    """Cooperative cancellation of a command execution: the command can poll cancelled, wait() on it
+    instead of sleep or register a callback by add_callback()."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._reason = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    @property
+    def reason(self):
+        return self._reason
+
+    def cancel(self, reason="cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for cb in callbacks:
+            try:
+                cb()
+            except Exception as e:
+                logging.exception(e)
+
+    def add_callback(self, cb):
+        """cb() will be called on cancel: immediately if already cancelled"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(cb)
+                return
+        cb()
+
+    def wait(self, timeout=None):
+        """Wait at most timeout seconds for cancellation: return True if cancelled"""
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise Cancelled(self._reason)
@@ -1,5 +1,43 @@
+import sys
+import urllib.parse
+
 __author__ = 'michele'
 
+# Returned by a CGI that took the ownership of the request socket: the handler must not answer
+DETACHED = object()
+
+
+def _map_arg(arg):
+    if arg == True:
+        return "true"
+    elif arg == False:
+        return "false"
+    return str(arg)
+
+
+def render_args(*args):
+    return "/".join([urllib.parse.quote(_map_arg(a)) for a in args])
+
+
+def to_buffers(data):
+    """CGI can return str, bytes like objects or a list of them: return a list of bytes like buffers"""
+    if isinstance(data, str):
+        return [data.encode("utf-8")]
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return [data]
+    return [d.encode("utf-8") if isinstance(d, str) else d for d in data]
+
+
+class PollKey(tuple):
+    """The key of a poll line: a (name, args...) tuple that carry its quoted rendering. It is equal
+    to the plain tuple, so it can be used anywhere a tuple key is expected."""
+
+    def __new__(cls, key):
+        k = super().__new__(cls, key)
+        k.prefix = sys.intern(render_args(*k) + " ")
+        return k
+
+
 class CGI():
     def __init__(self, cgi, headers=None):
         self._cgi = cgi
@@ -1,13 +1,22 @@
 import copy
-import inspect
+import functools
 import logging
 import threading
 import urllib.parse
 import weakref
 import re
+import sys
 import collections
+import collections.abc
+import itertools
 
-from scratch.cgi import CGI
+from scratch.cgi import CGI, PollKey
+from scratch.busy import BusyRegistry
+from scratch.cancel import CancelToken
+from scratch.history import History
+from scratch.menu import Menu
+from scratch.results import ResultsQueue
+from scratch.wal import SET, COMMAND, FLAG
 
 
 __author__ = 'michele'
@@ -31,12 +40,22 @@ _description_parser = re.compile("%(s|n|b|m\.[^\s.]+|d\.[^\s.]+)")
 class _Checker:
     def __init__(self, menu, def_mapper=None):
         self._menu = menu
+        self._elements = None
         if def_mapper is not None:
             self._def_mapper = def_mapper
 
     def _def_mapper(self, v):
         raise KeyError("Menu doesn't contain key {}".format(v))
 
+    @property
+    def elements(self):
+        """The menu elements as frozenset: don't copy the menu at every call"""
+        if isinstance(self._menu, Menu):
+            return self._menu.elements
+        if self._elements is None:
+            self._elements = frozenset(self._menu_elements())
+        return self._elements
+
 
 class _CheckerMapper(_Checker):
     def __call__(self, v):
@@ -45,9 +64,8 @@ class _CheckerMapper(_Checker):
         except KeyError:
             return self._def_mapper(v)
 
-    @property
-    def elements(self):
-        return set(self._menu.keys())
+    def _menu_elements(self):
+        return self._menu.keys()
 
 
 class _CheckerContainer(_Checker):
@@ -57,15 +75,14 @@ class _CheckerContainer(_Checker):
         else:
             return self._def_mapper(v)
 
-    @property
-    def elements(self):
-        return set(self._menu.copy())
+    def _menu_elements(self):
+        return self._menu
 
 
 def _create_menu_checker(menu):
-    if isinstance(menu, collections.Mapping):
+    if isinstance(menu, collections.abc.Mapping):
         checker = _CheckerMapper(menu)
-    elif isinstance(menu, collections.Container):
+    elif isinstance(menu, collections.abc.Container):
         checker = _CheckerContainer(menu)
     else:
         raise TypeError("Menu must be a Mapping or Container")
@@ -77,9 +94,9 @@ def _create_editable_menu_checker(menu):
     except AttributeError:
         def_mapper = str
 
-    if isinstance(menu, collections.Mapping):
+    if isinstance(menu, collections.abc.Mapping):
         checker = _CheckerMapper(menu, def_mapper)
-    elif isinstance(menu, collections.Container):
+    elif isinstance(menu, collections.abc.Container):
         checker = _CheckerContainer(menu, def_mapper)
     else:
         raise TypeError("Menu must be a Mapping or Container")
@@ -100,7 +117,7 @@ def _desc_mapper(e, **kwargs):
         checker_factory = _create_menu_checker if e[0] == 'm' else _create_editable_menu_checker
         try:
             menu = kwargs[mname]
-            if not isinstance(menu, (collections.Mapping, collections.Container)):
+            if not isinstance(menu, (collections.abc.Mapping, collections.abc.Container)):
                 raise TypeError("Menu must be a Mapping or Container")
             return checker_factory(menu)
         except KeyError:
@@ -108,17 +125,21 @@ def _desc_mapper(e, **kwargs):
                 "Description contains {} menu: need a keyword args {}=<Your menu>".format(mname, mname))
 
 
-def parse_description(description, **kwargs):
-    ret = []
+@functools.lru_cache(maxsize=4096)
+def description_elements(description):
+    """The arguments placeholders of description (e.g. ('m.a', 'n')): parsed once for each description"""
+    return tuple(_description_parser.findall(description))
 
-    elements = _description_parser.findall(description)
-    return tuple([_desc_mapper(e, **kwargs) for e in elements])
+
+def parse_description(description, **kwargs):
+    return tuple([_desc_mapper(e, **kwargs) for e in description_elements(description)])
 
 
 class BlockFactory():
     type = "u"  # unknown
     block_constructor = None  # Abstract
     cb_arg = None  # Abstract
+    callback = None  # The default cb_arg callback of the created blocks
 
     def __init__(self, ed, name, description=None, **menus):
         """
@@ -130,6 +151,7 @@ class BlockFactory():
         self._ed = weakref.ref(ed) if ed is not None else None
         self._name = name
         self._menu_dict = copy.deepcopy(menus)
+        self._menus = None
         self._description = description if description is not None else self._name
         self._signature = parse_description(self.description, **self._menu_dict)
 
@@ -155,7 +177,7 @@ class BlockFactory():
 
 
     def create(self, extension, *args, **kwargs):
-        cb = extract_arg(self.cb_arg, kwargs) if self.cb_arg is not None else None
+        cb = extract_arg(self.cb_arg, kwargs, self.callback) if self.cb_arg is not None else None
         b = self.block_constructor(extension, self, *args, **kwargs)
         if cb is not None:
             setattr(b, self.cb_arg, cb)
@@ -165,16 +187,27 @@ class BlockFactory():
     def signature(self):
         return self._signature
 
+    @property
+    def dynamic_menus(self):
+        """The Menu objects that can change at runtime"""
+        return [m for m in self._menu_dict.values() if isinstance(m, Menu)]
+
     @property
     def menus(self):
-        ret = {}
-        for k,c in self.menu_dict.items():
-            if isinstance(c, collections.Mapping):
-                ret[k] = list(c.keys())
-            else:
-                ret[k] = c
-            ret[k].sort()
-        return ret
+        """The sorted menus elements: computed once (or when a Menu change), don't modify it"""
+        version = tuple(m.version for m in self.dynamic_menus)
+        if self._menus is None or self._menus[0] != version:
+            ret = {}
+            for k, c in self._menu_dict.items():
+                ret[k] = sorted(c.keys() if isinstance(c, collections.abc.Mapping) else c)
+            self._menus = (version, ret)
+        return self._menus[1]
+
+
+def _is_instance(obj, module, cls):
+    """isinstance(obj, module.cls) without importing module: if it is not imported there are no instances"""
+    m = sys.modules.get(module)
+    return m is not None and isinstance(obj, getattr(m, cls))
 
 
 class Block():
@@ -184,6 +217,9 @@ class Block():
         self._value = value
         self._lock = threading.RLock()
         self._busy = set()
+        registry = getattr(extension, "busy_registry", None)
+        self._busy_registry = registry if isinstance(registry, BusyRegistry) else None
+        self._poll_keys = {}
 
     @property
     def extension(self):
@@ -218,17 +254,59 @@ class Block():
         with self._lock:
             return self._busy.copy()
 
+    def _callback(self, name, *args, **kwargs):
+        """Call the user callback name (do_read, do_command...): measured if the extension has a profiler"""
+        return self._profiled(name, getattr(self, name), *args, **kwargs)
+
+    def _profiled(self, name, cb, *args, **kwargs):
+        profiler = getattr(self.extension, "profiler", None)
+        if not _is_instance(profiler, "scratch.profiler", "Profiler"):
+            return cb(*args, **kwargs)
+        return profiler.call(self, name, cb, *args, **kwargs)
+
+    def _event(self, kind, level=logging.INFO, **fields):
+        """Emit a structured event in the extension event log"""
+        log = getattr(self.extension, "event_log", None)
+        if _is_instance(log, "scratch.events", "EventLog"):
+            log.emit(kind, level, component=self.name, **fields)
+
+    def _log(self, kind, args=(), value=None):
+        """Append the update to the extension WAL, if any"""
+        wal = getattr(self.extension, "wal", None)
+        if _is_instance(wal, "scratch.wal", "WalWriter"):
+            wal.append(kind, self.name, args, value)
+
     def _busy_add(self, busy):
         with self._lock:
+            if busy not in self._busy and self._busy_registry is not None:
+                self._busy_registry.add(busy)
             self._busy.add(busy)
+        self._changed()
 
     def _busy_remove(self, busy):
         with self._lock:
+            if busy in self._busy and self._busy_registry is not None:
+                self._busy_registry.remove(busy)
             self._busy.discard(busy)
+        self._changed()
 
     def _busy_clean(self):
         with self._lock:
+            if self._busy_registry is not None:
+                for busy in self._busy:
+                    self._busy_registry.remove(busy)
             self._busy = set()
+        self._changed()
+
+    def menu_changed(self, menu):
+        """Called by the extension when a Menu used by the component change"""
+        pass
+
+    def _changed(self):
+        """Notify the extension that the component state is changed"""
+        ex = self.extension
+        if ex is not None:
+            ex.changed()
 
     def do_reset(self):
         """Designed to override. Pay attention here you are in lock context: you just do your reset busness
@@ -237,7 +315,16 @@ class Block():
 
     def reset(self):
         with self._lock:
-            self.do_reset()
+            self._poll_keys = {}
+            self._callback("do_reset")
+
+    def snapshot(self):
+        """The JSON serializable state of the component or None if there is nothing to save"""
+        return None
+
+    def restore(self, state):
+        """Restore a state returned by snapshot()"""
+        pass
 
     def get_cgi(self, path):
         return None
@@ -258,6 +345,26 @@ class Block():
     def poll(self):
         return {}
 
+    def poll_key(self, args):
+        """The PollKey for (name,)+args: computed on demand and cached just for menu arguments, so the cache
+        cannot grow over the menus size"""
+        try:
+            return self._poll_keys[args]
+        except KeyError:
+            pass
+        k = PollKey((self.name,) + tuple(args))
+        if self._menu_args(args):
+            self._poll_keys[args] = k
+        return k
+
+    def _menu_args(self, args):
+        """True if every argument is an element of its menu"""
+        signature = self.signature
+        try:
+            return len(args) == len(signature) and all(a in s.elements for a, s in zip(args, signature))
+        except (AttributeError, TypeError):
+            return False
+
 
 class Reporter(Block):
 
@@ -266,6 +373,7 @@ class Reporter(Block):
         do_read = extract_arg("do_read", kwargs)
         factory = ReporterFactory(ed=None, name=name, default=default, description=description, **kwargs)
         if do_read:
+            import inspect
             if len(inspect.getargspec(do_read)[0]) != len(factory.signature):
                 raise TypeError("do_read should match the signature {}".format(factory.signature))
         return factory.create(extension=extension, do_read=do_read)
@@ -274,6 +382,10 @@ class Reporter(Block):
         v = self._get_default_value(value, info)
         super().__init__(extension, info, value=v)
 
+    def menu_changed(self, menu):
+        with self._lock:
+            self._poll_keys = {}
+
     def _get_default_value(self, value=None, info=None):
         if info is None:
             info = self._info
@@ -282,7 +394,7 @@ class Reporter(Block):
             v = copy.deepcopy(v)
         except AttributeError:
             pass
-        if len(info.signature) and not isinstance(v, collections.Mapping):
+        if len(info.signature) and not isinstance(v, collections.abc.Mapping):
             v = {None: v}
         return v
 
@@ -315,7 +427,7 @@ class Reporter(Block):
                     other = set()
                 while stack:
                     args,src,dst = stack.pop()
-                    elements = {e for e in other.copy().union(src.keys()) if e is not None}
+                    elements = {e for e in other.union(src.keys()) if e is not None}
                     for e in elements:
                         new_args = args.copy()+[e]
                         if l:
@@ -341,6 +453,7 @@ class Reporter(Block):
     def _set_value(self, value, *args):
         with self._lock:
             if not args:
+                changed = self._value != value
                 self._value = value
             else:
                 d = self._value
@@ -348,7 +461,65 @@ class Reporter(Block):
                     if not a in d:
                         d[a] = {}
                     d = d[a]
+                changed = args[-1] not in d or d[args[-1]] != value
+                d[args[-1]] = value
+        self._log(SET, args, value)
+        if changed:
+            self._changed()
+
+    def _set_values(self, items):
+        """Store a list of (args, value): consecutive items that share the arguments prefix walk the
+        nested dictionaries just once."""
+        with self._lock:
+            if not self.signature:
+                for _args, value in items:
+                    self._set_value(value)
+                return
+            prefix, d = None, None
+            for args, value in items:
+                if args[:-1] != prefix:
+                    prefix, d = args[:-1], self._value
+                    for a in prefix:
+                        d = d.setdefault(a, {})
                 d[args[-1]] = value
+                self._log(SET, args, value)
+        if items:
+            self._changed()
+
+    def _array_items(self, values):
+        """Iterate the (args, value) of a multidimensional array (e.g. numpy array or nested lists
+        with shape attribute) where every dimension is aligned to the sorted menu elements of the
+        corresponding argument."""
+        try:
+            elements = [sorted(s.elements) for s in self.signature]
+        except AttributeError:
+            raise TypeError("Arrays can be used just if all arguments are menus")
+        shape = tuple(values.shape)
+        if shape != tuple(len(e) for e in elements):
+            raise ValueError("Array shape {} doesn't fit menus {}".format(shape, elements))
+        if hasattr(values, "tolist"):
+            values = values.tolist()
+        for indexes in itertools.product(*[range(len(e)) for e in elements]):
+            v = values
+            for i in indexes:
+                v = v[i]
+            yield tuple(e[i] for e, i in zip(elements, indexes)), v
+
+    def _items(self, values):
+        return self._array_items(values) if hasattr(values, "shape") else values
+
+    def set_many(self, values):
+        """Set a lot of values at once. values can be an iterable of (args, value) pairs or an array with
+        one dimension for each argument aligned to the sorted menu elements (like numpy arrays).
+        Arguments are converted before take the lock and all values are stored in just one lock session.
+        """
+        items = []
+        l = len(self.signature)
+        for args, value in self._items(values):
+            if len(args) != l:
+                raise TypeError("set_many arguments must have {} elements".format(l))
+            items.append((self._convert_args(*args), value))
+        self._set_values(items)
 
     def _convert_args(self, *args):
         if not len(args)+len(self.signature):
@@ -362,7 +533,7 @@ class Reporter(Block):
         if len(args) != len(self.signature):
             raise TypeError("get must have {} arguments".format(len(self.signature)))
         args = self._convert_args(*args)
-        v = self.do_read(*args) if hasattr(self, "do_read") else None
+        v = self._callback("do_read", *args) if hasattr(self, "do_read") else None
         with self._lock:
             if v is not None:
                 self._set_value(v, *args)
@@ -377,7 +548,40 @@ class Reporter(Block):
     def reset(self):
         with self._lock:
             self._value = self._get_default_value()
-            self.do_reset()
+            self._poll_keys = {}
+            self._callback("do_reset")
+        self._changed()
+
+    def snapshot(self):
+        """{"value": value} or {"values": [[args, value], ...]} for the leaves of the values tree: the
+        lock is held just to walk the tree"""
+        with self._lock:
+            if not self.signature:
+                return {"value": self._value}
+            leaves = []
+            stack = [((), self._value)]
+            while stack:
+                args, d = stack.pop()
+                for k, v in d.items():
+                    if isinstance(v, collections.abc.Mapping):
+                        stack.append((args + (k,), v))
+                    else:
+                        leaves.append([list(args + (k,)), v])
+        return {"values": leaves}
+
+    def restore(self, state):
+        if "value" in state:
+            value = state["value"]
+        else:
+            value = {}
+            for args, v in state.get("values", []):
+                d = value
+                for a in args[:-1]:
+                    d = d.setdefault(a, {})
+                d[args[-1]] = v
+        with self._lock:
+            self._value = value
+        self._changed()
 
     def poll(self):
         if not self.signature:
@@ -427,7 +631,8 @@ class ReporterFactory(BlockFactory):
         return self._default
 
 class Sensor(Reporter):
-    """A simple reporter without arguments
+    """A simple reporter without arguments. If the factory define an history size the sensor
+    records the last numeric values with their timestamps.
     """
 
     @staticmethod
@@ -436,22 +641,80 @@ class Sensor(Reporter):
         factory = SensorFactory(ed=None, name=name, default=default, description=description, **kwargs)
         return factory.create(extension=extension, do_read=do_read)
 
+    def __init__(self, extension, info, value=None):
+        super().__init__(extension, info, value)
+        size = getattr(info, "history", 0)
+        self._history = History(size) if isinstance(size, int) and size > 0 else None
+
+    @property
+    def history(self):
+        """The History object or None if the sensor doesn't record it"""
+        return self._history
+
+    def _set_value(self, value, *args):
+        with self._lock:
+            super()._set_value(value, *args)
+            if self._history is not None:
+                try:
+                    self._history.append(float(value))
+                except (TypeError, ValueError):
+                    pass
+
+    def aggregate(self, function, count=None, seconds=None):
+        """Aggregate (min, max or mean) of the last count values and/or the values of the last seconds"""
+        if self._history is None:
+            raise ValueError("Sensor {} doesn't record history".format(self.name))
+        with self._lock:
+            return self._history.aggregate(function, count=count, seconds=seconds)
+
+    def export_history(self):
+        """Return (timestamps, values) arrays in chronological order"""
+        if self._history is None:
+            raise ValueError("Sensor {} doesn't record history".format(self.name))
+        with self._lock:
+            return self._history.export()
+
+    def create_aggregate(self, name, function="mean", count=None, seconds=None, default="", description=None):
+        """Create a derived sensor that report the aggregate of this sensor history. The new component
+        must be returned by do_init_components() like the others."""
+        if self._history is None:
+            raise ValueError("Sensor {} doesn't record history".format(self.name))
+        if function not in History.aggregates:
+            raise ValueError("Unknown aggregate {}: use one of {}".format(function, History.aggregates))
+        return Sensor.create(self.extension, name, default=default, description=description,
+                             do_read=lambda: self.aggregate(function, count=count, seconds=seconds))
+
+    def reset(self):
+        with self._lock:
+            if self._history is not None:
+                self._history.clear()
+            super().reset()
+
+
 class SensorFactory(ReporterFactory):
     block_constructor = Sensor
 
-    def __init__(self, ed, name, default="", description=None):
+    def __init__(self, ed, name, default="", description=None, history=0):
         """
         :param ed: The ExtensionDefinition (container)
         :param name: the name of the sensor
         :param default: the default return value
         :param description: the description of the sensor. If None the description is equal to the name. It doesn't
         accept parameters.
+        :param history: the number of values to record (0 means no history)
         :return:
         """
         super().__init__(ed=ed, name=name, description=description)
         if self.signature:
             raise ValueError("Sensor doesn't support arguments: change description [{}]".format(description))
+        if history < 0:
+            raise ValueError("History size cannot be negative")
         self._default = default
+        self._history = history
+
+    @property
+    def history(self):
+        return self._history
 
 class BooleanBlock(Reporter):
     @staticmethod
@@ -466,20 +729,25 @@ class BooleanBlock(Reporter):
     def set(self, value=True, *args, **kwargs):
         super().set(bool(value), *args, **kwargs)
 
+    def set_many(self, values):
+        super().set_many((args, bool(v)) for args, v in self._items(values))
+
     def clear(self):
         """Clear the value"""
         with self._lock:
             if not self.signature:
                 self._value = False
-                return
-            stack = [self._value]
+                stack = []
+            else:
+                stack = [self._value]
             while stack:
                 d = stack.pop()
                 for k in d:
-                    if isinstance(d[k],collections.Mapping):
+                    if isinstance(d[k],collections.abc.Mapping):
                         stack.append(d[k])
                     else:
                         d[k] = False
+        self._changed()
 
 
 class BooleanFactory(ReporterFactory):
@@ -514,11 +782,12 @@ class Command(Block):
             return self._value
 
     def command(self, *args):
-        logging.info("command {} = {}".format(self.name, args))
+        self._event("command", args=args)
         if hasattr(self, "do_command"):
-            self.do_command(*args)
+            self._callback("do_command", *args)
         with self._lock:
             self._value = args
+        self._log(COMMAND, args)
 
     def _cgi(self, request):
         _name, args = self._get_request_data(request.path)
@@ -581,11 +850,17 @@ class Hat(Block):
 
     def __init__(self, extension, info):
         super().__init__(extension=extension, info=info, value=False)
+        self._flags = 0
+
+    @property
+    def flags(self):
+        """How many times flag() was called: push transports compare it to find out the new events"""
+        return self._flags
 
     @property
     def state(self):
         try:
-            return bool(getattr(self, "do_flag")())
+            return bool(self._callback("do_flag"))
         except AttributeError:
             pass
         with self._lock:
@@ -596,11 +871,23 @@ class Hat(Block):
     def flag(self):
         with self._lock:
             self._value = True
+            self._flags += 1
+        self._log(FLAG)
+        self._changed()
 
     def reset(self):
         with self._lock:
             self._value = False
-            self.do_reset()
+            self._callback("do_reset")
+
+    def snapshot(self):
+        with self._lock:
+            return {"flag": self._value}
+
+    def restore(self, state):
+        with self._lock:
+            self._value = bool(state.get("flag", False))
+        self._changed()
 
 
 class HatFactory(BlockFactory):
@@ -609,35 +896,132 @@ class HatFactory(BlockFactory):
     cb_arg = "do_flag"
 
 
+def _accept_cancel(cb):
+    """True if cb has a cancel argument"""
+    import inspect
+    try:
+        p = inspect.signature(cb).parameters.get("cancel")
+    except (TypeError, ValueError):
+        return False
+    return p is not None and p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY)
+
+
+async def _run_cancellable(cb, token, args, kwargs):
+    import asyncio
+    task = asyncio.ensure_future(cb(*args, **kwargs))
+    loop = asyncio.get_running_loop()
+    token.add_callback(lambda: loop.call_soon_threadsafe(task.cancel))
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
 class WaiterCommand(Command):
+    """If do_command() has a cancel argument it will receive the CancelToken of the execution: the
+    execution is cancelled by reset(), by cancel(busy) or when timeout expires. Coroutine do_command()
+    are run in an asyncio loop and the task is cancelled. In any case the busy id is released at
+    cancellation time, even if do_command() doesn't care about it.
+    """
+
     @staticmethod
     def create(extension, name, default=(), description=None, **kwargs):
         do_command = extract_arg("do_command", kwargs)
         factory = WaiterCommandFactory(ed=None, name=name, default=default, description=description, **kwargs)
         return factory.create(extension=extension, do_command=do_command)
 
-    def execute_busy_command(self, busy, *args):
+    def __init__(self, extension, info):
+        super().__init__(extension=extension, info=info)
+        self._tokens = {}
+        self._timers = {}
+
+    @property
+    def timeout(self):
+        timeout = getattr(self.info, "timeout", None)
+        return timeout if isinstance(timeout, (int, float)) and timeout > 0 else None
+
+    def _do_command(self, token, *args):
+        cb = self.do_command
+        kwargs = {"cancel": token} if _accept_cancel(cb) else {}
+        import asyncio
+        if asyncio.iscoroutinefunction(cb):
+            self._profiled("do_command", asyncio.run, _run_cancellable(cb, token, args, kwargs))
+        else:
+            self._profiled("do_command", cb, *args, **kwargs)
+
+    def execute_busy_command(self, busy, *args, token=None):
+        """Execute do_command() and release busy: token is the CancelToken registered by command()"""
+        if token is None:
+            with self._lock:
+                token = self._tokens.get(busy) or CancelToken()
         try:
-            self.do_command(*args)
+            self._do_command(token, *args)
         finally:
-            self._busy_remove(busy)
+            self._release(busy, token)
+
+    def _release(self, busy, token):
+        """Stop the token timeout timer and remove busy if it still belongs to token execution"""
+        with self._lock:
+            timer = self._timers.pop(token, None)
+            if self._tokens.get(busy, token) is token:
+                self._tokens.pop(busy, None)
+                self._busy_remove(busy)
+        if timer is not None:
+            timer.cancel()
+
+    def _timeout(self, busy, token):
+        """Cancel the token execution (if it is still running)"""
+        with self._lock:
+            if self._tokens.get(busy) is not token:
+                return
+        self._event("cancel", busy=busy, reason="timeout")
+        token.cancel("timeout")
+        self._release(busy, token)
+
+    def cancel(self, busy, reason="cancelled"):
+        """Cancel the busy execution and release busy"""
+        with self._lock:
+            token = self._tokens.get(busy)
+        if token is not None:
+            self._event("cancel", busy=busy, reason=reason)
+            token.cancel(reason)
+            self._release(busy, token)
 
     def command(self, busy, *args):
-        logging.info("waiter command {} = {}".format(self.name, args))
+        self._event("waiter_command", busy=busy, args=args)
         if hasattr(self, "do_command"):
+            token = CancelToken()
             t = threading.Thread(name="Command {} [{}] execution".format(self.name, busy),
                                  target=self.execute_busy_command,
-                                 args=(busy,) + args)
+                                 args=(busy,) + args, kwargs={"token": token})
             t.setDaemon(True)
-            self._busy.add(busy)
+            with self._lock:
+                old = self._tokens.get(busy)
+                self._tokens[busy] = token
+            if old is not None:
+                old.cancel("replaced")
+            self._busy_add(busy)
+            timeout = self.timeout
+            if timeout is not None:
+                timer = threading.Timer(timeout, self._timeout, args=(busy, token))
+                timer.daemon = True
+                with self._lock:
+                    self._timers[token] = timer
+                token.add_callback(timer.cancel)
+                timer.start()
             t.start()
         with self._lock:
             self._value = args
+        self._log(COMMAND, (busy,) + args)
 
     def reset(self):
         with self._lock:
+            tokens, self._tokens = self._tokens, {}
+            self._timers = {}
+            for token in tokens.values():
+                token.cancel("reset")
             self._busy_clean()
-            self.do_reset()
+            self._callback("do_reset")
 
     def _check_command_argument(self, *args):
         """ Base implementation : should be at least one integer
@@ -658,6 +1042,17 @@ class WaiterCommandFactory(CommandFactory):
     type = "w"  # blocking commands
     block_constructor = WaiterCommand
 
+    def __init__(self, ed, name, default=(), description=None, timeout=None, **kwargs):
+        """
+        :param timeout: if not None the executions will be cancelled after timeout seconds
+        """
+        super().__init__(ed=ed, name=name, default=default, description=description, **kwargs)
+        self._timeout = timeout
+
+    @property
+    def timeout(self):
+        return self._timeout
+
 
 class Requester(Reporter):
     @staticmethod
@@ -670,7 +1065,8 @@ class Requester(Reporter):
         super().__init__(extension, info, value)
         self._condition = threading.Condition(self._lock)
         self._ready = set()
-        self._results = []
+        queue = getattr(extension, "results_queue", None)
+        self._results = queue if isinstance(queue, ResultsQueue) else ResultsQueue()
         self._pending_async_results = None
         self._init_pending_async_results()
 
@@ -680,7 +1076,6 @@ class Requester(Reporter):
     def _set_value(self, value, *args):
         args = tuple(args)
         with self._condition:
-            print("PRE "+str(self._ready))
             super()._set_value(value, *args)
             if not hasattr(self, "do_read"):
                 s = {}
@@ -691,27 +1086,34 @@ class Requester(Reporter):
                     busy = s.pop()
                     self._new_result(busy, value, None)
             self._ready.discard(args)
-            print(self._ready)
             self._condition.notify_all()
 
+    def _set_values(self, items):
+        with self._condition:
+            for args, value in items:
+                self._set_value(value, *args)
+
     def _new_result(self, busy, v="invalid", exception=None):
-        with self._lock:
-            self._results.append((busy, v, exception))
+        self._results.push(self, busy, v, exception)
+        self._changed()
 
     def _flush_results(self):
         with self._lock:
-            self._results = []
+            self._results.drain(self)
+
+    @property
+    def results_queue(self):
+        """The queue where the results are pushed: the extension one if it has it"""
+        return self._results
 
     @property
     def results(self):
         with self._lock:
-            return self._results[:]
+            return [r[1:] for r in self._results.peek(self)]
 
     def get_results(self):
         with self._lock:
-            ret = self._results
-            self._flush_results()
-            return ret
+            return [r[1:] for r in self._results.drain(self)]
 
     def execute_busy_read(self, busy, *args):
         v = "invalid"
@@ -726,20 +1128,20 @@ class Requester(Reporter):
 
     def get_async(self, busy, *args):
         args = tuple(args)
-        logging.info("requester {}".format(self.name))
+        self._event("requester", busy=busy, args=args)
         self._pending_async_results[args].add(busy)
         if hasattr(self, "do_read"):
             t = threading.Thread(name="Requester {} [{}] execution".format(self.name, busy),
                                  target=self.execute_busy_read,
                                  args=(busy,) + args)
             t.setDaemon(True)
-            self._busy.add(busy)
+            self._busy_add(busy)
             t.start()
 
     def busy_get(self, *args):
-        logging.info("busy_get {} args={}".format(self.name,args))
+        self._event("busy_get", args=args)
         if hasattr(self, "do_read"):
-            return self.do_read(*args)
+            return self._callback("do_read", *args)
         with self._condition:
             self._ready.add(args)
             self._condition.wait_for(lambda: args not in self._ready)
@@ -752,7 +1154,18 @@ class Requester(Reporter):
             self._busy_clean()
             self._flush_results()
             self._init_pending_async_results()
-            self.do_reset()
+            self._callback("do_reset")
+
+    def snapshot(self):
+        """Values and pending results"""
+        state = super().snapshot()
+        state["results"] = [[busy, v] for busy, v, _ in self.results]
+        return state
+
+    def restore(self, state):
+        super().restore(state)
+        for busy, v in state.get("results", []):
+            self._new_result(busy, v)
 
     def _check_command_argument(self, *args):
         """ Check if it is in the form int + signature or just signature..
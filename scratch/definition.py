@@ -0,0 +1,134 @@
+"""Build ExtensionDefinition from declarative JSON (or YAML, if PyYAML is installed) documents like:
+
+    {
+        "name": "robot",
+        "description": "My robot",
+        "menus": {"motor": ["left", "right"]},
+        "blocks": [
+            {"type": "sensor", "name": "volume", "value": 0, "callback": "robot.io:read_volume"},
+            {"type": "command", "name": "speed", "description": "speed %m.motor %n",
+             "callback": "robot.io.set_speed"},
+            {"type": "reporter", "name": "position", "description": "position %m.axis",
+             "menus": {"axis": ["x", "y"]}}
+        ]
+    }
+
+The other keys of a block are the arguments of the ExtensionDefinition add_<type>() method. Menus used by
+a block description are taken from the block menus or from the definition ones. Callbacks are referred by
+dotted path (module.attribute or module:attribute) and imported once.
+"""
+import functools
+import importlib
+import os
+from scratch.components import description_elements
+from scratch.extension import ExtensionDefinition
+
+__author__ = 'michele'
+
+BLOCKS = {
+    "sensor": ExtensionDefinition.add_sensor,
+    "reporter": ExtensionDefinition.add_reporter,
+    "requester": ExtensionDefinition.add_requester,
+    "command": ExtensionDefinition.add_command,
+    "waiter_command": ExtensionDefinition.add_waiter_command,
+    "hat": ExtensionDefinition.add_hat,
+}
+
+# Blocks that don't have menus arguments
+_NO_MENUS = {"sensor", "requester"}
+
+
+@functools.lru_cache(maxsize=None)
+def resolve(path):
+    """Return the object referred by 'module.attribute' or 'module:attribute'"""
+    if ":" in path:
+        module, attribute = path.split(":", 1)
+    else:
+        module, _, attribute = path.rpartition(".")
+    if not module or not attribute:
+        raise ValueError("Invalid callback path {}".format(path))
+    obj = importlib.import_module(module)
+    for a in attribute.split("."):
+        obj = getattr(obj, a)
+    if not callable(obj):
+        raise TypeError("{} is not callable".format(path))
+    return obj
+
+
+def _block_menus(block, description, menus):
+    """The menus used by description: KeyError is raised by the factory if missed"""
+    block_menus = block.pop("menus", {})
+    ret = {}
+    for e in description_elements(description):
+        if e[:2] in ("m.", "d."):
+            name = e[2:]
+            if name in block_menus:
+                ret[name] = block_menus[name]
+            elif name in menus:
+                ret[name] = menus[name]
+    return ret
+
+
+def add_block(ed, block, menus=None):
+    """Add to ed the block described by the dictionary block and return its factory"""
+    block = dict(block)
+    kind = block.pop("type", None)
+    if kind not in BLOCKS:
+        raise ValueError("Unknown block type {}".format(kind))
+    if "name" not in block:
+        raise ValueError("Block without name")
+    callback = block.pop("callback", None)
+    block_menus = _block_menus(block, block.get("description") or block["name"], menus or {})
+    if block_menus:
+        if kind in _NO_MENUS:
+            raise ValueError("Block {} of type {} can't have menus".format(block["name"], kind))
+        block.update(block_menus)
+    factory = BLOCKS[kind](ed, **block)
+    if callback is not None:
+        factory.callback = resolve(callback) if isinstance(callback, str) else callback
+    return factory
+
+
+def from_dict(data):
+    """Build and register the ExtensionDefinition described by data"""
+    ed = ExtensionDefinition(data["name"], description=data.get("description"))
+    menus = data.get("menus", {})
+    try:
+        for block in data.get("blocks", ()):
+            add_block(ed, block, menus)
+    except Exception:
+        ExtensionDefinition._names.pop(ed.name, None)
+        raise
+    return ed
+
+
+def _yaml():
+    try:
+        import yaml
+    except ImportError:
+        raise ImportError("YAML definitions need PyYAML: try from your shell 'pip install pyyaml'")
+    return yaml
+
+
+def loads(text, fmt="json"):
+    """Build the definition from a json or yaml string"""
+    if fmt == "json":
+        import json
+        return from_dict(json.loads(text))
+    if fmt == "yaml":
+        yaml = _yaml()
+        return from_dict(yaml.load(text, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)))
+    raise ValueError("Unknown format {}".format(fmt))
+
+
+def load(path):
+    """Build the definition from a .json, .yaml or .yml file"""
+    ext = os.path.splitext(path)[1].lower()
+    fmt = "yaml" if ext in (".yaml", ".yml") else "json"
+    with open(path, encoding="utf-8") as f:
+        return loads(f.read(), fmt)
+
+
+def load_all(paths):
+    """Load many definitions files: return the list of definitions"""
+    return [load(p) for p in paths]
@@ -0,0 +1,125 @@
+"""Structured event log of the framework.
+
+emit(kind, **fields) doesn't format anything: if the level is enabled and the event is sampled it
+just appends (seq, time, level, kind, fields) to a ring buffer. Events are formatted when read
+(records(), format_record() or the /log service route) or when a forwarding logger prints them.
+"""
+import collections
+import itertools
+import logging
+import threading
+import time
+
+__author__ = 'michele'
+
+DEFAULT_SIZE = 1024
+DEFAULT_LEVEL = logging.INFO
+
+
+class EventLog():
+    """Ring buffer of the last size events. sample(kind, rate) keeps just one event every rate of that
+    kind (the others are counted in sampled_out). If logger is not None the recorded events are also
+    forwarded to it, lazily formatted."""
+
+    def __init__(self, size=DEFAULT_SIZE, level=DEFAULT_LEVEL, logger=None):
+        self._records = collections.deque(maxlen=size)
+        self._level = level
+        self._logger = logger
+        self._rates = {}
+        self._counters = collections.defaultdict(itertools.count)
+        self._seq = itertools.count(1)
+        self._sampled_out = 0
+
+    @property
+    def size(self):
+        return self._records.maxlen
+
+    @property
+    def level(self):
+        return self._level
+
+    @level.setter
+    def level(self, level):
+        self._level = level
+
+    @property
+    def sampled_out(self):
+        return self._sampled_out
+
+    def sample(self, kind, rate):
+        """Record just one every rate events of kind (rate 1 records all)"""
+        if rate < 1:
+            raise ValueError("rate must be at least 1")
+        if rate == 1:
+            self._rates.pop(kind, None)
+        else:
+            self._rates[kind] = rate
+
+    def enabled(self, level):
+        return level >= self._level
+
+    def emit(self, kind, level=logging.INFO, **fields):
+        if level < self._level:
+            return
+        rate = self._rates.get(kind)
+        if rate is not None and next(self._counters[kind]) % rate:
+            self._sampled_out += 1
+            return
+        record = (next(self._seq), time.time(), level, kind, fields)
+        self._records.append(record)
+        logger = self._logger
+        if logger is not None and logger.isEnabledFor(level):
+            logger.log(level, "%s", _Lazy(record))
+
+    def records(self, since=0, kind=None, limit=None):
+        """The recorded events with seq greater than since (and of kind if not None) as dictionaries,
+        older first. limit keeps just the last limit ones."""
+        ret = [as_dict(r) for r in self._records.copy() if r[0] > since and (kind is None or r[3] == kind)]
+        return ret[-limit:] if limit else ret
+
+    def clear(self):
+        self._records.clear()
+
+
+def as_dict(record):
+    seq, t, level, kind, fields = record
+    return {"seq": seq, "time": t, "level": logging.getLevelName(level), "kind": kind,
+            "fields": {k: v if isinstance(v, (str, int, float, bool, type(None))) else repr(v)
+                       for k, v in fields.items()}}
+
+
+def format_record(record):
+    seq, t, level, kind, fields = record
+    return "{} {} {}".format(kind, logging.getLevelName(level),
+                             " ".join("{}={!r}".format(k, v) for k, v in fields.items()))
+
+
+class _Lazy():
+    """Formatted just if a handler print it"""
+    __slots__ = ("_record",)
+
+    def __init__(self, record):
+        self._record = record
+
+    def __str__(self):
+        return format_record(self._record)
+
+
+_default_log = None
+_default_lock = threading.Lock()
+
+
+def new_log():
+    """An event log that forwards to the scratch logger"""
+    return EventLog(logger=logging.getLogger("scratch"))
+
+
+def default_log():
+    """The process wide event log (of the events that don't belong to an extension)"""
+    global _default_log
+    if _default_log is not None:
+        return _default_log
+    with _default_lock:
+        if _default_log is None:
+            _default_log = new_log()
+        return _default_log
@@ -1,20 +1,34 @@
-from http.server import BaseHTTPRequestHandler, HTTPServer
-import io
+import collections
+import importlib
 import logging
-from socketserver import ThreadingMixIn
+import os
 import threading
-import urllib
+import time
+import urllib.parse
 import weakref
-from scratch.cgi import CGI
+from scratch.busy import BusyRegistry
+from scratch.cgi import CGI, DETACHED, render_args, to_buffers
+from scratch.results import ResultsQueue
 from scratch.components import SensorFactory, CommandFactory, HatFactory, WaiterCommandFactory, RequesterFactory, \
-    ReporterFactory
+    ReporterFactory, Hat
 
 __author__ = 'michele'
 
 EXTENSION_DEFAULT_ADDRESS = "0.0.0.0"
 EXTENSION_DEFAULT_PORT = 0
 
-DEFAULT_QUEUE_SIZE = 10
+# Seconds between two comments sent to an idle events stream: find out closed connections
+SSE_KEEPALIVE = 15.0
+
+# Max number of changes messages queued for a WebSocket client: a slower client is disconnected
+WS_QUEUE_SIZE = 64
+
+# Max number of hosts in the description JSON cache
+DESCRIPTION_CACHE_SIZE = 64
+
+# Max number of invocations in a batch request and max threads to execute a parallel batch
+BATCH_MAX_SIZE = 256
+BATCH_WORKERS = 8
 
 
 class ExtensionDefinition():
@@ -94,19 +108,20 @@ class ExtensionDefinition():
         self._register_components(c)
         return c
 
-    def add_sensor(self, name, value="", description=None):
+    def add_sensor(self, name, value="", description=None, history=0):
         """Create and register a sensor description"""
-        return self._create_and_register(SensorFactory, name=name, default=value, description=description)
+        return self._create_and_register(SensorFactory, name=name, default=value, description=description,
+                                         history=history)
 
     def add_command(self, name, default=(), description=None, **kwargs):
         """Create and register a command description"""
         return self._create_and_register(CommandFactory, name=name, default=default, description=description,
                                          **kwargs)
 
-    def add_waiter_command(self, name, default=(), description=None, **kwargs):
+    def add_waiter_command(self, name, default=(), description=None, timeout=None, **kwargs):
         """Create and register a waiter command description"""
         return self._create_and_register(WaiterCommandFactory, name=name, default=default, description=description,
-                                         **kwargs)
+                                         timeout=timeout, **kwargs)
 
     def add_hat(self, name, description=None, **kwargs):
         """Create and register a hat description"""
@@ -126,8 +141,20 @@ class ExtensionDefinition():
 
 class Extension():
     """The object that contains components and will be served from ExtensionService()"""
-
-    def __init__(self):
+    _bus = None
+    _event_log = None
+    wal = None
+    """The scratch.wal.WalWriter where the components log their updates (None to disable it)"""
+    profiler = None
+    """The scratch.profiler.Profiler that measures the components callbacks (None to disable it)"""
+
+    def __init__(self, results_size=None):
+        self._changes = threading.Condition()
+        self._version = 0
+        self._results_queue = ResultsQueue() if results_size is None else ResultsQueue(results_size)
+        self._busy_registry = BusyRegistry()
+        self._event_log = _lazy("new_log")()
+        self._description_version = 0
         self._components = {}
         self._init_components()
         self._factory = None
@@ -149,6 +176,21 @@ class Extension():
 
     def _init_components(self):
         self._components = {c.name: c for c in self.do_init_components()}
+        self._menus_users = collections.defaultdict(list)
+        for c in self._components.values():
+            menus = getattr(c.info, "dynamic_menus", [])
+            for m in menus if isinstance(menus, list) else []:
+                if m not in self._menus_users:
+                    m.add_listener(self._menu_changed)
+                self._menus_users[m].append(c)
+        self.description_changed()
+
+    def _menu_changed(self, menu):
+        """A Menu is changed: components update themselves, description and poll change"""
+        for c in self._menus_users.get(menu, []):
+            c.menu_changed(menu)
+        self.description_changed()
+        self.changed()
 
     @property
     def components(self):
@@ -161,6 +203,61 @@ class Extension():
     def get_component(self, name):
         return self._components[name]
 
+    @property
+    def version(self):
+        """A counter that increase at every components state change"""
+        return self._version
+
+    @property
+    def changes(self):
+        """The condition notified at every components state change"""
+        return self._changes
+
+    def changed(self):
+        """Called by components when their state change"""
+        with self._changes:
+            self._version += 1
+            self._changes.notify_all()
+
+    def wait_change(self, version, timeout=None):
+        """Wait until the version differs from version or timeout expires. Return the current version"""
+        with self._changes:
+            self._changes.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+    @property
+    def description_version(self):
+        """A counter that increase when components or menus change"""
+        return self._description_version
+
+    def description_changed(self):
+        """Must be called when block_specs or menus change"""
+        self._description_version += 1
+
+    @property
+    def bus(self):
+        """The Bus used to talk with other extensions: the process wide one if not set"""
+        return self._bus if self._bus is not None else _lazy("default_bus")()
+
+    @bus.setter
+    def bus(self, bus):
+        self._bus = bus
+
+    def publish(self, topic, message):
+        self.bus.publish(topic, message)
+
+    @property
+    def event_log(self):
+        """The scratch.events.EventLog of the components events: every extension has its own one, so
+        the /log route doesn't show other extensions events"""
+        if self._event_log is None:
+            self._event_log = _lazy("new_log")()
+        return self._event_log
+
+    @event_log.setter
+    def event_log(self, log):
+        self._event_log = log
+
     def do_reset(self):
         "Method to override to and application specific reset actions"
         pass
@@ -170,34 +267,68 @@ class Extension():
             c.reset()
         self.do_reset()
 
+    def snapshot(self):
+        """Dictionary component name -> component state (just components that have a state)"""
+        ret = {}
+        for c in self.components:
+            state = c.snapshot()
+            if state is not None:
+                ret[c.name] = state
+        return ret
+
+    def restore(self, snapshot):
+        """Restore the states of a snapshot(): unknown components are ignored"""
+        for name, state in snapshot.items():
+            c = self._components.get(name)
+            if c is not None:
+                c.restore(state)
+
+    def enable_profiling(self, threshold=None):
+        """Start to measure the components callbacks (slow threshold seconds, scratch.profiler default if
+        None): return the Profiler"""
+        profiler = _lazy("Profiler")
+        self.profiler = profiler() if threshold is None else profiler(threshold)
+        return self.profiler
+
+    def disable_profiling(self):
+        self.profiler = None
+
     def poll(self):
+        profiler = self.profiler
+        if profiler is not None and isinstance(profiler, _lazy("Profiler")):
+            with profiler.poll_path():
+                return self._poll()
+        return self._poll()
+
+    def _poll(self):
         values = {}
         for c in self.components:
             p = c.poll()
-            if c:
-                values.update({(c.name,)+k:v for k,v in p.items()})
+            if p:
+                values.update({c.poll_key(k): v for k, v in p.items()})
         return values
 
+    @property
+    def busy_registry(self):
+        """The index of busy ids updated by components"""
+        return self._busy_registry
+
     @property
     def busy(self):
-        busy = set()
-        for c in self.components:
-            busy.update(c.busy)
-        return busy
+        return self._busy_registry.snapshot()
     
+    @property
+    def results_queue(self):
+        """The queue where the requesters push their results"""
+        return self._results_queue
+
     @property
     def results(self):
         results = []
-        for c in self.components:
-            try:
-                rs = c.get_results()
-            except AttributeError:
-                pass
-            else:
-                for busy, v, exception in rs:
-                    results.append((busy, v))
-                    if exception is not None:
-                        self._problem = "[{}] : {}".format(c.name,str(exception))
+        for c, busy, v, exception in self._results_queue.drain():
+            results.append((busy, v))
+            if exception is not None:
+                self._problem = "[{}] : {}".format(c.name, str(exception))
         return results
 
     @property
@@ -219,20 +350,62 @@ class Extension():
             ret.update(c.info.menus)
         return ret
 
-class _BaseHttpMultithreadServer(ThreadingMixIn, HTTPServer):
-    daemon_threads = True
-    allow_reuse_address = True
-    request_queue_size = DEFAULT_QUEUE_SIZE
+# Server machinery and modules imported at first use: module attribute -> (module, attribute) where
+# attribute None is the module itself
+_LAZY = {
+    "json": ("json", None),
+    "queue": ("queue", None),
+    "socket": ("socket", None),
+    "default_bus": ("scratch.bus", "default_bus"),
+    "new_log": ("scratch.events", "new_log"),
+    "ChangeFeed": ("scratch.feed", "ChangeFeed"),
+    "PollParker": ("scratch.longpoll", "PollParker"),
+    "Profiler": ("scratch.profiler", "Profiler"),
+    "HTTPServer": ("http.server", "HTTPServer"),
+    "BaseHTTPRequestHandler": ("http.server", "BaseHTTPRequestHandler"),
+    "DEFAULT_QUEUE_SIZE": ("scratch.httpd", "DEFAULT_QUEUE_SIZE"),
+    "_BaseHttpMultithreadServer": ("scratch.httpd", "MultithreadServer"),
+    "_HTTPHandler": ("scratch.httpd", "HTTPHandler"),
+}
+
+
+def __getattr__(name):
+    try:
+        module, attribute = _LAZY[name]
+    except KeyError:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = importlib.import_module(module)
+    if attribute is not None:
+        value = getattr(value, attribute)
+    globals()[name] = value
+    return value
+
+
+def _lazy(name):
+    """The module attribute name, even if it is not imported yet (or it is patched)"""
+    g = globals()
+    return g[name] if name in g else __getattr__(name)
+
+
+class _LazyAttribute():
+    """Class attribute resolved by _lazy() at first access"""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __get__(self, instance, owner):
+        return _lazy(self._name)
+
 
-def _map_arg(arg):
-    if arg == True:
-        return "true"
-    elif arg == False:
-        return "false"
-    return str(arg)
+# Request used to invoke CGI without a HTTP request
+_Request = collections.namedtuple("_Request", ["path"])
 
-def render_args(*args):
-    return "/".join([urllib.parse.quote(_map_arg(a)) for a in args])
+
+def _query_args(handler):
+    path = getattr(handler, "path", "")
+    if not isinstance(path, str):
+        return {}
+    return urllib.parse.parse_qs(urllib.parse.urlsplit(path).query)
 
 
 class ExtensionService():
@@ -240,47 +413,7 @@ class ExtensionService():
     Scratch query. Expose method to get the extension, start and stop the service.
     """
 
-    class HTTPHandler(BaseHTTPRequestHandler):
-        @property
-        def context(self):
-            return self.server._context()
-
-        def _get_cgi(self):
-            return self.context._get_cgi(self.path)
-
-        def _set_headers_from_cgi(self, cgi):
-            if cgi.headers:
-                for k, v in cgi.headers.items():
-                    self.send_header(k, v)
-            else:
-                self.send_header("Content-type", "text/html")
-
-        def do_HEAD(self):
-            cgi = self._get_cgi()
-            if not cgi:
-                self.send_response(404)
-            else:
-                self.send_response(200)
-                self._set_headers_from_cgi(cgi=cgi)
-            self.end_headers()
-
-        def do_GET(self):
-            data = ''
-            cgi = self._get_cgi()
-            if not cgi:
-                self.send_response(404)
-            else:
-                try:
-                    data = cgi(self)
-                except Exception as e:
-                    logging.exception(e)
-                    self.send_response(500)
-                else:
-                    self.send_response(200)
-                    self._set_headers_from_cgi(cgi=cgi)
-
-            self.end_headers()
-            self.wfile.write(bytes(data, "utf-8"))
+    HTTPHandler = _LazyAttribute("_HTTPHandler")
 
     _names = {}
 
@@ -290,6 +423,10 @@ class ExtensionService():
             raise ValueError("Exstension named '{}' still exist".format(name))
         ExtensionService._names[name] = ed
 
+    @staticmethod
+    def _unregister_name(name):
+        ExtensionService._names.pop(name, None)
+
     @staticmethod
     def _unregister_all():
         ExtensionService._names = {}
@@ -302,21 +439,51 @@ class ExtensionService():
     def get_registered(name):
         return ExtensionService._names[name]
 
-    def __init__(self, extension, name, address=EXTENSION_DEFAULT_ADDRESS, port=EXTENSION_DEFAULT_PORT):
+    def __init__(self, extension, name, address=EXTENSION_DEFAULT_ADDRESS, port=EXTENSION_DEFAULT_PORT,
+                 port_pool=None):
         """Create a service that serve Scracth 2 requests for an extension object.
+        If port_pool is not None address and port are ignored and the service use a listening socket
+        taken from the pool: it will be given back by close().
         """
         self._extension = extension
         self._name = name
         self._address = address
         self._port = port
         self._server_thread = None
-        self._http = _BaseHttpMultithreadServer((address, port), ExtensionService.HTTPHandler)
+        self._port_pool = port_pool
+        if port_pool is None:
+            self._http = _lazy("_BaseHttpMultithreadServer")((address, port), ExtensionService.HTTPHandler)
+        else:
+            self._http = self._pooled_server(port_pool.acquire())
         self._http._context = weakref.ref(self)
         self._cgi_map = {"/poll": {"cgi": "_poll_cgi"},
                          "/crossdomain.xml": {"cgi": "_crossdomain_xml",
                                               "headers": {"Content-type": "text/xml"}},
-                         "/reset_all": {"cgi": "reset"}}
-        self._register_name(name, self)
+                         "/reset_all": {"cgi": "reset"},
+                         "/ws": {"cgi": "_websocket_cgi"},
+                         "/events": {"cgi": "_events_cgi"},
+                         "/batch": {"cgi": "_batch_cgi",
+                                    "headers": {"Content-type": "application/json"}},
+                         "/description.json": {"cgi": "_description_cgi",
+                                               "headers": {"Content-type": "application/json"}},
+                         "/log": {"cgi": "_log_cgi",
+                                  "headers": {"Content-type": "application/json"}},
+                         "/scratch-ws.js": {"cgi": "_websocket_js",
+                                            "headers": {"Content-type": "application/javascript"}}}
+        self._parker = None
+        self._feed = None
+        self._feed_last_id = -1
+        self._description = None
+        self._description_json = {}
+        self._last_access = time.monotonic()
+        self._connections = {}
+        self._connections_lock = threading.Lock()
+        try:
+            self._register_name(name, self)
+        except ValueError:
+            if port_pool is not None:
+                port_pool.release(self._http.socket)
+            raise
 
     @property
     def extension(self):
@@ -334,6 +501,72 @@ class ExtensionService():
         self._http.shutdown()
         self._server_thread.join()
         self._server_thread = None
+        if self._parker is not None:
+            self._parker.stop()
+        if self._feed is not None:
+            self._feed.stop()
+            self._feed_last_id = self._feed.last_id
+            self._feed = None
+
+    @staticmethod
+    def _pooled_server(sock):
+        """A server on a socket already bound and listening"""
+        http = _lazy("_BaseHttpMultithreadServer")(sock.getsockname()[:2], ExtensionService.HTTPHandler,
+                                          bind_and_activate=False)
+        http.socket.close()
+        http.socket = sock
+        http.server_address = sock.getsockname()
+        http.server_name, http.server_port = http.server_address[:2]
+        return http
+
+    def close(self):
+        """Stop the service, close the WebSocket and events streams connections, close (or give back to
+        the pool) the socket and unregister the name: the service cannot be used anymore"""
+        self.stop()
+        self._close_connections()
+        if self._port_pool is not None:
+            if self._http.socket is not None:
+                self._port_pool.release(self._http.socket)
+                self._http.socket = None
+        else:
+            self._http.server_close()
+        if ExtensionService._names.get(self._name) is self:
+            self._unregister_name(self._name)
+
+    @property
+    def last_access(self):
+        """time.monotonic() of the last request"""
+        return self._last_access
+
+    def touch(self):
+        self._last_access = time.monotonic()
+
+    @property
+    def connections(self):
+        """How many WebSocket and events stream connections are open"""
+        with self._connections_lock:
+            return len(self._connections)
+
+    def _add_connection(self, connection):
+        with self._connections_lock:
+            self._connections[connection] = threading.current_thread()
+
+    def _remove_connection(self, connection):
+        with self._connections_lock:
+            self._connections.pop(connection, None)
+
+    def _close_connections(self, timeout=1.0):
+        """Shutdown the open long lived connections and wait for their handler threads"""
+        with self._connections_lock:
+            connections = list(self._connections.items())
+        for connection, _ in connections:
+            try:
+                connection.shutdown(_lazy("socket").SHUT_RDWR)
+            except OSError:
+                pass
+        for _, thread in connections:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
 
     @property
     def running(self):
@@ -351,26 +584,110 @@ class ExtensionService():
     def port(self):
         return self._http.server_port
 
+    def _cached_description(self):
+        """The (version, description) cache: rebuilt when the extension description_version change"""
+        version = getattr(self._extension, "description_version", None)
+        cached = self._description
+        if cached is None or cached[0] != version:
+            cached = (version, {"extensionName": self.name,
+                                "extensionPort": self.port,
+                                "blockSpecs": self._extension.block_specs,
+                                "menus": self._extension.menus
+                                })
+            self._description = cached
+            self._description_json = {}
+        return cached
+
+    def invalidate_description(self):
+        self._description = None
+
     @property
     def description(self):
-        ret = {"extensionName": self.name,
-               "extensionPort": self.port,
-               "blockSpecs": self._extension.block_specs,
-               "menus": self._extension.menus
-        }
-        return ret
+        return dict(self._cached_description()[1])
+
+    def description_json(self, host=None):
+        """The JSON of description (bytes) with host field if not None: cached by host"""
+        version, d = self._cached_description()
+        cache = self._description_json
+        data = cache.get(host)
+        if data is None:
+            if host is not None:
+                d = dict(d, host=host)
+            data = _lazy("json").dumps(d).encode("utf-8")
+            if len(cache) >= DESCRIPTION_CACHE_SIZE:
+                cache.clear()
+            cache[host] = data
+        return data
+
+    def _description_cgi(self, handler):
+        """The host is the host query argument or the address used by the client to reach the service"""
+        host = _query_args(handler).get("host", [None])[0]
+        if host is None:
+            headers = getattr(handler, "headers", None)
+            host = headers.get("Host") if headers is not None else None
+            if host:
+                host = host.rpartition(":")[0] if host.rpartition(":")[2].isdigit() else host
+                host = host.strip("[]")
+        return self.description_json(host or None)
+
+    def _log_cgi(self, handler):
+        """The JSON list of the extension event log records: query arguments since (sequence number),
+        kind and limit filter them"""
+        args = _query_args(handler)
+        try:
+            since = int(args.get("since", [0])[0])
+            limit = int(args.get("limit", [0])[0]) or None
+        except ValueError:
+            since, limit = 0, None
+        records = self._extension.event_log.records(since=since, kind=args.get("kind", [None])[0], limit=limit)
+        return _lazy("json").dumps(records, separators=(",", ":"))
 
     def _poll_cgi(self, handler):
+        args = _query_args(handler)
+        try:
+            wait = int(args["wait"][0])
+        except (KeyError, ValueError):
+            wait = 0
+        if wait > 0:
+            return self._long_poll(handler, wait, args.get("since", [None])[0])
+        return self._poll_render()
+
+    def _poll_render(self):
         return self.poll_dict_render(self._extension.poll()) + self.busy_render(self._extension.busy) + \
                self.results_render(self._extension.results) + self.problem_render(self._extension.problem)
 
+    def _versioned_poll_render(self):
+        version = self._extension.version
+        return self._poll_render() + self.version_render(version)
+
+    def _long_poll(self, handler, wait, since=None):
+        """Answer immediately if the extension changed from since version, otherwise park the request
+        until next change or wait milliseconds expire"""
+        version = self._extension.version
+        if since is not None and since != str(version):
+            return self._versioned_poll_render()
+        sock = getattr(handler, "request", None)
+        if sock is None:
+            raise ValueError("Long poll need a HTTP connection")
+        if self._parker is None:
+            self._parker = _lazy("PollParker")(self._extension, lambda: self._versioned_poll_render().encode("utf-8"))
+        self._parker.park(sock, version, wait / 1000)
+        return DETACHED
+
+    @staticmethod
+    def version_render(version):
+        return "_version {}\n".format(version)
+
     @staticmethod
     def poll_dict_render(vals):
-        sio = io.StringIO()
-        for v, k in vals.items():
-            value = urllib.parse.quote(str(k))
-            sio.write('%s %s\n' % (render_args(*v), value))
-        return sio.getvalue()
+        lines = []
+        for k, v in vals.items():
+            try:
+                prefix = k.prefix
+            except AttributeError:
+                prefix = render_args(*k) + " "
+            lines += [prefix, urllib.parse.quote(str(v)), "\n"]
+        return "".join(lines)
 
     @staticmethod
     def busy_render(vals):
@@ -390,6 +707,214 @@ class ExtensionService():
             return ""
         return "_problem {}\n".format(problem)
 
+    def _feed_snapshot(self):
+        """The poll lines (without problem) as a dictionary, plus a "_hat name flags" line for every hat
+        (flags counts the hat events) and a "_result busy value" line for every pending requester result.
+        Results are not drained: the poll path still receives them."""
+        lines = {k: "{}{}".format(getattr(k, "prefix", None) or render_args(*k) + " ", urllib.parse.quote(str(v)))
+                 for k, v in self._extension.poll().items()}
+        lines["_busy"] = "_busy " + " ".join([str(v) for v in sorted(self._extension.busy)])
+        for c in self._extension.components:
+            if isinstance(c, Hat):
+                lines[("_hat", c.name)] = "_hat {} {}".format(urllib.parse.quote(c.name), c.flags)
+        for _, busy, v, _ in self._extension.results_queue.peek():
+            lines[("_result", busy)] = "_result {} {}".format(busy, urllib.parse.quote(str(v)))
+        return lines
+
+    @property
+    def feed(self):
+        """The ChangeFeed of the extension: created at first use. Its ids start after the ones of the
+        previous feed and from the current milliseconds (the feed never publishes 1000 events per
+        second), so a client can resume by an id of a stopped feed or of a closed service."""
+        if self._feed is None:
+            first_id = max(self._feed_last_id + 1, int(time.time() * 1000))
+            self._feed = _lazy("ChangeFeed")(self._extension, self._feed_snapshot, first_id=first_id)
+        return self._feed
+
+    def _websocket_cgi(self, handler):
+        """Upgrade the connection to WebSocket: push the changed poll lines as {"changes": [lines]} messages
+        and execute the {"id": id, "path": path, "async": false} invocations answering by
+        {"id": id, "result": result} or {"id": id, "error": error}"""
+        from scratch import websocket
+        json, queue, socket = _lazy("json"), _lazy("queue"), _lazy("socket")
+        if not websocket.is_upgrade_request(handler.headers):
+            raise ValueError("Not a WebSocket upgrade request")
+        handler.protocol_version = "HTTP/1.1"
+        handler.send_response(101)
+        handler.send_header("Upgrade", "websocket")
+        handler.send_header("Connection", "Upgrade")
+        handler.send_header("Sec-WebSocket-Accept", websocket.accept_key(handler.headers["Sec-WebSocket-Key"]))
+        handler.end_headers()
+        ws = websocket.WebSocket(handler.rfile, handler.connection)
+        self._add_connection(handler.connection)
+
+        outbox = queue.Queue(WS_QUEUE_SIZE)
+
+        def push(lines):
+            try:
+                outbox.put_nowait(lines)
+            except queue.Full:
+                logging.warning("WebSocket client too slow: disconnect it")
+                handler.connection.shutdown(socket.SHUT_RDWR)
+                raise
+
+        def sender():
+            for lines in iter(outbox.get, None):
+                try:
+                    ws.send(json.dumps({"changes": lines}))
+                except websocket.WebSocketClosed:
+                    return
+                self.touch()
+
+        sender_thread = threading.Thread(name="%s WebSocket sender" % self.name, target=sender)
+        sender_thread.daemon = True
+        sender_thread.start()
+        feed = self.feed
+        feed.subscribe(push)
+        try:
+            while True:
+                self._websocket_dispatch(ws, ws.receive())
+        except (websocket.WebSocketClosed, OSError):
+            pass
+        finally:
+            self._remove_connection(handler.connection)
+            feed.unsubscribe(push)
+            try:
+                outbox.put_nowait(None)
+            except queue.Full:
+                pass
+            ws.close()
+            try:
+                handler.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            handler.connection.close()
+        return DETACHED
+
+    @staticmethod
+    def event_render(event_id, lines, event="change"):
+        """A Server-Sent Event: every line is a data field"""
+        return "id: {}\nevent: {}\n{}\n".format(event_id, event, "".join("data: {}\n".format(l) for l in lines))
+
+    def _events_cgi(self, handler):
+        """Server-Sent Events stream of the changed poll lines. The first event is a snapshot event with
+        all current lines, than a change event for each change. If the client resume the stream by
+        Last-Event-ID header (or lastEventId query argument) and the id is still in the feed log it
+        receive just the missed change events, otherwise a new snapshot."""
+        if getattr(handler, "connection", None) is None:
+            raise ValueError("Events stream need a HTTP connection")
+        last = handler.headers.get("Last-Event-ID") or _query_args(handler).get("lastEventId", [None])[0]
+        try:
+            last = int(last)
+        except (TypeError, ValueError):
+            last = None
+        feed = self.feed
+        handler.send_response(200)
+        handler.send_header("Content-type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.end_headers()
+        self._add_connection(handler.connection)
+        feed.start()
+        try:
+            events = feed.events_since(last, 0) if last is not None else None
+            while not feed.stopped:
+                if events is None:
+                    last, lines = feed.state()
+                    data = self.event_render(last, lines, "snapshot")
+                elif events:
+                    last = events[-1][0]
+                    data = "".join(self.event_render(i, lines) for i, lines in events)
+                else:
+                    data = ": keepalive\n\n"
+                handler.wfile.write(data.encode("utf-8"))
+                self.touch()
+                events = feed.events_since(last, SSE_KEEPALIVE)
+        except OSError as e:
+            logging.info("Events stream closed: {}".format(e))
+        finally:
+            self._remove_connection(handler.connection)
+            try:
+                handler.connection.shutdown(_lazy("socket").SHUT_RDWR)
+            except OSError:
+                pass
+            handler.connection.close()
+        return DETACHED
+
+    def _websocket_dispatch(self, ws, message):
+        try:
+            message = _lazy("json").loads(message)
+            rid, path = message.get("id"), message["path"]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            ws.send(_lazy("json").dumps({"error": "Invalid message"}))
+            return
+        if message.get("async", False):
+            t = threading.Thread(name="WebSocket {} execution".format(path), target=self._websocket_invoke,
+                                 args=(ws, rid, path))
+            t.daemon = True
+            t.start()
+        else:
+            self._websocket_invoke(ws, rid, path)
+
+    def _websocket_invoke(self, ws, rid, path):
+        from scratch import websocket
+        response = {"id": rid}
+        try:
+            response["result"] = self.invoke(path)
+        except Exception as e:
+            response["error"] = str(e)
+        try:
+            ws.send(_lazy("json").dumps(response))
+        except websocket.WebSocketClosed:
+            pass
+
+    def invoke(self, path):
+        """Execute the path as it was a GET request and return the result as string"""
+        cgi = self._get_cgi(path)
+        if cgi is None:
+            raise LookupError("Not found {}".format(path))
+        data = cgi(_Request(path))
+        if data is DETACHED:
+            raise ValueError("{} cannot be invoked".format(path))
+        return b"".join(to_buffers(data)).decode("utf-8")
+
+    def _batch_cgi(self, handler):
+        """Execute many paths in one request. The paths are the path query arguments or the POST body
+        JSON: a list of paths or {"paths": [paths], "parallel": false}. The response is the JSON list
+        of {"result": result} or {"error": error} in the paths order."""
+        paths = _query_args(handler).get("path", [])
+        parallel = False
+        body = getattr(handler, "body", None)
+        if body:
+            request = _lazy("json").loads(body.decode("utf-8"))
+            if isinstance(request, dict):
+                parallel = bool(request.get("parallel", False))
+                request = request.get("paths")
+            if not isinstance(request, list) or not all(isinstance(p, str) for p in request):
+                raise ValueError("Batch must be a list of paths")
+            paths = request
+        return _lazy("json").dumps(self.batch(paths, parallel))
+
+    def batch(self, paths, parallel=False):
+        """invoke() all paths (in order or parallel) and return the list of {"result": result} or
+        {"error": error}"""
+        if len(paths) > BATCH_MAX_SIZE:
+            raise ValueError("Too many paths in batch: {} > {}".format(len(paths), BATCH_MAX_SIZE))
+        if parallel and len(paths) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=min(len(paths), BATCH_WORKERS)) as executor:
+                return list(executor.map(self._batch_invoke, paths))
+        return [self._batch_invoke(p) for p in paths]
+
+    def _batch_invoke(self, path):
+        try:
+            return {"result": self.invoke(path)}
+        except Exception as e:
+            return {"error": str(e)}
+
+    def _websocket_js(self, request):
+        with open(os.path.join(os.path.dirname(__file__), "static", "scratch-ws.js"), "rb") as f:
+            return f.read()
+
     def _crossdomain_xml(self, request):
         return """<cross-domain-policy>
 <allow-access-from domain="*" to-ports="{}"/>
@@ -401,7 +926,7 @@ class ExtensionService():
 
     def _resolve_local_cgi(self, path):
         try:
-            el = self._cgi_map[path]
+            el = self._cgi_map[path.partition("?")[0]]
         except KeyError:
             return None
         else:
@@ -416,6 +941,7 @@ class ExtensionService():
                 return cgi
 
     def _get_cgi(self, path):
+        self._last_access = time.monotonic()
         cgi = self._resolve_components_cgi(path)
         if cgi is not None:
             return cgi
@@ -436,7 +962,8 @@ class ExtensionBase(Extension):
 class ExtensionServiceBase(ExtensionService):
     """The extension service created by a ExtensionDefinition."""
 
-    def __init__(self, definition, name, address=EXTENSION_DEFAULT_ADDRESS, port=EXTENSION_DEFAULT_PORT):
+    def __init__(self, definition, name, address=EXTENSION_DEFAULT_ADDRESS, port=EXTENSION_DEFAULT_PORT,
+                 port_pool=None):
         super(ExtensionServiceBase, self).__init__(extension=ExtensionBase(definition=definition), name=name,
-                                                   address=address, port=port)
+                                                   address=address, port=port, port_pool=port_pool)
 
@@ -0,0 +1,157 @@
+import collections
+import logging
+import threading
+import time
+
+__author__ = 'michele'
+
+MIN_INTERVAL = 0.02
+LOG_SIZE = 256
+
+
+class ChangeFeed():
+    """Single producer of components changes: a thread waits for extension changes, takes a snapshot of
+    the poll lines and dispatches just the changed lines to all subscribers. Subscribers never poll the
+    extension by themselves.
+    Every change is also recorded with an increasing id in a bounded log: consumers can read the
+    changes after an id by events_since().
+    """
+
+    def __init__(self, extension, snapshot, min_interval=MIN_INTERVAL, log_size=LOG_SIZE, first_id=0):
+        """
+        :param extension: the Extension to watch
+        :param snapshot: callable that return a dictionary key -> line of the current state
+        :param min_interval: min seconds between two snapshots (sensors with do_read() can change
+        at every snapshot)
+        :param log_size: how many changes keep in the log
+        :param first_id: the id of the initial state: the ids before it belong to other feeds and
+        events_since() answers None for them
+        """
+        self._extension = extension
+        self._cond = extension.changes
+        self._snapshot = snapshot
+        self._min_interval = min_interval
+        self._lines = {}
+        self._subscribers = []
+        self._lock = threading.RLock()
+        self._deliver_lock = threading.RLock()
+        self._log_cond = threading.Condition(self._lock)
+        self._log = collections.deque(maxlen=log_size)
+        self._first_id = first_id
+        self._last_id = first_id
+        self._thread = None
+        self._stopped = False
+
+    @property
+    def lines(self):
+        """Last snapshot lines"""
+        with self._lock:
+            return list(self._lines.values())
+
+    @property
+    def last_id(self):
+        with self._lock:
+            return self._last_id
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    def state(self):
+        """Return (last_id, lines): the last change id and the lines of the current state. It starts the
+        feed if it is not running."""
+        with self._lock:
+            self.start()
+            return self._last_id, list(self._lines.values())
+
+    def events_since(self, event_id, timeout=None):
+        """Return the list of (id, lines) changes after event_id: if there aren't any wait at most timeout
+        seconds for them. Return None if event_id is not in the log anymore: the consumer must reload
+        the whole state()."""
+        with self._log_cond:
+            self._log_cond.wait_for(lambda: self._stopped or self._last_id != event_id, timeout)
+            if event_id > self._last_id or event_id < self._first_id or \
+                    (self._log and event_id < self._log[0][0] - 1):
+                return None
+            return [e for e in self._log if e[0] > event_id]
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._start()
+
+    @property
+    def subscribers(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def subscribe(self, callback):
+        """callback(lines) will be called by the feed thread with the list of changed lines. Just after
+        subscription it is called with all current lines. If callback raise an exception it will be
+        unsubscribed. Callbacks are called without holding the feed lock but one at a time: they
+        must not block (queue the lines if the delivery can be slow)."""
+        with self._deliver_lock:
+            with self._lock:
+                self.start()
+                self._subscribers.append(callback)
+                lines = list(self._lines.values())
+            self._deliver(callback, lines)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            try:
+                self._subscribers.remove(callback)
+            except ValueError:
+                pass
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        with self._lock:
+            self._log_cond.notify_all()
+            self._subscribers = []
+            thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _start(self):
+        self._stopped = False
+        version = self._extension.version
+        self._lines = self._snapshot()
+        self._thread = threading.Thread(name="Change feed", target=self._run, args=(version,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _deliver(self, callback, lines):
+        try:
+            callback(lines)
+        except Exception as e:
+            logging.info("Remove feed subscriber: {}".format(e))
+            self.unsubscribe(callback)
+
+    def _publish(self, subscribers, changed):
+        for callback in subscribers:
+            self._deliver(callback, changed)
+
+    def _run(self, version):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or self._extension.version != version)
+                if self._stopped:
+                    return
+                version = self._extension.version
+            start = time.monotonic()
+            lines = self._snapshot()
+            with self._deliver_lock:
+                with self._lock:
+                    changed = [l for k, l in lines.items() if self._lines.get(k) != l]
+                    self._lines = lines
+                    if changed:
+                        self._last_id += 1
+                        self._log.append((self._last_id, changed))
+                        self._log_cond.notify_all()
+                    subscribers = self._subscribers[:]
+                if changed:
+                    self._publish(subscribers, changed)
+            time.sleep(max(0, self._min_interval - (time.monotonic() - start)))
@@ -0,0 +1,91 @@
+import array
+import time
+
+__author__ = 'michele'
+
+
+class History():
+    """Fixed size ring buffer of numeric samples: values and timestamps are stored in two
+    parallel array('d') and append is O(1). When the buffer is full the oldest sample is
+    overwritten.
+    """
+
+    aggregates = ("min", "max", "mean")
+
+    def __init__(self, size, clock=time.time):
+        """
+        :param size: the max number of samples
+        :param clock: the function used to timestamp samples when append() don't get it
+        """
+        if size <= 0:
+            raise ValueError("History size must be a positive integer")
+        self._size = size
+        self._values = array.array('d', [0.0] * size)
+        self._times = array.array('d', [0.0] * size)
+        self._next = 0
+        self._count = 0
+        self._clock = clock
+
+    @property
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value, timestamp=None):
+        if timestamp is None:
+            timestamp = self._clock()
+        self._values[self._next] = value
+        self._times[self._next] = timestamp
+        self._next = (self._next + 1) % self._size
+        if self._count < self._size:
+            self._count += 1
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
+
+    def _window(self, count=None, seconds=None):
+        """Indexes of the samples in the window from the newest to the oldest. The window is the
+        last count samples and/or the samples not older than seconds from now."""
+        n = self._count if count is None else min(count, self._count)
+        limit = self._clock() - seconds if seconds is not None else None
+        pos = self._next
+        for _ in range(n):
+            pos = (pos - 1) % self._size
+            if limit is not None and self._times[pos] < limit:
+                return
+            yield pos
+
+    def last(self, count=None, seconds=None):
+        """The values in the window ordered from the oldest to the newest"""
+        values = [self._values[i] for i in self._window(count, seconds)]
+        values.reverse()
+        return values
+
+    def min(self, count=None, seconds=None):
+        values = [self._values[i] for i in self._window(count, seconds)]
+        return min(values) if values else None
+
+    def max(self, count=None, seconds=None):
+        values = [self._values[i] for i in self._window(count, seconds)]
+        return max(values) if values else None
+
+    def mean(self, count=None, seconds=None):
+        values = [self._values[i] for i in self._window(count, seconds)]
+        return sum(values) / len(values) if values else None
+
+    def aggregate(self, function, count=None, seconds=None):
+        """Compute the aggregate named function (min, max or mean): None if the window is empty"""
+        if function not in self.aggregates:
+            raise ValueError("Unknown aggregate {}: use one of {}".format(function, self.aggregates))
+        return getattr(self, function)(count=count, seconds=seconds)
+
+    def export(self):
+        """Return (timestamps, values) arrays copies in chronological order"""
+        start = (self._next - self._count) % self._size
+        if start + self._count <= self._size:
+            end = start + self._count
+            return self._times[start:end], self._values[start:end]
+        return self._times[start:] + self._times[:self._next], self._values[start:] + self._values[:self._next]
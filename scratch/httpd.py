@@ -0,0 +1,114 @@
+"""The HTTP server machinery of ExtensionService: scratch.extension imports it just when the first
+service is created, so extensions and definitions can be used without paying http.server import."""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import logging
+from socketserver import ThreadingMixIn
+from scratch.cgi import DETACHED, to_buffers
+
+__author__ = 'michele'
+
+DEFAULT_QUEUE_SIZE = 10
+
+# Max number of buffers in a single sendmsg()
+MAX_IOV = 1024
+
+
+class MultithreadServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = DEFAULT_QUEUE_SIZE
+
+    def __init__(self, *args, **kwargs):
+        self._detached = set()
+        super().__init__(*args, **kwargs)
+
+    def detach(self, request):
+        """The request socket will be closed by someone else"""
+        self._detached.add(request)
+
+    def shutdown_request(self, request):
+        if request in self._detached:
+            self._detached.discard(request)
+            return
+        super().shutdown_request(request)
+
+
+def gathered_write(sendmsg, buffers):
+    """Write all buffers by sendmsg(): retry on partial writes without join buffers"""
+    views = [memoryview(b).cast("B") for b in buffers if len(b)]
+    while views:
+        sent = sendmsg(views[:MAX_IOV])
+        while sent:
+            n = views[0].nbytes
+            if sent >= n:
+                sent -= n
+                views.pop(0)
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+
+
+class HTTPHandler(BaseHTTPRequestHandler):
+    @property
+    def context(self):
+        return self.server._context()
+
+    def _get_cgi(self):
+        return self.context._get_cgi(self.path)
+
+    def _set_headers_from_cgi(self, cgi):
+        if cgi.headers:
+            for k, v in cgi.headers.items():
+                self.send_header(k, v)
+        else:
+            self.send_header("Content-type", "text/html")
+
+    def do_HEAD(self):
+        cgi = self._get_cgi()
+        if not cgi:
+            self.send_response(404)
+        else:
+            self.send_response(200)
+            self._set_headers_from_cgi(cgi=cgi)
+        self.end_headers()
+
+    def do_POST(self):
+        """Like GET but the CGI can read the request body in self.body"""
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = 0
+        self.body = self.rfile.read(length) if length > 0 else b""
+        self.do_GET()
+
+    def do_GET(self):
+        data = b''
+        cgi = self._get_cgi()
+        if not cgi:
+            self.send_response(404)
+        else:
+            try:
+                data = cgi(self)
+            except Exception as e:
+                logging.exception(e)
+                self.send_response(500)
+            else:
+                if data is DETACHED:
+                    self.server.detach(self.request)
+                    self.close_connection = True
+                    return
+                self.send_response(200)
+                self._set_headers_from_cgi(cgi=cgi)
+
+        self._end_headers_and_write(to_buffers(data))
+
+    def _end_headers_and_write(self, buffers):
+        """Like end_headers() but write headers and body buffers by just one gathered write"""
+        if self.request_version != 'HTTP/0.9':
+            buffers = getattr(self, "_headers_buffer", []) + [b"\r\n"] + buffers
+            self._headers_buffer = []
+        sendmsg = getattr(self.connection, "sendmsg", None)
+        if sendmsg is None:
+            self.wfile.write(b"".join(buffers))
+        else:
+            gathered_write(sendmsg, buffers)
@@ -0,0 +1,252 @@
+"""Link Bus instances of different processes by Unix domain sockets.
+
+Every frame is a header (kind, topic length, payload length) followed by the UTF-8 topic and the
+JSON payload. A link forwards the local messages of some topics to the peer and publishes on the
+local bus the messages received from the peer.
+"""
+import collections
+import json
+import logging
+import os
+import socket
+import stat
+import struct
+import threading
+from scratch.bus import DEFAULT_BUFFER_SIZE
+
+__author__ = 'michele'
+
+HEADER = struct.Struct(">cHI")
+PUBLISH = b"P"
+SUBSCRIBE = b"S"
+
+MAX_PAYLOAD = 1 << 24
+
+# Seconds a write to the peer can wait: a peer that doesn't read for longer is disconnected
+SEND_TIMEOUT = 5.0
+
+
+class LinkClosed(Exception):
+    pass
+
+
+def encode_frame(kind, topic, payload=b""):
+    topic = topic.encode("utf-8")
+    return HEADER.pack(kind, len(topic), len(payload)) + topic + payload
+
+
+def encode_message(topic, message):
+    return encode_frame(PUBLISH, topic, json.dumps(message, separators=(",", ":")).encode("utf-8"))
+
+
+def _read(rfile, n):
+    data = rfile.read(n)
+    if len(data) < n:
+        raise LinkClosed("Connection closed")
+    return data
+
+
+def read_frame(rfile):
+    """Return (kind, topic, payload)"""
+    kind, topic_length, length = HEADER.unpack(_read(rfile, HEADER.size))
+    if length > MAX_PAYLOAD:
+        raise LinkClosed("Frame too big")
+    topic = _read(rfile, topic_length).decode("utf-8")
+    return kind, topic, _read(rfile, length) if length else b""
+
+
+class BusLink():
+    """A connection between the local bus and a peer. forward(topic) sends the local topic messages to
+    the peer; subscribe(topic) asks the peer to send us its topic messages, that will be published on
+    the local bus. A topic can flow just in one direction on a link, otherwise messages bounce forever.
+    Outgoing messages wait in a bounded buffer and a writer thread sends all pending messages by one
+    write: the producer (the process wide bus dispatcher) never waits for the peer. When the buffer is
+    full the oldest messages are dropped and counted in dropped; a peer that doesn't read for
+    send_timeout seconds is disconnected. Control frames have their own queue: they are never dropped.
+    """
+
+    def __init__(self, bus, sock, buffer_size=DEFAULT_BUFFER_SIZE, send_timeout=SEND_TIMEOUT):
+        self._bus = bus
+        self._sock = sock
+        self._rfile = sock.makefile("rb")
+        if send_timeout:
+            _set_send_timeout(sock, send_timeout)
+        self._out = collections.deque(maxlen=buffer_size)
+        self._control = collections.deque()
+        self._cond = threading.Condition()
+        self._forwards = {}
+        self._subscribed = set()
+        self._dropped = 0
+        self._closed = False
+        self._reader = threading.Thread(name="Bus link reader", target=self._read_loop)
+        self._reader.daemon = True
+        self._writer = threading.Thread(name="Bus link writer", target=self._write_loop)
+        self._writer.daemon = True
+        self._reader.start()
+        self._writer.start()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def dropped(self):
+        """How many messages were dropped because the buffer was full"""
+        return self._dropped
+
+    @property
+    def forwarded(self):
+        with self._cond:
+            return set(self._forwards)
+
+    def forward(self, topic):
+        with self._cond:
+            if topic in self._subscribed:
+                raise ValueError("Topic {} already comes from the peer".format(topic))
+            if topic in self._forwards:
+                return
+            self._forwards[topic] = self._bus.subscribe(topic, lambda messages: self._send_messages(topic, messages))
+
+    def subscribe(self, topic):
+        with self._cond:
+            if topic in self._forwards:
+                raise ValueError("Topic {} is already forwarded to the peer".format(topic))
+            self._subscribed.add(topic)
+            if self._closed:
+                raise LinkClosed("Link closed")
+            self._control.append(encode_frame(SUBSCRIBE, topic))
+            self._cond.notify_all()
+
+    def _send_messages(self, topic, messages):
+        self._send([encode_message(topic, m) for m in messages])
+
+    def _send(self, frames):
+        with self._cond:
+            if self._closed:
+                raise LinkClosed("Link closed")
+            overflow = len(self._out) + len(frames) - self._out.maxlen
+            if overflow > 0:
+                self._dropped += overflow
+            self._out.extend(frames)
+            self._cond.notify_all()
+
+    def _write_loop(self):
+        try:
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._out or self._control or self._closed)
+                    if self._closed:
+                        return
+                    frames = list(self._control) + list(self._out)
+                    self._control.clear()
+                    self._out.clear()
+                self._sock.sendall(b"".join(frames))
+        except OSError as e:
+            logging.info("Bus link write error: {}".format(e))
+            self.close()
+
+    def _read_loop(self):
+        try:
+            while True:
+                kind, topic, payload = read_frame(self._rfile)
+                if kind == PUBLISH:
+                    self._bus.publish(topic, json.loads(payload.decode("utf-8")))
+                elif kind == SUBSCRIBE:
+                    self.forward(topic)
+                else:
+                    raise LinkClosed("Unknown frame {}".format(kind))
+        except (LinkClosed, OSError, ValueError) as e:
+            logging.info("Bus link closed: {}".format(e))
+        finally:
+            self.close()
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            forwards, self._forwards = self._forwards, {}
+            self._cond.notify_all()
+        for s in forwards.values():
+            s.cancel()
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._rfile.close()
+        self._sock.close()
+
+
+def _set_send_timeout(sock, timeout):
+    """Kernel send timeout: unlike settimeout() it doesn't make the reads non blocking"""
+    seconds = int(timeout)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO,
+                    struct.pack("ll", seconds, int((timeout - seconds) * 1000000)))
+
+
+def _unlink_socket(path):
+    """Remove the stale socket on path: refuse to remove anything else"""
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError("{} exists and it is not a socket".format(path))
+    os.unlink(path)
+
+
+def connect(bus, path, buffer_size=DEFAULT_BUFFER_SIZE, send_timeout=SEND_TIMEOUT):
+    """Link bus to the BusServer listening on path"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    return BusLink(bus, sock, buffer_size=buffer_size, send_timeout=send_timeout)
+
+
+class BusServer():
+    """Accept the links of other processes on the Unix socket path"""
+
+    def __init__(self, bus, path, buffer_size=DEFAULT_BUFFER_SIZE, send_timeout=SEND_TIMEOUT):
+        self._bus = bus
+        self._path = path
+        self._buffer_size = buffer_size
+        self._send_timeout = send_timeout
+        self._links = []
+        self._lock = threading.Lock()
+        _unlink_socket(path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(path)
+        self._sock.listen(16)
+        self._thread = threading.Thread(name="Bus server {}".format(path), target=self._accept_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def links(self):
+        with self._lock:
+            self._links = [l for l in self._links if not l.closed]
+            return list(self._links)
+
+    def _accept_loop(self):
+        while True:
+            try:
+                sock, _ = self._sock.accept()
+            except OSError:
+                return
+            link = BusLink(self._bus, sock, buffer_size=self._buffer_size, send_timeout=self._send_timeout)
+            with self._lock:
+                self._links.append(link)
+
+    def close(self):
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        self._thread.join()
+        for l in self.links:
+            l.close()
+        _unlink_socket(self._path)
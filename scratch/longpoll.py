@@ -0,0 +1,178 @@
+import logging
+import selectors
+import socket
+import threading
+import time
+
+__author__ = 'michele'
+
+SEND_TIMEOUT = 2.0  # Seconds to answer a parked request before close it
+
+
+class _Parked():
+    def __init__(self, sock, version, deadline):
+        self.sock = sock
+        self.version = version
+        self.deadline = deadline
+
+
+class PollParker():
+    """Hold the parked long poll requests. A single thread waits for extension changes (or the
+    nearest timeout) and answers all ready requests by the same rendered body: no thread is
+    blocked for each parked request. The thread starts when the first request is parked and
+    ends when there are no more parked requests. Answers are sent without blocking: what the
+    socket cannot take at once is written by a writer thread that closes the too slow clients.
+    """
+
+    def __init__(self, extension, render):
+        """
+        :param extension: the Extension to watch
+        :param render: callable that return the response body (bytes) to send to the ready requests
+        """
+        self._extension = extension
+        self._cond = extension.changes
+        self._render = render
+        self._parked = []
+        self._thread = None
+        self._stopped = False
+        self._writing = {}
+        self._writing_lock = threading.Lock()
+        self._writer = None
+
+    def __len__(self):
+        with self._cond:
+            return len(self._parked)
+
+    def park(self, sock, version, timeout):
+        """Park the request socket: it will be answered when the extension version differs from
+        version or timeout (seconds) expires"""
+        with self._cond:
+            self._stopped = False
+            self._parked.append(_Parked(sock, version, time.monotonic() + timeout))
+            if self._thread is None:
+                self._thread = threading.Thread(name="Long poll parker", target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify_all()
+
+    def stop(self):
+        """Close all parked requests without answer and stop the thread"""
+        with self._cond:
+            self._stopped = True
+            parked, self._parked = self._parked, []
+            self._cond.notify_all()
+        with self._writing_lock:
+            writing, self._writing = self._writing, {}
+        for sock in [p.sock for p in parked] + list(writing):
+            self._close(sock)
+
+    def _ready(self):
+        """Must be called in condition context: remove and return the ready requests"""
+        now = time.monotonic()
+        version = self._extension.version
+        ready = [p for p in self._parked if p.version != version or p.deadline <= now]
+        if ready:
+            ready_set = set(ready)
+            self._parked = [p for p in self._parked if p not in ready_set]
+        return ready
+
+    def _run(self):
+        while True:
+            with self._cond:
+                ready = self._ready()
+                while not ready:
+                    if self._stopped or not self._parked:
+                        self._thread = None
+                        return
+                    self._cond.wait(min(p.deadline for p in self._parked) - time.monotonic())
+                    ready = self._ready()
+            try:
+                body = self._render()
+            except Exception as e:
+                logging.exception(e)
+                for p in ready:
+                    self._respond(p.sock, b"", status=b"500 Internal Server Error")
+            else:
+                for p in ready:
+                    self._respond(p.sock, body)
+
+    def _respond(self, sock, body, status=b"200 OK"):
+        header = b"HTTP/1.0 " + status + b"\r\nContent-type: text/html\r\nContent-Length: " + \
+                 str(len(body)).encode() + b"\r\n\r\n"
+        data = header + body
+        try:
+            sock.setblocking(False)
+            sent = sock.send(data)
+        except BlockingIOError:
+            sent = 0
+        except OSError as e:
+            logging.info("Cannot answer parked poll: {}".format(e))
+            sent = len(data)
+        if sent < len(data):
+            self._write_later(sock, data[sent:])
+        else:
+            self._close(sock)
+
+    def _write_later(self, sock, data):
+        """Leave to the writer thread the data that sock cannot take now"""
+        with self._writing_lock:
+            self._writing[sock] = (memoryview(data), time.monotonic() + SEND_TIMEOUT)
+            if self._writer is None:
+                self._writer = threading.Thread(name="Long poll writer", target=self._write)
+                self._writer.daemon = True
+                self._writer.start()
+
+    def _write(self):
+        while True:
+            with self._writing_lock:
+                if not self._writing:
+                    self._writer = None
+                    return
+                writing = dict(self._writing)
+            now = time.monotonic()
+            with selectors.DefaultSelector() as selector:
+                for sock, (_data, deadline) in writing.items():
+                    if deadline <= now:
+                        logging.info("Cannot answer parked poll: timeout")
+                        self._done(sock)
+                    else:
+                        try:
+                            selector.register(sock, selectors.EVENT_WRITE)
+                        except (ValueError, OSError):
+                            """Closed by stop()"""
+                            self._done(sock)
+                if not selector.get_map():
+                    continue
+                """Short timeout: new answers are taken at next round"""
+                timeout = min(0.05, min(deadline for _data, deadline in writing.values()) - now)
+                for key, _events in selector.select(max(timeout, 0)):
+                    self._send(key.fileobj, *writing[key.fileobj])
+
+    def _send(self, sock, data, deadline):
+        try:
+            sent = sock.send(data)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logging.info("Cannot answer parked poll: {}".format(e))
+            sent = len(data)
+        if sent < len(data):
+            with self._writing_lock:
+                if sock in self._writing:
+                    self._writing[sock] = (data[sent:], deadline)
+        else:
+            self._done(sock)
+
+    def _done(self, sock):
+        with self._writing_lock:
+            if self._writing.pop(sock, None) is None:
+                return
+        self._close(sock)
+
+    @staticmethod
+    def _close(sock):
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
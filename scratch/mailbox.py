@@ -0,0 +1,140 @@
+import collections
+import threading
+
+__author__ = 'michele'
+
+DEFAULT_SIZE = 1000
+
+DROP_OLDEST = "oldest"
+DROP_NEWEST = "newest"
+
+_ANY = object()
+
+
+class Mailbox():
+    """The incoming messages of a recipient indexed by sender. put(), get() of the oldest message of a
+    sender or of the oldest message at all are O(1). A reader waiting for a sender is woken just by
+    that sender messages (or by reset()).
+    When full the drop policy choose if drop the oldest message (DROP_OLDEST) or refuse the new one
+    (DROP_NEWEST): dropped messages are counted in dropped.
+    reset() remove all messages and wakes up all waiting readers that return None.
+    """
+
+    def __init__(self, size=DEFAULT_SIZE, drop=DROP_OLDEST):
+        if drop not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError("Unknown drop policy {}".format(drop))
+        self._size = size
+        self._drop = drop
+        self._lock = threading.Lock()
+        self._waiters = {}
+        self._messages = collections.OrderedDict()
+        self._by_sender = {}
+        self._seq = 0
+        self._generation = 0
+        self._dropped = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    def __len__(self):
+        with self._lock:
+            return len(self._messages)
+
+    @property
+    def senders(self):
+        """The senders with pending messages"""
+        with self._lock:
+            return set(self._by_sender)
+
+    def empty(self, sender=None):
+        """True if there aren't messages (from sender if not None)"""
+        with self._lock:
+            return not (self._messages if sender is None else sender in self._by_sender)
+
+    def put(self, sender, message):
+        """Return False if the message is dropped"""
+        with self._lock:
+            if len(self._messages) >= self._size:
+                self._dropped += 1
+                if self._drop == DROP_NEWEST:
+                    return False
+                self._pop()
+            self._seq += 1
+            self._messages[self._seq] = (sender, message)
+            self._by_sender.setdefault(sender, collections.deque()).append(self._seq)
+            self._notify(sender)
+            self._notify(_ANY)
+        return True
+
+    def get(self, sender=None, block=True, timeout=None):
+        """Return the oldest (sender, message) from sender (or from anyone if None). If block wait at
+        most timeout seconds for it. Return None if there is no message or the mailbox was reset while
+        waiting."""
+        key = _ANY if sender is None else sender
+        with self._lock:
+            generation = self._generation
+            ret = self._pop(sender)
+            if ret is not None or not block:
+                return ret
+            cond = self._waiter(key)
+            cond.waiters += 1
+            try:
+                while True:
+                    notified = cond.wait(timeout)
+                    if generation != self._generation:
+                        return None
+                    ret = self._pop(sender)
+                    if ret is not None:
+                        if self._messages:
+                            """The wakeup could be for another message: pass it"""
+                            self._notify(_ANY)
+                        return ret
+                    if not notified:
+                        return None
+            finally:
+                cond.waiters -= 1
+                if not cond.waiters:
+                    del self._waiters[key]
+
+    def reset(self):
+        with self._lock:
+            self._messages.clear()
+            self._by_sender.clear()
+            self._generation += 1
+            for cond in self._waiters.values():
+                cond.notify_all()
+
+    def _waiter(self, key):
+        cond = self._waiters.get(key)
+        if cond is None:
+            cond = self._waiters[key] = threading.Condition(self._lock)
+            cond.waiters = 0
+        return cond
+
+    def _notify(self, key):
+        cond = self._waiters.get(key)
+        if cond is not None:
+            cond.notify()
+
+    def _pop(self, sender=None):
+        """Must be called in lock context"""
+        if sender is None:
+            if not self._messages:
+                return None
+            seq, (sender, message) = self._messages.popitem(last=False)
+            seqs = self._by_sender[sender]
+            seqs.popleft()
+        else:
+            seqs = self._by_sender.get(sender)
+            if not seqs:
+                return None
+            seq = seqs.popleft()
+            _, message = self._messages.pop(seq)
+        if not seqs:
+            del self._by_sender[sender]
+        return sender, message
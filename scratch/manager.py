@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from scratch.extension import ExtensionDefinition, ExtensionServiceBase, EXTENSION_DEFAULT_ADDRESS
+
+__author__ = 'michele'
+
+DEFAULT_IDLE_TIMEOUT = 600.0
+
+
+class ExtensionManager():
+    """Hand out ExtensionServiceBase instances: a service is created (and started) from the registered
+    ExtensionDefinition at the first request and closed (socket, threads and name) when nobody access
+    it for idle_timeout seconds. Every client (a student) can have its own service for the same
+    definition.
+    """
+
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, address=EXTENSION_DEFAULT_ADDRESS, max_services=None,
+                 reap_interval=None, port_pool=None):
+        """
+        :param idle_timeout: seconds of inactivity before close a service
+        :param address: the address where services will be bound
+        :param port_pool: if not None the PortPool where take the services sockets (address is ignored)
+        :param max_services: if not None the max number of living services
+        :param reap_interval: seconds between two idle checks. If None idle_timeout / 4
+        """
+        self._idle_timeout = idle_timeout
+        self._address = address
+        self._max_services = max_services
+        self._reap_interval = reap_interval if reap_interval is not None else idle_timeout / 4
+        self._port_pool = port_pool
+        self._services = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._reaper = None
+
+    @property
+    def idle_timeout(self):
+        return self._idle_timeout
+
+    @staticmethod
+    def service_name(name, client=None):
+        return name if client is None else "{} [{}]".format(name, client)
+
+    @property
+    def services(self):
+        """Dictionary service name -> living service"""
+        with self._lock:
+            return self._services.copy()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._services)
+
+    def get(self, name, client=None):
+        """Return the running service of the definition name for the client: create it if it doesn't
+        exist. Raise KeyError if there isn't a definition called name and RuntimeError if there are
+        already max_services services."""
+        service_name = self.service_name(name, client)
+        with self._lock:
+            service = self._services.get(service_name)
+            if service is None:
+                definition = ExtensionDefinition.get_registered(name)
+                if self._max_services is not None and len(self._services) >= self._max_services:
+                    self.reap()
+                    if len(self._services) >= self._max_services:
+                        raise RuntimeError("Too many services: {}".format(len(self._services)))
+                service = ExtensionServiceBase(definition, service_name, address=self._address,
+                                               port_pool=self._port_pool)
+                service.start()
+                self._services[service_name] = service
+                self._start_reaper()
+            service.touch()
+            return service
+
+    def release(self, name, client=None):
+        """Close the service now"""
+        with self._lock:
+            service = self._services.pop(self.service_name(name, client), None)
+        if service is not None:
+            service.close()
+
+    def reap(self, now=None):
+        """Close the idle services and return their names: services with open WebSocket or events
+        stream connections are never idle"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [n for n, s in self._services.items()
+                    if now - s.last_access >= self._idle_timeout and not s.connections]
+            services = [self._services.pop(n) for n in idle]
+        for s in services:
+            logging.info("Close idle service {}".format(s.name))
+            s.close()
+        return idle
+
+    def close(self):
+        """Close all services and stop the reaper"""
+        self._stop.set()
+        with self._lock:
+            services, self._services = list(self._services.values()), {}
+            reaper, self._reaper = self._reaper, None
+        for s in services:
+            s.close()
+        if reaper is not None and reaper is not threading.current_thread():
+            reaper.join()
+
+    def _start_reaper(self):
+        if self._reaper is None:
+            self._stop.clear()
+            self._reaper = threading.Thread(name="Extension manager reaper", target=self._run)
+            self._reaper.daemon = True
+            self._reaper.start()
+
+    def _run(self):
+        """Reap idle services until there are some"""
+        while not self._stop.wait(self._reap_interval):
+            try:
+                self.reap()
+            except Exception as e:
+                logging.exception(e)
+            with self._lock:
+                if not self._services:
+                    self._reaper = None
+                    return
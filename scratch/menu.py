@@ -0,0 +1,107 @@
+import collections.abc
+import logging
+import threading
+import weakref
+
+__author__ = 'michele'
+
+_missing = object()
+
+
+class Menu(collections.abc.Mapping):
+    """A menu that can change at runtime: it can be used everywhere a menu (Mapping or Container) is
+    accepted. It is a Mapping label -> value; when built from a Container (or by add(label)) the
+    value is the label itself.
+    Menus are shared and not copied by components. Every change increases version and notifies the
+    listeners: extensions use it to rebuild the description and notify the clients.
+    """
+
+    def __init__(self, elements=()):
+        self._lock = threading.Lock()
+        if isinstance(elements, collections.abc.Mapping):
+            self._items = dict(elements)
+        else:
+            self._items = {e: e for e in elements}
+        self._version = 0
+        self._elements = None
+        self._listeners = []
+
+    # Shared objects: identity, not content, equality
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __deepcopy__(self, memo):
+        """Shared: never copied"""
+        return self
+
+    def __getitem__(self, label):
+        return self._items[label]
+
+    def __iter__(self):
+        return iter(self.elements)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, label):
+        return label in self._items
+
+    def __repr__(self):
+        return "Menu({!r})".format(self._items)
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def elements(self):
+        """Snapshot of current labels as frozenset: rebuilt just after changes"""
+        elements = self._elements
+        if elements is None:
+            with self._lock:
+                elements = self._elements = frozenset(self._items)
+        return elements
+
+    def add(self, label, value=None):
+        """Add or replace label: value is the label if None"""
+        value = label if value is None else value
+        with self._lock:
+            if self._items.get(label, _missing) == value:
+                return
+            self._items[label] = value
+            self._update()
+        self._notify()
+
+    def remove(self, label):
+        """Raise KeyError if label is not in menu"""
+        with self._lock:
+            del self._items[label]
+            self._update()
+        self._notify()
+
+    def discard(self, label):
+        try:
+            self.remove(label)
+        except KeyError:
+            pass
+
+    def _update(self):
+        self._version += 1
+        self._elements = None
+
+    def add_listener(self, callback):
+        """callback(menu) is called after every change. Bound methods are held by weak references"""
+        ref = weakref.WeakMethod(callback) if hasattr(callback, "__self__") else (lambda: callback)
+        with self._lock:
+            self._listeners.append(ref)
+
+    def _notify(self):
+        with self._lock:
+            listeners = [(r, r()) for r in self._listeners]
+            self._listeners = [r for r, cb in listeners if cb is not None]
+        for _, cb in listeners:
+            if cb is not None:
+                try:
+                    cb(self)
+                except Exception as e:
+                    logging.exception(e)
@@ -0,0 +1,103 @@
+import collections
+import logging
+import socket
+import threading
+
+__author__ = 'michele'
+
+DEFAULT_BACKLOG = 10
+
+
+class PortPool():
+    """Pre-bound listening sockets on a port range: acquire() hands out a socket already bound and
+    listening, release() gives it back to the pool still bound. Ports already used by someone else
+    are skipped.
+    """
+
+    def __init__(self, first, last, address="0.0.0.0", backlog=DEFAULT_BACKLOG):
+        """
+        :param first: first port of the range
+        :param last: last port of the range (included)
+        :param address: the address where bind the sockets
+        :param backlog: the listen() backlog
+        """
+        self._address = address
+        self._lock = threading.Lock()
+        self._free = collections.deque()
+        self._used = set()
+        for port in range(first, last + 1):
+            sock = self._bind(address, port, backlog)
+            if sock is not None:
+                self._free.append(sock)
+
+    @staticmethod
+    def _bind(address, port, backlog):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((address, port))
+            sock.listen(backlog)
+        except OSError as e:
+            logging.info("Skip port {}: {}".format(port, e))
+            sock.close()
+            return None
+        return sock
+
+    @property
+    def address(self):
+        return self._address
+
+    @property
+    def ports(self):
+        """The ports of the free sockets"""
+        with self._lock:
+            return [s.getsockname()[1] for s in self._free]
+
+    def __len__(self):
+        """How many free sockets"""
+        with self._lock:
+            return len(self._free)
+
+    @property
+    def used(self):
+        with self._lock:
+            return len(self._used)
+
+    def acquire(self):
+        """Return a listening socket. Raise RuntimeError if the pool is empty"""
+        with self._lock:
+            if not self._free:
+                raise RuntimeError("No free ports")
+            sock = self._free.popleft()
+            self._used.add(sock)
+        self._drain(sock)
+        return sock
+
+    def release(self, sock):
+        """Give back a socket obtained by acquire()"""
+        with self._lock:
+            if sock not in self._used:
+                raise ValueError("Socket not acquired from this pool")
+            self._used.discard(sock)
+            self._free.append(sock)
+
+    def close(self):
+        """Close all free sockets: the acquired ones will be closed when released"""
+        with self._lock:
+            free, self._free = self._free, collections.deque()
+            self._used = set()
+        for sock in free:
+            sock.close()
+
+    @staticmethod
+    def _drain(sock):
+        """Close the connections queued while the socket was in the pool"""
+        sock.setblocking(False)
+        try:
+            while True:
+                conn, _ = sock.accept()
+                conn.close()
+        except OSError:
+            pass
+        finally:
+            sock.setblocking(True)
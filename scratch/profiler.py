@@ -0,0 +1,171 @@
+"""Latency profiler of the components user callbacks (do_command, do_read, do_flag, do_reset)."""
+import bisect
+import contextlib
+import logging
+import sys
+import threading
+import time
+
+__author__ = 'michele'
+
+DEFAULT_THRESHOLD = 0.05
+
+# Upper bounds (seconds) of the histograms buckets: the last bucket takes all slower calls
+BUCKETS = tuple(1e-5 * 2 ** i for i in range(20))
+
+
+class Histogram():
+    """Counts of calls by duration in logarithmic buckets (from 10us to about 5s)"""
+
+    def __init__(self):
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, wall, cpu, slow=False):
+        self.count += 1
+        self.wall += wall
+        self.cpu += cpu
+        if wall > self.max:
+            self.max = wall
+        if slow:
+            self.slow += 1
+        self.buckets[bisect.bisect_left(BUCKETS, wall)] += 1
+
+    def percentile(self, p):
+        """Upper bound of the bucket that contains the p (0-100) percentile"""
+        if not self.count:
+            return 0.0
+        target = self.count * p / 100.0
+        n = 0
+        for i, c in enumerate(self.buckets):
+            n += c
+            if n >= target:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {"count": self.count, "wall": self.wall, "cpu": self.cpu, "max": self.max, "slow": self.slow,
+                "p50": self.percentile(50), "p99": self.percentile(99), "buckets": list(self.buckets)}
+
+
+class _Call():
+    __slots__ = ("component", "callback", "thread", "start", "sensitive", "reported")
+
+    def __init__(self, component, callback, thread, start, sensitive):
+        self.component = component
+        self.callback = callback
+        self.thread = thread
+        self.start = start
+        self.sensitive = sensitive
+        self.reported = False
+
+
+class Profiler():
+    """Record wall and CPU time of every callback in per component histograms. A call that lasts more
+    than threshold seconds is counted as slow; if it holds the component lock or runs on the poll path a
+    watchdog thread logs a warning with the callback stack while it is still running.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self._threshold = threshold
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._active = {}
+        self._local = threading.local()
+        self._watchdog = None
+        self._warnings = 0
+
+    @property
+    def threshold(self):
+        return self._threshold
+
+    @property
+    def warnings(self):
+        """How many slow callbacks are logged"""
+        return self._warnings
+
+    @contextlib.contextmanager
+    def poll_path(self):
+        """The callbacks called in this context are on the poll path"""
+        depth = getattr(self._local, "poll", 0)
+        self._local.poll = depth + 1
+        try:
+            yield
+        finally:
+            self._local.poll = depth
+
+    def call(self, component, callback, cb, *args, **kwargs):
+        """Call cb(*args, **kwargs) and record it as the component callback"""
+        lock = getattr(component, "_lock", None)
+        try:
+            locked = lock._is_owned()
+        except AttributeError:
+            locked = False
+        call = _Call(component.name, callback, threading.get_ident(), time.perf_counter(),
+                     locked or getattr(self._local, "poll", 0) > 0)
+        with self._lock:
+            self._active[id(call)] = call
+            self._start_watchdog()
+        cpu = time.thread_time()
+        try:
+            return cb(*args, **kwargs)
+        finally:
+            cpu = time.thread_time() - cpu
+            wall = time.perf_counter() - call.start
+            with self._lock:
+                del self._active[id(call)]
+                self._histograms.setdefault((call.component, callback), Histogram()).add(
+                    wall, cpu, wall > self._threshold)
+
+    def stats(self):
+        """Dictionary component -> callback -> histogram dictionary"""
+        ret = {}
+        with self._lock:
+            for (component, callback), h in self._histograms.items():
+                ret.setdefault(component, {})[callback] = h.as_dict()
+        return ret
+
+    def slowest(self, count=10):
+        """The (max wall, component, callback) of the count slowest callbacks"""
+        with self._lock:
+            items = [(h.max, c, cb) for (c, cb), h in self._histograms.items()]
+        return sorted(items, reverse=True)[:count]
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def _start_watchdog(self):
+        """Must be called in lock context"""
+        if self._watchdog is None:
+            self._watchdog = threading.Thread(name="Profiler watchdog", target=self._watch)
+            self._watchdog.daemon = True
+            self._watchdog.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self._threshold / 2)
+            now = time.perf_counter()
+            with self._lock:
+                if not self._active:
+                    self._watchdog = None
+                    return
+                slow = [c for c in self._active.values()
+                        if c.sensitive and not c.reported and now - c.start > self._threshold]
+                for c in slow:
+                    c.reported = True
+            if slow:
+                frames = sys._current_frames()
+                for c in slow:
+                    self._warn(c, now, frames.get(c.thread))
+
+    def _warn(self, call, now, frame):
+        self._warnings += 1
+        import traceback
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+        logging.warning("Slow callback {}.{}: running from {:.3f}s\n{}".format(
+            call.component, call.callback, now - call.start, stack))
@@ -8,11 +8,12 @@ import socketserver
 import struct
 import select
 from collections import defaultdict
+from scratch.events import default_log
 # Commonly used flag states
 READ_ONLY = select.POLLIN | select.POLLPRI | select.POLLHUP | select.POLLERR
 READ_WRITE = READ_ONLY | select.POLLOUT
 
-logging.getLogger().setLevel(logging.DEBUG)
+_logger = logging.getLogger(__name__)
 
 
 def _extract(word):
@@ -65,7 +66,6 @@ class Scratch14SensorReceiverHandler(socketserver.StreamRequestHandler):
     s_size = struct.calcsize(">I")
 
     def __init__(self, request, client_address, srv):
-        logging.debug('__init__')
         self.sensors = {}
         super(Scratch14SensorReceiverHandler, self).__init__(request, client_address, srv)
         return
@@ -86,18 +86,15 @@ class Scratch14SensorReceiverHandler(socketserver.StreamRequestHandler):
     def _read_single(self):
         lstr = self._get(self.s_size)
         l = struct.unpack(">I", lstr)
-        logging.debug("Message len = {}".format(l))
         msg = self._get(l[0]).decode()
         cmd, data = split_message(msg)
         #I should filter against cmd....
         if cmd=="sensor-update":
             self._sensor_update(data)
-            logging.debug(self.sensors)
-        if cmd=="broadcast":
-            logging.debug("broadcast "+",".join(tokenizer(data)))
+        default_log().emit("receiver14", logging.DEBUG, cmd=cmd, length=l[0])
 
     def handle(self):
-        logging.debug('CONNESIONE')
+        _logger.debug('CONNESIONE %s', self.client_address)
         p = select.poll()
         p.register(self.request, READ_ONLY)
         try:
@@ -107,7 +104,7 @@ class Scratch14SensorReceiverHandler(socketserver.StreamRequestHandler):
                     if flag & select.POLLIN:
                         self._read_single()
                     if flag & (select.POLLHUP | select.POLLERR):
-                        logging.info("Connessione chiusa")
+                        _logger.info("Connessione chiusa")
                         return
         except Exception as e:
             logging.exception(e)
@@ -0,0 +1,69 @@
+import collections
+import threading
+
+__author__ = 'michele'
+
+DEFAULT_SIZE = 1024
+
+
+class ResultsQueue():
+    """The queue where requesters push their (owner, busy, value, exception) results and the poll path
+    drains them. It is based on collections.deque append(), popleft(), copy() and remove() that are
+    thread safe: consumers never take a lock and producers take one just when the queue is full. It is
+    bounded: when full the producer drops the oldest results and counts them in dropped.
+    """
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self._queue = collections.deque()
+        self._size = size
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def dropped(self):
+        """How many results was dropped because the queue was full"""
+        return self._dropped
+
+    def __len__(self):
+        return len(self._queue)
+
+    def push(self, owner, busy, value, exception=None):
+        self._queue.append((owner, busy, value, exception))
+        if len(self._queue) > self._size:
+            with self._dropped_lock:
+                while len(self._queue) > self._size:
+                    try:
+                        self._queue.popleft()
+                    except IndexError:
+                        break
+                    self._dropped += 1
+
+    def peek(self, owner=None):
+        """The pending results (of owner if not None) without remove them"""
+        return [r for r in self._queue.copy() if owner is None or r[0] is owner]
+
+    def drain(self, owner=None):
+        """Remove and return the pending results. Draining just the owner results is the slow path: it
+        removes them one by one from the queue, the others results stay where they are."""
+        if owner is None:
+            ret = []
+            for _ in range(len(self._queue)):
+                try:
+                    ret.append(self._queue.popleft())
+                except IndexError:
+                    break
+            return ret
+        ret = []
+        for r in self._queue.copy():
+            if r[0] is owner:
+                try:
+                    self._queue.remove(r)
+                except ValueError:
+                    """Dropped (and counted) or drained meanwhile"""
+                    continue
+                ret.append(r)
+        return ret
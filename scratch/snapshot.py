@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+import threading
+
+__author__ = 'michele'
+
+DEFAULT_INTERVAL = 5.0
+
+
+def dumps(extension):
+    """Compact JSON (bytes) of extension.snapshot(): not serializable values are saved as strings"""
+    return json.dumps(extension.snapshot(), separators=(",", ":"), default=str).encode("utf-8")
+
+
+def save(extension, path):
+    """Write the snapshot atomically: write a temporary file and replace path by it"""
+    data = dumps(extension)
+    tmp = "{}.tmp".format(path)
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load(extension, path):
+    """Restore the snapshot saved in path. Return False if there isn't it"""
+    try:
+        with open(path, "rb") as f:
+            snapshot = json.loads(f.read().decode("utf-8"))
+    except FileNotFoundError:
+        return False
+    extension.restore(snapshot)
+    return True
+
+
+class Snapshotter():
+    """Save periodically the extension snapshot in path, just when the extension changed from last
+    save. stop() save the last state."""
+
+    def __init__(self, extension, path, interval=DEFAULT_INTERVAL):
+        self._extension = extension
+        self._path = path
+        self._interval = interval
+        self._saved_version = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def path(self):
+        return self._path
+
+    def save(self):
+        """Save now if the extension changed. Return True if saved"""
+        version = self._extension.version
+        if version == self._saved_version:
+            return False
+        save(self._extension, self._path)
+        self._saved_version = version
+        return True
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(name="Snapshotter {}".format(self._path), target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.save()
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            try:
+                self.save()
+            except Exception as e:
+                logging.exception(e)
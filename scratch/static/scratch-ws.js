@@ -0,0 +1,145 @@
+/*
+ * Client of the ExtensionService WebSocket transport (path /ws): usable by Scratch 3 custom
+ * extensions or any browser page. ExtensionService serves this file at /scratch-ws.js too.
+ *
+ *   const ext = new ScratchExtensionSocket("ws://127.0.0.1:33445/ws");
+ *   await ext.connect();
+ *   ext.value("position");               // last pushed value of sensor "position"
+ *   ext.value("gender", "Jhon");         // reporter with arguments
+ *   ext.busy(12);                        // true while waiter command 12 is running
+ *   ext.result(12);                      // pending result of requester invocation 12
+ *   ext.onhat = function (name) { ... }; // called when hat "name" raises an event
+ *   await ext.call("beep", 3);           // command or reporter invocation
+ *   await ext.call("request", {async: true});  // don't block the other invocations
+ */
+(function (root) {
+    "use strict";
+
+    // Same as python urllib.parse.quote() used by the server: "/" is safe, "!'()*" are not
+    function quote(s) {
+        return encodeURIComponent(s).replace(/%2F/g, "/").replace(/[!'()*]/g, function (c) {
+            return "%" + c.charCodeAt(0).toString(16).toUpperCase();
+        });
+    }
+
+    function key(name, args) {
+        return [name].concat(args).map(function (a) {
+            return quote(String(a));
+        }).join("/");
+    }
+
+    function ScratchExtensionSocket(url) {
+        this.url = url;
+        this.values = {};
+        this.busyIds = new Set();
+        this.results = {};
+        this.hats = {};
+        this.onchange = null;
+        this.onhat = null;
+        this._socket = null;
+        this._nextId = 1;
+        this._pending = {};
+    }
+
+    ScratchExtensionSocket.prototype.connect = function () {
+        var self = this;
+        return new Promise(function (resolve, reject) {
+            var socket = new WebSocket(self.url);
+            socket.onopen = function () {
+                self._socket = socket;
+                resolve(self);
+            };
+            socket.onerror = reject;
+            socket.onmessage = function (event) {
+                self._receive(JSON.parse(event.data));
+            };
+            socket.onclose = function () {
+                self._socket = null;
+                Object.keys(self._pending).forEach(function (id) {
+                    self._pending[id].reject(new Error("Connection closed"));
+                });
+                self._pending = {};
+            };
+        });
+    };
+
+    ScratchExtensionSocket.prototype._receive = function (message) {
+        var self = this;
+        if (message.changes) {
+            message.changes.forEach(function (line) {
+                var sep = line.indexOf(" ");
+                var k = line.substring(0, sep), v = line.substring(sep + 1);
+                if (k === "_busy") {
+                    self.busyIds = new Set(v ? v.split(" ").map(Number) : []);
+                } else if (k === "_hat") {
+                    self._hat(v);
+                    return;
+                } else if (k === "_result") {
+                    sep = v.indexOf(" ");
+                    self.results[v.substring(0, sep)] = decodeURIComponent(v.substring(sep + 1));
+                    return;
+                } else {
+                    self.values[k] = decodeURIComponent(v);
+                }
+                if (self.onchange) {
+                    self.onchange(k, self.values[k]);
+                }
+            });
+            return;
+        }
+        var pending = this._pending[message.id];
+        if (!pending) {
+            return;
+        }
+        delete this._pending[message.id];
+        if ("error" in message) {
+            pending.reject(new Error(message.error));
+        } else {
+            pending.resolve(message.result);
+        }
+    };
+
+    // "name flags" line: the first one is the baseline, every increment of flags is a new event
+    ScratchExtensionSocket.prototype._hat = function (v) {
+        var sep = v.indexOf(" ");
+        var name = decodeURIComponent(v.substring(0, sep)), flags = Number(v.substring(sep + 1));
+        var known = name in this.hats;
+        var fired = known && flags > this.hats[name];
+        this.hats[name] = flags;
+        if (fired && this.onhat) {
+            this.onhat(name);
+        }
+    };
+
+    ScratchExtensionSocket.prototype.result = function (id) {
+        return this.results[id];
+    };
+
+    ScratchExtensionSocket.prototype.value = function (name) {
+        return this.values[key(name, Array.prototype.slice.call(arguments, 1))];
+    };
+
+    ScratchExtensionSocket.prototype.busy = function (id) {
+        return this.busyIds.has(id);
+    };
+
+    ScratchExtensionSocket.prototype.call = function (name) {
+        var args = Array.prototype.slice.call(arguments, 1);
+        var options = {};
+        if (args.length && typeof args[args.length - 1] === "object") {
+            options = args.pop();
+        }
+        var self = this;
+        var id = this._nextId++;
+        return new Promise(function (resolve, reject) {
+            if (!self._socket) {
+                reject(new Error("Not connected"));
+                return;
+            }
+            self._pending[id] = {resolve: resolve, reject: reject};
+            self._socket.send(JSON.stringify({id: id, path: "/" + key(name, args), async: !!options.async}));
+        });
+    };
+
+    root.ScratchExtensionSocket = ScratchExtensionSocket;
+})(typeof self !== "undefined" ? self : this);
@@ -0,0 +1,93 @@
+import threading
+
+__author__ = 'michele'
+
+import unittest
+from scratch.portability.mock import Mock
+from scratch.bus import Bus, default_bus
+from scratch.components import Sensor, Hat
+
+
+class TestBus(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = Bus()
+
+    def test_publish_subscribe(self):
+        cbs = [Mock() for _ in range(3)]
+        for cb in cbs:
+            self.bus.subscribe("t", cb)
+        other = Mock()
+        self.bus.subscribe("o", other)
+        self.assertEqual(3, self.bus.subscribers("t"))
+        self.bus.publish("t", 1)
+        self.assertTrue(self.bus.flush(5))
+        for cb in cbs:
+            cb.assert_called_once_with([1])
+        self.assertFalse(other.called)
+
+    def test_batch(self):
+        """Messages published while the dispatcher is busy are delivered together"""
+        gate = threading.Event()
+        received = []
+
+        def slow(messages):
+            gate.wait(5)
+            received.append(messages)
+
+        self.bus.subscribe("t", slow, batch_size=3)
+        self.bus.publish("t", 0)
+        for i in range(1, 6):
+            self.bus.publish("t", i)
+        gate.set()
+        self.assertTrue(self.bus.flush(5))
+        self.assertEqual(list(range(6)), [m for b in received for m in b])
+        self.assertTrue(all(len(b) <= 3 for b in received))
+        self.assertLess(len(received), 6)
+
+    def test_pull_bounded(self):
+        s = self.bus.subscribe("t", buffer_size=3)
+        for i in range(5):
+            self.bus.publish("t", i)
+        self.bus.flush(5)
+        self.assertEqual(3, len(s))
+        self.assertEqual(2, s.dropped)
+        self.assertEqual([2], s.drain(1))
+        self.assertEqual([3, 4], s.drain())
+        self.assertEqual([], s.drain(timeout=0.01))
+
+    def test_unsubscribe(self):
+        cb = Mock()
+        s = self.bus.subscribe("t", cb)
+        s.cancel()
+        self.assertEqual(0, self.bus.subscribers("t"))
+        self.bus.publish("t", 1)
+        self.bus.flush(5)
+        self.assertFalse(cb.called)
+        s.cancel()
+
+    def test_broken_subscriber(self):
+        good = Mock()
+        self.bus.subscribe("t", Mock(side_effect=Exception("broken")))
+        self.bus.subscribe("t", good)
+        self.bus.publish("t", 1)
+        self.bus.flush(5)
+        good.assert_called_once_with([1])
+
+    def test_connect(self):
+        s = Sensor.create(Mock(), "s")
+        h = Hat.create(Mock(), "h")
+        self.bus.connect("t", s)
+        self.bus.connect("t", h)
+        self.bus.publish("t", 1)
+        self.bus.publish("t", 2)
+        self.bus.flush(5)
+        self.assertEqual(2, s.get())
+        self.assertTrue(h.state)
+
+    def test_default_bus(self):
+        self.assertIs(default_bus(), default_bus())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+__author__ = 'michele'
+
+import unittest
+from scratch.busy import BusyRegistry
+
+
+class TestBusyRegistry(unittest.TestCase):
+
+    def test_add_remove(self):
+        r = BusyRegistry()
+        self.assertEqual(0, r.count)
+        self.assertSetEqual(set(), r.snapshot())
+        r.add(1)
+        r.add(2)
+        r.add(1)
+        self.assertEqual(2, len(r))
+        self.assertIn(1, r)
+        self.assertSetEqual({1, 2}, r.snapshot())
+        r.remove(1)
+        self.assertSetEqual({1, 2}, r.snapshot())
+        r.remove(1)
+        r.remove(1)
+        self.assertNotIn(1, r)
+        self.assertSetEqual({2}, r.snapshot())
+        r.remove(2)
+        self.assertEqual(0, r.count)
+
+    def test_snapshot_is_a_copy(self):
+        r = BusyRegistry()
+        r.add(3)
+        s = r.snapshot()
+        s.add(4)
+        self.assertSetEqual({3}, r.snapshot())
+
+
+if __name__ == '__main__':
+    unittest.main()
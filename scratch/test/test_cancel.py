@@ -0,0 +1,54 @@
+import threading
+
+__author__ = 'michele'
+
+import unittest
+from scratch.portability.mock import Mock
+from scratch.cancel import CancelToken, Cancelled
+
+
+class TestCancelToken(unittest.TestCase):
+
+    def test_cancel(self):
+        t = CancelToken()
+        self.assertFalse(t.cancelled)
+        self.assertFalse(t.wait(0))
+        t.raise_if_cancelled()
+        t.cancel("timeout")
+        self.assertTrue(t.cancelled)
+        self.assertTrue(t.wait(0))
+        self.assertEqual("timeout", t.reason)
+        self.assertRaises(Cancelled, t.raise_if_cancelled)
+        """Just the first reason"""
+        t.cancel("reset")
+        self.assertEqual("timeout", t.reason)
+
+    def test_callbacks(self):
+        t = CancelToken()
+        cb = Mock()
+        t.add_callback(cb)
+        self.assertFalse(cb.called)
+        t.cancel()
+        cb.assert_called_once_with()
+        t.cancel()
+        cb.assert_called_once_with()
+        late = Mock()
+        t.add_callback(late)
+        late.assert_called_once_with()
+
+    def test_broken_callback(self):
+        t = CancelToken()
+        good = Mock()
+        t.add_callback(Mock(side_effect=Exception("broken")))
+        t.add_callback(good)
+        t.cancel()
+        self.assertTrue(good.called)
+
+    def test_wait_wake_up(self):
+        t = CancelToken()
+        threading.Timer(0.01, t.cancel).start()
+        self.assertTrue(t.wait(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
+import asyncio
 import copy
 import threading
+import time
 
 from mock import ANY, call, MagicMock
 
@@ -104,6 +106,8 @@ class TestReporterFactory(unittest.TestCase):
         """Pay attentiontion to mappers"""
         rrf = RF(med, 'test', description="%m.hands", hands={"Left": "left", "Right": "right"})
         self.assertDictEqual({"hands": ["Left", "Right"]}, rrf.menus)
+        """Computed once"""
+        self.assertIs(rrf.menus, rrf.menus)
 
 
 class TestReporter(unittest.TestCase):
@@ -219,6 +223,113 @@ class TestReporter(unittest.TestCase):
 
         self.assertRaises(TypeError, r.set, "GOLD", "sentinel", 32, "MALE")
 
+    def test_poll_key(self):
+        mock_e = Mock()  # Mock the extension
+        rrf = RF(Mock(), 'my test', description="row %m.row col %m.col", row=["a", "b c"], col=["1", "2"])
+        r = R(mock_e, rrf)
+        """Computed on demand"""
+        self.assertDictEqual({}, r._poll_keys)
+        k = r.poll_key(("b c", "2"))
+        self.assertEqual(("my test", "b c", "2"), k)
+        self.assertEqual("my%20test/b%20c/2 ", k.prefix)
+        self.assertIs(k, r.poll_key(("b c", "2")))
+        self.assertSetEqual({("b c", "2")}, set(r._poll_keys))
+        """Not in menu: not cached"""
+        self.assertEqual(("my test", "x", "2"), r.poll_key(("x", "2")))
+        self.assertSetEqual({("b c", "2")}, set(r._poll_keys))
+        """Cleared by reset and menu changes"""
+        r.reset()
+        self.assertDictEqual({}, r._poll_keys)
+        r.poll_key(("a", "1"))
+        r.menu_changed(None)
+        self.assertDictEqual({}, r._poll_keys)
+        """Not menu arguments are never cached"""
+        rrf = RF(Mock(), 'test', description="name %s")
+        r = R(mock_e, rrf)
+        for i in range(100):
+            self.assertEqual("test/john{} ".format(i), r.poll_key(("john{}".format(i),)).prefix)
+        self.assertDictEqual({}, r._poll_keys)
+
+    def test_poll_key_big_menus(self):
+        """Nothing is computed for the menus combinations at construction"""
+        rrf = RF(Mock(), 'test', description="%m.a %m.b %m.c", a=range(100), b=range(100), c=range(100))
+        r = R(Mock(), rrf)
+        self.assertDictEqual({}, r._poll_keys)
+        self.assertEqual(("test", 1, 2, 3), r.poll_key((1, 2, 3)))
+        self.assertIn((1, 2, 3), r._poll_keys)
+
+    def test_set_many(self):
+        mock_e = Mock()  # Mock the extension
+        rrf = RF(Mock(), 'test', description="row %m.row col %m.col", row=["a", "b"], col={"1": 1, "2": 2})
+        r = R(mock_e, rrf, value={None: 0})
+        r.set_many([(("a", "1"), 11), (("a", "2"), 12), (("b", "2"), 22)])
+        self.assertEqual([11, 12, 0, 22], [r.get(*a) for a in [("a", "1"), ("a", "2"), ("b", "1"), ("b", "2")]])
+        """Generators are welcome"""
+        r.set_many((("b", c), 20 + int(c)) for c in "12")
+        self.assertEqual(21, r.get("b", "1"))
+        self.assertRaises(TypeError, r.set_many, [(("a",), 1)])
+        self.assertRaises(TypeError, r.set_many, [(("c", "1"), 1)])
+        self.assertRaises(TypeError, r.set_many, [(("a", "3"), 1)])
+
+        """No arguments"""
+        rrf = RF(Mock(), 'test')
+        r = R(mock_e, rrf, value=1)
+        r.set_many([((), 2), ((), 3)])
+        self.assertEqual(3, r.get())
+
+    def test_set_many_array(self):
+        class Array(list):
+            """Behave like a numpy array"""
+            @property
+            def shape(self):
+                return len(self), len(self[0])
+
+            def tolist(self):
+                return [list(r) for r in self]
+
+        mock_e = Mock()  # Mock the extension
+        rrf = RF(Mock(), 'test', description="row %m.row col %m.col", row=["b", "a"], col=["y", "x"])
+        r = R(mock_e, rrf, value={None: 0})
+        """Rows: a, b ; columns x, y"""
+        r.set_many(Array([[1, 2], [3, 4]]))
+        self.assertDictEqual({("a", "x"): 1, ("a", "y"): 2, ("b", "x"): 3, ("b", "y"): 4}, r.poll())
+        """Mapper menus use sorted keys"""
+        rrf = RF(Mock(), 'test', description="row %m.row col %m.col", row=["a"], col={"y": 2, "x": 1})
+        r = R(mock_e, rrf, value={None: 0})
+        r.set_many(Array([[1, 2]]))
+        self.assertEqual(1, r.get("a", "x"))
+        self.assertEqual(2, r.get("a", "y"))
+        self.assertRaises(ValueError, r.set_many, Array([[1, 2, 3], [4, 5, 6]]))
+
+        rrf = RF(Mock(), 'test', description="row %m.row col %n", row=["b", "a"])
+        r = R(mock_e, rrf, value={None: 0})
+        self.assertRaises(TypeError, r.set_many, Array([[1, 2], [3, 4]]))
+
+    @patch("threading.RLock")
+    def test_set_many_synchronize(self, m_lock):
+        m_lock = m_lock.return_value
+        rrf = RF(Mock(), 'test', description="row %m.row col %m.col", row=["a", "b"], col=["c", "d"])
+        r = R(Mock(), rrf, value={None: 0})
+        r.set_many([(("a", "c"), 1), (("a", "d"), 2), (("b", "c"), 3)])
+        self.assertEqual(1, m_lock.__enter__.call_count)
+        self.assertEqual(1, m_lock.__exit__.call_count)
+
+    def test_changed(self):
+        """Notify extension just when the value change"""
+        mock_e = Mock()  # Mock the extension
+        rrf = RF(Mock(), 'test', description="row %m.row", row=["a", "b"])
+        r = R(mock_e, rrf, value={None: 0})
+        r.set(0, "a")
+        self.assertTrue(mock_e.changed.called)
+        mock_e.changed.reset_mock()
+        r.set(0, "a")
+        self.assertFalse(mock_e.changed.called)
+        r.set_many([(("a",), 1), (("b",), 2)])
+        self.assertEqual(1, mock_e.changed.call_count)
+        mock_e.changed.reset_mock()
+        r.reset()
+        self.assertTrue(mock_e.changed.called)
+
     def test_reset_recover_default_value(self):
         mock_e = Mock()  # Mock extension
         rrf = RF(mock_e, 'test', description="menu 1 %m.menu1 menu 2 %m.menu2", menu1=["a", "b"], menu2=["c", "d"])
@@ -550,6 +661,13 @@ class TestSensorFactory(unittest.TestCase):
         med = Mock()
         self.assertRaises(ValueError, SF, med, "test", description="%n")
 
+    def test_history(self):
+        sf = SF(Mock(), 'test')
+        self.assertEqual(0, sf.history)
+        sf = SF(Mock(), 'test', history=20)
+        self.assertEqual(20, sf.history)
+        self.assertRaises(ValueError, SF, Mock(), 'test', history=-1)
+
     def test_is_a_ReporterFactory_instance(self):
         sf = SF(Mock(), 'test')
         self.assertIsInstance(sf, RF)
@@ -721,6 +839,55 @@ class TestSensor(unittest.TestCase):
         self.assertDictEqual({(): v}, s.poll())
 
 
+    def test_history(self):
+        mock_e = Mock()
+        s = S.create(mock_e, "sensor")
+        self.assertIsNone(s.history)
+        self.assertRaises(ValueError, s.aggregate, "mean")
+        self.assertRaises(ValueError, s.create_aggregate, "mean sensor")
+
+        s = S.create(mock_e, "sensor", default=0, history=3)
+        self.assertEqual(3, s.history.size)
+        for v in [1, 2, "not a number", 3, "4"]:
+            s.set(v)
+        self.assertEqual("4", s.get())
+        self.assertEqual([2.0, 3.0, 4.0], s.history.last())
+        self.assertEqual(3.0, s.aggregate("mean"))
+        self.assertEqual(4.0, s.aggregate("max", count=1))
+        times, values = s.export_history()
+        self.assertEqual([2.0, 3.0, 4.0], list(values))
+        self.assertEqual(3, len(times))
+        s.reset()
+        self.assertEqual(0, len(s.history))
+        self.assertEqual(0, s.get())
+
+    def test_history_do_read(self):
+        """Values read by do_read() are recorded too"""
+        v = 41
+        s = S.create(Mock(), "sensor", history=10, do_read=lambda: v)
+        s.get()
+        v = 43
+        s.poll()
+        self.assertEqual([41.0, 43.0], s.history.last())
+
+    def test_create_aggregate(self):
+        mock_e = Mock()
+        s = S.create(mock_e, "sensor", history=10)
+        self.assertRaises(ValueError, s.create_aggregate, "median sensor", "median")
+        mean = s.create_aggregate("mean sensor", description="Mean")
+        mx = s.create_aggregate("max sensor", "max", count=2)
+        self.assertIsInstance(mean, S)
+        self.assertIs(mock_e, mean.extension)
+        self.assertEqual("Mean", mean.description)
+        """Empty history: default value"""
+        self.assertEqual("", mean.get())
+        for v in [1, 5, 3]:
+            s.set(v)
+        self.assertDictEqual({(): 3.0}, mean.poll())
+        self.assertEqual(5.0, mx.get())
+        self.assertIsNone(mean.history)
+
+
 class TestCommandFactory(unittest.TestCase):
     """We are testing the commands descriptors. They define name and description."""
 
@@ -1265,7 +1432,8 @@ class TestWaiterCommand(unittest.TestCase):
             mock_thread = mock_thread_class.return_value
             w.command(busy, "a")
             self.assertIn(busy, w._busy)
-            mock_thread_class.assert_called_with(name=ANY, target=w.execute_busy_command, args=(busy, "a"))
+            mock_thread_class.assert_called_with(name=ANY, target=w.execute_busy_command, args=(busy, "a"),
+                                                 kwargs={"token": w._tokens[busy]})
             mock_thread.setDaemon.assert_called_with(True)
             self.assertTrue(mock_thread.start.called)
         """Sanity chack without mocks"""
@@ -1328,6 +1496,132 @@ class TestWaiterCommand(unittest.TestCase):
             self.assertTrue(m_lock.__enter__.called)
             self.assertTrue(m_lock.__exit__.called)
 
+    def wait_for(self, predicate):
+        for _ in range(500):
+            if predicate():
+                return True
+            time.sleep(0.005)
+        return predicate()
+
+    def test_cancel_token(self):
+        """do_command() with cancel argument receive the token: reset() cancel it and release busy"""
+        w = W.create(Mock(), "w")
+        started = threading.Event()
+        tokens = []
+
+        def do_command(cancel):
+            tokens.append(cancel)
+            started.set()
+            cancel.wait(5)
+
+        w.do_command = do_command
+        w.command(12)
+        self.assertTrue(started.wait(5))
+        self.assertSetEqual({12}, w.busy)
+        w.reset()
+        self.assertSetEqual(set(), w.busy)
+        self.assertTrue(tokens[0].cancelled)
+        self.assertEqual("reset", tokens[0].reason)
+
+    def test_cancel(self):
+        """Release busy even if do_command() doesn't care about cancellation"""
+        w = W.create(Mock(), "w")
+        stop = threading.Event()
+        w.do_command = lambda a: stop.wait(5)
+        w.command(12, "a")
+        w.command(13, "a")
+        w.cancel(12)
+        self.assertSetEqual({13}, w.busy)
+        w.cancel(12)
+        stop.set()
+        self.assertTrue(self.wait_for(lambda: not w.busy))
+
+    def test_timeout(self):
+        w = W.create(Mock(), "w", timeout=0.05)
+        self.assertEqual(0.05, w.timeout)
+        self.assertIsNone(W.create(Mock(), "w").timeout)
+        tokens = []
+
+        def do_command(cancel=None):
+            tokens.append(cancel)
+            cancel.wait(5)
+
+        w.do_command = do_command
+        w.command(12)
+        self.assertTrue(self.wait_for(lambda: not w.busy))
+        self.assertEqual("timeout", tokens[0].reason)
+
+    def test_timeout_timer_released(self):
+        """A finished execution stops its timer: it cannot cancel a later execution with the same busy"""
+        w = W.create(Mock(), "w", timeout=0.1)
+        tokens = []
+        w.do_command = lambda cancel=None: tokens.append(cancel)
+        for busy in range(20):
+            w.command(busy)
+        self.assertTrue(self.wait_for(lambda: not w.busy and len(tokens) == 20))
+        self.assertTrue(self.wait_for(lambda: not w._timers))
+        self.assertTrue(self.wait_for(
+            lambda: not [t for t in threading.enumerate() if isinstance(t, threading.Timer) and t.is_alive()]))
+
+        w = W.create(Mock(), "w", timeout=0.4)
+        w.do_command = lambda cancel=None: tokens.append(cancel)
+        w.command(7)
+        self.assertTrue(self.wait_for(lambda: not w.busy))
+        time.sleep(0.2)
+        stop = threading.Event()
+        w.do_command = lambda cancel=None: tokens.append(cancel) or stop.wait(5)
+        w.command(7)
+        time.sleep(0.3)
+        self.assertSetEqual({7}, w.busy)
+        self.assertFalse(tokens[-1].cancelled)
+        stop.set()
+        self.assertTrue(self.wait_for(lambda: not w.busy))
+
+    def test_reset_before_execution_start(self):
+        """A reset before the execution thread runs cancels the token that the execution will use"""
+        w = W.create(Mock(), "w")
+        tokens = []
+        w.do_command = lambda cancel=None: tokens.append(cancel)
+        with patch("threading.Thread", autospec=True) as mock_thread_class:
+            w.command(12)
+        kwargs = mock_thread_class.call_args[1]
+        w.reset()
+        kwargs["target"](*kwargs["args"], **kwargs["kwargs"])
+        self.assertTrue(tokens[0].cancelled)
+        self.assertEqual("reset", tokens[0].reason)
+
+    def test_coroutine_cancel(self):
+        w = W.create(Mock(), "w")
+        started = threading.Event()
+        cancelled = threading.Event()
+
+        async def do_command(a):
+            started.set()
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        w.do_command = do_command
+        w.command(12, "a")
+        self.assertTrue(started.wait(5))
+        w.cancel(12)
+        self.assertTrue(cancelled.wait(5))
+        self.assertSetEqual(set(), w.busy)
+
+    def test_coroutine(self):
+        w = W.create(Mock(), "w")
+        done = Mock()
+
+        async def do_command(a):
+            await asyncio.sleep(0)
+            done(a)
+
+        w.do_command = do_command
+        w.execute_busy_command(12, "a")
+        done.assert_called_with("a")
+
     def test_get_cgi(self):
         mock_e = Mock()  # Mock the extension
         mock_wf = MagicMock()  # Mock the waiter command info
@@ -1896,6 +2190,13 @@ class TestRequester(unittest.TestCase):
         if ex:
             raise ex[0]
 
+    def test_set_many_pending_async_results(self):
+        r = self.get_requester(description="who %s")
+        r.get_async(1, "a")
+        r.get_async(2, "b")
+        r.set_many([(("a",), "A"), (("b",), "B")])
+        self.assertSetEqual({(1, "A", None), (2, "B", None)}, set(r.results))
+
     def test_reset_unlock_waiter_request(self):
         """Execute busy_get().
         Main cycle use reset() to wake up thread.
@@ -2022,6 +2323,15 @@ class TestBooleanBlock(unittest.TestCase):
         self.assertEqual("false", b.get(2, 4))
 
 
+    def test_set_many(self):
+        mock_e = Mock()  # Mock the extension
+        bf = BF(Mock(), 'test', description="is %m.who here", who=["a", "b"])
+        b = B(mock_e, bf, value={None: False})
+        b.set_many([(("a",), 1), (("b",), "")])
+        self.assertEqual("true", b.get("a"))
+        self.assertEqual("false", b.get("b"))
+        self.assertDictEqual({("a",): True, ("b",): False}, b.poll())
+
     def test_clear_default_True(self):
         b = self.get_block(default=True, description="%m.ages", ages=[12, 13, 14])
         self.assertEqual("true", b.get(12))
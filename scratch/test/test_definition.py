@@ -0,0 +1,93 @@
+import json
+import math
+import os
+import tempfile
+import time
+
+__author__ = 'michele'
+
+import unittest
+from scratch.extension import ExtensionDefinition as ED, ExtensionBase as EB
+from scratch.components import SensorFactory, ReporterFactory, CommandFactory, description_elements
+from scratch import definition
+
+DEFINITION = {
+    "name": "robot",
+    "description": "My robot",
+    "menus": {"motor": ["left", "right"]},
+    "blocks": [
+        {"type": "sensor", "name": "clock", "value": 0, "callback": "time.time"},
+        {"type": "command", "name": "speed", "description": "speed %m.motor %n"},
+        {"type": "reporter", "name": "position", "description": "position %m.axis %m.motor",
+         "menus": {"axis": ["x", "y"]}, "value": 1},
+        {"type": "hat", "name": "bump"},
+        {"type": "waiter_command", "name": "go", "timeout": 2.0},
+        {"type": "requester", "name": "ask", "value": "?"},
+    ]
+}
+
+
+class TestDefinition(unittest.TestCase):
+
+    def setUp(self):
+        ED._unregister_all()
+
+    def test_from_dict(self):
+        ed = definition.from_dict(DEFINITION)
+        self.assertIs(ed, ED.get_registered("robot"))
+        self.assertEqual("My robot", ed.description)
+        self.assertIsInstance(ed.get_component("clock"), SensorFactory)
+        self.assertIsInstance(ed.get_component("speed"), CommandFactory)
+        position = ed.get_component("position")
+        self.assertIsInstance(position, ReporterFactory)
+        self.assertEqual({"axis": ["x", "y"], "motor": ["left", "right"]}, position.menus)
+        self.assertEqual(2.0, ed.get_component("go").timeout)
+
+        e = EB(ed)
+        self.assertAlmostEqual(time.time(), e.get_component("clock").get(), delta=5.0)
+        self.assertEqual(1, e.get_component("position").get("x", "left"))
+        self.assertRaises(TypeError, e.get_component("position").get, "z", "left")
+
+    def test_errors(self):
+        self.assertRaises(ValueError, definition.from_dict, {"name": "a", "blocks": [{"type": "none", "name": "x"}]})
+        self.assertNotIn("a", ED.registered())
+        self.assertRaises(ValueError, definition.from_dict, {"name": "a", "blocks": [{"type": "hat"}]})
+        self.assertRaises(TypeError, definition.from_dict,
+                          {"name": "a", "blocks": [{"type": "reporter", "name": "r", "description": "r %m.none"}]})
+        self.assertRaises(ValueError, definition.from_dict,
+                          {"name": "a", "menus": {"m": [1]},
+                           "blocks": [{"type": "sensor", "name": "s", "description": "s %m.m"}]})
+        self.assertRaises(AttributeError, definition.from_dict,
+                          {"name": "a", "blocks": [{"type": "hat", "name": "h", "callback": "math.none"}]})
+        self.assertEqual(set(), ED.registered())
+
+    def test_resolve(self):
+        self.assertIs(math.floor, definition.resolve("math.floor"))
+        self.assertIs(os.path.join, definition.resolve("os:path.join"))
+        self.assertRaises(TypeError, definition.resolve, "math.pi")
+        self.assertRaises(ValueError, definition.resolve, "floor")
+
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "robot.json")
+            with open(path, "w") as f:
+                json.dump(DEFINITION, f)
+            ed, = definition.load_all([path])
+            self.assertEqual("robot", ed.name)
+        self.assertRaises(ValueError, definition.loads, "{}", "xml")
+
+    def test_description_elements_cache(self):
+        self.assertEqual(("m.a", "n"), description_elements("r %m.a %n"))
+        self.assertIs(description_elements("r %m.a %n"), description_elements("r %m.a %n"))
+
+    def test_many_definitions(self):
+        start = time.perf_counter()
+        for i in range(200):
+            data = dict(DEFINITION, name="robot{}".format(i))
+            definition.from_dict(data)
+        self.assertEqual(200, len(ED.registered()))
+        self.assertLess(time.perf_counter() - start, 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import logging
+
+__author__ = 'michele'
+
+import unittest
+from scratch.portability.mock import Mock
+from scratch.extension import ExtensionDefinition as ED, ExtensionBase as EB
+from scratch.events import EventLog, default_log
+
+
+class TestEventLog(unittest.TestCase):
+
+    def test_emit(self):
+        log = EventLog(size=3)
+        self.assertEqual(3, log.size)
+        log.emit("a", x=1)
+        log.emit("b", logging.WARNING, y=[1, 2])
+        records = log.records()
+        self.assertEqual(["a", "b"], [r["kind"] for r in records])
+        self.assertEqual({"x": 1}, records[0]["fields"])
+        self.assertEqual({"y": "[1, 2]"}, records[1]["fields"])
+        self.assertEqual("WARNING", records[1]["level"])
+        self.assertEqual([records[1]], log.records(since=records[0]["seq"]))
+        self.assertEqual([records[1]], log.records(kind="b"))
+        self.assertEqual([records[1]], log.records(limit=1))
+
+        """Ring"""
+        for i in range(5):
+            log.emit("c", i=i)
+        self.assertEqual([2, 3, 4], [r["fields"]["i"] for r in log.records()])
+        log.clear()
+        self.assertEqual([], log.records())
+
+    def test_level(self):
+        log = EventLog(level=logging.WARNING)
+        self.assertFalse(log.enabled(logging.INFO))
+        log.emit("a")
+        self.assertEqual([], log.records())
+        log.level = logging.DEBUG
+        log.emit("a", logging.DEBUG)
+        self.assertEqual(1, len(log.records()))
+
+    def test_sample(self):
+        log = EventLog()
+        log.sample("a", 10)
+        for _ in range(100):
+            log.emit("a")
+            log.emit("b")
+        self.assertEqual(10, len(log.records(kind="a")))
+        self.assertEqual(100, len(log.records(kind="b")))
+        self.assertEqual(90, log.sampled_out)
+        log.sample("a", 1)
+        log.emit("a")
+        self.assertEqual(11, len(log.records(kind="a")))
+        self.assertRaises(ValueError, log.sample, "a", 0)
+
+    def test_logger_lazy(self):
+        logger = Mock()
+        logger.isEnabledFor.return_value = False
+        log = EventLog(logger=logger)
+        log.emit("a", x=1)
+        self.assertFalse(logger.log.called)
+        logger.isEnabledFor.return_value = True
+        log.emit("a", x=1)
+        level, fmt, lazy = logger.log.call_args[0]
+        self.assertEqual(logging.INFO, level)
+        self.assertEqual("a INFO x=1", fmt % lazy)
+
+    def test_default(self):
+        self.assertIs(default_log(), default_log())
+        self.assertIsInstance(default_log(), EventLog)
+
+
+class TestComponentsEvents(unittest.TestCase):
+
+    def setUp(self):
+        ED._unregister_all()
+        self.ed = ED("def")
+        self.ed.add_command("c", description="c %n")
+        self.ed.add_requester("q")
+
+    def test_events(self):
+        e = EB(self.ed)
+        self.assertIsInstance(e.event_log, EventLog)
+        self.assertIsNot(default_log(), e.event_log)
+        """Every extension has its own log"""
+        self.assertIsNot(EB(self.ed).event_log, e.event_log)
+        e.event_log = EventLog()
+        e.get_component("c").command(3)
+        r, = e.event_log.records()
+        self.assertEqual("command", r["kind"])
+        self.assertEqual({"component": "c", "args": "(3,)"}, r["fields"])
+
+        e.get_component("q").get_async(11)
+        self.assertEqual({"component": "q", "busy": 11, "args": "()"}, e.event_log.records(kind="requester")[0]["fields"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,10 @@
 import http
+import json
+import shutil
+import socket
+import subprocess
 import socketserver
+import threading
 import time
 import scratch
 
@@ -7,6 +12,11 @@ __author__ = 'michele'
 import unittest
 from scratch.portability.mock import patch, Mock, PropertyMock, MagicMock
 from scratch.extension import ExtensionDefinition as ED, render_args
+from scratch.cgi import PollKey, DETACHED
+from scratch.ports import PortPool
+from scratch.menu import Menu
+from scratch.bus import Bus, default_bus
+from scratch.events import EventLog
 from scratch.extension import Extension as E
 from scratch.extension import ExtensionService as ES, EXTENSION_DEFAULT_PORT, EXTENSION_DEFAULT_ADDRESS
 from scratch.extension import ExtensionBase as EB
@@ -366,6 +376,9 @@ class TestExtension(unittest.TestCase):
         self.assertDictEqual({("s0",): "S", ("s1",): 1, ("r0",): 1, ("r1", "Jhon"): "male", ("r1", "Lucy"): "female",
                               ("r1", "Lisa"): "female"}, e.poll())
 
+        """Keys carry the rendered prefix"""
+        self.assertSetEqual({"s0 ", "s1 ", "r0 ", "r1/Jhon ", "r1/Lucy ", "r1/Lisa "}, {k.prefix for k in e.poll()})
+
         """SAnity chack"""
         """hat, command and waitercommand ... no contribution """
         h = ed.add_hat("x0")
@@ -377,6 +390,46 @@ class TestExtension(unittest.TestCase):
         self.assertDictEqual({("s0",): "S", ("s1",): 1, ("r0",): 1, ("r1", "Jhon"): "male", ("r1", "Lucy"): "female",
                               ("r1", "Lisa"): "female"}, e.poll())
 
+    def test_changed(self):
+        e = E()
+        self.assertEqual(0, e.version)
+        e.changed()
+        self.assertEqual(1, e.version)
+        self.assertEqual(1, e.wait_change(0))
+        self.assertEqual(1, e.wait_change(1, 0.01))
+        threading.Timer(0.02, e.changed).start()
+        self.assertEqual(2, e.wait_change(1, 10))
+
+    def test_components_notify_changes(self):
+        ed = ED("def")
+        ed.add_sensor("s", value="S")
+        ed.add_hat("h")
+        ed.add_requester("R")
+        e = EB(ed)
+        s, h, r = e.get_component("s"), e.get_component("h"), e.get_component("R")
+        v = e.version
+        s.set("S")
+        self.assertEqual(v, e.version, "Same value: no change")
+        s.set("T")
+        self.assertLess(v, e.version)
+        v = e.version
+        h.flag()
+        self.assertLess(v, e.version)
+        v = e.version
+        r.get_async(12)
+        r.set("A")
+        self.assertLess(v, e.version)
+
+    def test_bus(self):
+        e = E()
+        self.assertIs(default_bus(), e.bus)
+        bus = Bus()
+        e.bus = bus
+        s = bus.subscribe("t")
+        e.publish("t", "m")
+        bus.flush(5)
+        self.assertEqual(["m"], s.drain())
+
     def test_busy(self):
         """Return the busy set of all components"""
         ed = ED("def")
@@ -389,10 +442,22 @@ class TestExtension(unittest.TestCase):
         e = EB(ed)
         # empty
         self.assertSetEqual(set(), e.busy)
-        """Mock Block.busy .> just waiter command call it"""
-        with patch("scratch.components.WaiterCommand.busy", new_callable=PropertyMock) as mock_busy:
-            mock_busy.side_effect = [{123, 456}, {1, 2, 3, 4, 456}]
-            self.assertSetEqual({123, 456, 1, 2, 3, 4}, e.busy)
+        w, ww = e.get_component("w"), e.get_component("ww")
+        for b in [123, 456]:
+            w._busy_add(b)
+        for b in [1, 2, 3, 4, 456]:
+            ww._busy_add(b)
+        self.assertSetEqual({123, 456, 1, 2, 3, 4}, e.busy)
+        self.assertEqual(6, e.busy_registry.count)
+        """Still busy in ww"""
+        w._busy_remove(456)
+        self.assertSetEqual({123, 456, 1, 2, 3, 4}, e.busy)
+        w._busy_remove(456)
+        ww._busy_clean()
+        self.assertSetEqual({123}, e.busy)
+        w._busy_remove(123)
+        self.assertEqual(0, e.busy_registry.count)
+        self.assertSetEqual(set(), e.busy)
 
     def test_results(self):
         """Returns a tuple of results list a problems"""
@@ -438,6 +503,22 @@ class TestExtension(unittest.TestCase):
         self.assertDictEqual({("s0",): "S", ("s1",): 1}, e.poll())
         e.results
 
+    def test_results_queue(self):
+        """Requesters push results in the extension queue"""
+        ed = ED("def")
+        ed.add_requester("R0", value=12)
+        ed.add_requester("R1", value=12)
+        e = EB(ed)
+        r0, r1 = e.get_component("R0"), e.get_component("R1")
+        self.assertIs(e.results_queue, r0.results_queue)
+        self.assertIs(e.results_queue, r1.results_queue)
+        r0._new_result(1, "a")
+        r1._new_result(2, "b")
+        self.assertEqual([(1, "a", None)], r0.results)
+        r1.reset()
+        self.assertEqual([(1, "a")], e.results)
+        self.assertEqual([], e.results)
+
 
 @patch("scratch.extension.Extension.components", new_callable=PropertyMock)
 @patch("scratch.extension.Extension.do_reset", autospec=True)
@@ -453,6 +534,24 @@ def test_reset(self, mock_do_reset, mock_components):
     mock_do_reset.assert_called_with(e)
 
 
+def ws_connect(port):
+    """Open a WebSocket on /ws: return the socket and its read file"""
+    c = socket.create_connection(("127.0.0.1", port))
+    c.settimeout(5)
+    c.sendall(b"GET /ws HTTP/1.1\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+              b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\nSec-WebSocket-Version: 13\r\n\r\n")
+    f = c.makefile("rb")
+    while f.readline() != b"\r\n":
+        pass
+    return c, f
+
+
+def ws_changes(f):
+    """Read the next server frame (just short unmasked ones) and return its changes lines"""
+    header = f.read(2)
+    return json.loads(f.read(header[1] & 0x7F).decode("utf-8")).get("changes", [])
+
+
 class TestExtensionService(unittest.TestCase):
     """Test the extension service object.
     """
@@ -523,7 +622,127 @@ class TestExtensionService(unittest.TestCase):
         res["menus"] = menus
         m_extension_block_specs.return_value = block_specs
         m_extension_menus.return_value = menus
+        """Cached until description change"""
+        self.assertEqual([], es.description["blockSpecs"])
+        es.extension.description_changed()
         self.assertDictEqual(res, es.description)
+        m_extension_block_specs.return_value = []
+        es.invalidate_description()
+        self.assertEqual([], es.description["blockSpecs"])
+
+    def test_batch(self):
+        ed = ED("def")
+        ed.add_sensor("s", value="S")
+        ed.add_command("c")
+        ed.add_reporter("r", description="r %n")
+        es = EBS(ed, "MyName")
+        c = es.extension.get_component("c")
+        c.do_command = Mock()
+        self.assertEqual([{"result": "S"}, {"result": ""}, {"error": "Not found /x"}, {"result": "s S\n"}],
+                         es.batch(["/s", "/c", "/x", "/poll"]))
+        c.do_command.assert_called_once_with()
+        self.assertEqual([{"result": "S"}] * 20, es.batch(["/s"] * 20, parallel=True))
+        self.assertEqual([], es.batch([]))
+        self.assertRaises(ValueError, es.batch, ["/s"] * (scratch.extension.BATCH_MAX_SIZE + 1))
+
+    def test_batch_cgi(self):
+        ed = ED("def")
+        ed.add_sensor("s", value="S")
+        es = EBS(ed, "MyName")
+        self.assertEqual([{"result": "S"}, {"result": "S"}], json.loads(es.invoke("/batch?path=/s&path=/s")))
+        handler = Mock(path="/batch", body=b'["/s", "/y"]')
+        self.assertEqual([{"result": "S"}, {"error": "Not found /y"}], json.loads(es._batch_cgi(handler)))
+        handler.body = b'{"paths": ["/s"], "parallel": true}'
+        self.assertEqual([{"result": "S"}], json.loads(es._batch_cgi(handler)))
+        handler.body = b'{"paths": "/s"}'
+        self.assertRaises(ValueError, es._batch_cgi, handler)
+        handler.body = b'no json'
+        self.assertRaises(ValueError, es._batch_cgi, handler)
+
+    def test_batch_post(self):
+        ed = ED("def")
+        ed.add_sensor("s", value="S")
+        es = EBS(ed, "MyName", address="127.0.0.1")
+        es.start()
+        try:
+            body = b'["/s", "/s"]'
+            s = socket.create_connection(("127.0.0.1", es.port))
+            s.sendall(b"POST /batch HTTP/1.0\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+            response = s.makefile("rb").read()
+            s.close()
+            self.assertTrue(response.startswith(b"HTTP/1.0 200"))
+            self.assertIn(b"application/json", response)
+            self.assertEqual([{"result": "S"}] * 2, json.loads(response.partition(b"\r\n\r\n")[2].decode()))
+        finally:
+            es.close()
+
+    def test_dynamic_menu(self):
+        users = Menu(["pippo"])
+        ed = ED("def")
+        ed.add_reporter("r", description="r %m.users", users=users)
+        ed.add_command("c", description="c %m.users", users=users)
+        es = EBS(ed, "MyName")
+        e = es.extension
+        r = e.get_component("r")
+        self.assertEqual({"users": ["pippo"]}, es.description["menus"])
+        self.assertDictEqual({("r", "pippo"): ""}, e.poll())
+        self.assertRaises(TypeError, r.set, "v", "pluto")
+        version = e.version
+        users.add("pluto")
+        self.assertLess(version, e.version)
+        self.assertEqual({"users": ["pippo", "pluto"]}, es.description["menus"])
+        self.assertIn(b"pluto", es.description_json())
+        r.set("v", "pluto")
+        self.assertDictEqual({("r", "pippo"): "", ("r", "pluto"): "v"}, e.poll())
+        self.assertIn(("pluto",), r._poll_keys)
+        users.remove("pippo")
+        self.assertEqual({"users": ["pluto"]}, es.description["menus"])
+        self.assertDictEqual({("r", "pluto"): "v"}, e.poll())
+
+    def test_log_cgi(self):
+        ed = ED("def")
+        ed.add_command("c", description="c %n")
+        es = EBS(ed, "MyName")
+        es.extension.event_log = EventLog()
+        es.invoke("/c/1")
+        es.invoke("/c/2")
+        records = json.loads(es.invoke("/log"))
+        self.assertEqual(["command", "command"], [r["kind"] for r in records])
+        self.assertEqual("('2',)", records[1]["fields"]["args"])
+        self.assertEqual(records[1:], json.loads(es.invoke("/log?since={}".format(records[0]["seq"]))))
+        self.assertEqual(records[1:], json.loads(es.invoke("/log?limit=1")))
+        self.assertEqual([], json.loads(es.invoke("/log?kind=none")))
+        self.assertEqual(records, json.loads(es.invoke("/log?since=x")))
+
+    def test_log_cgi_isolated(self):
+        """A service log doesn't show the events of other extensions"""
+        ed = ED("def")
+        ed.add_command("c", description="c %n")
+        es, other = EBS(ed, "MyName"), EBS(ed, "Other")
+        other.invoke("/c/secret")
+        self.assertEqual([], json.loads(es.invoke("/log")))
+        es.invoke("/c/1")
+        self.assertEqual(["('1',)"], [r["fields"]["args"] for r in json.loads(es.invoke("/log"))])
+
+    def test_description_json(self):
+        ed = ED("def")
+        ed.add_sensor("s", value="S")
+        ed.add_reporter("r", description="r %m.a", a={"y": 1, "x": 2})
+        es = EBS(ed, "MyName")
+        d = json.loads(es.description_json().decode("utf-8"))
+        self.assertEqual(es.description, d)
+        self.assertEqual({"a": ["x", "y"]}, d["menus"])
+        self.assertIs(es.description_json(), es.description_json())
+        d = json.loads(es.description_json("1.2.3.4").decode("utf-8"))
+        self.assertEqual("1.2.3.4", d["host"])
+        self.assertNotIn("host", es.description)
+        self.assertEqual(json.loads(es.invoke("/description.json?host=h")), dict(es.description, host="h"))
+        handler = Mock(path="/description.json", headers={"Host": "10.0.0.1:8080"})
+        self.assertEqual("10.0.0.1", json.loads(es._description_cgi(handler).decode("utf-8"))["host"])
+        handler.headers = {"Host": "[::1]:8080"}
+        self.assertEqual("::1", json.loads(es._description_cgi(handler).decode("utf-8"))["host"])
+        handler.headers = {"Host": "myhost"}
+        self.assertEqual("myhost", json.loads(es._description_cgi(handler).decode("utf-8"))["host"])
 
     def test_addr_port_proxy(self):
         es = ES(E(), "MyName")
@@ -538,6 +757,14 @@ class TestExtensionService(unittest.TestCase):
         self.assertEqual("a/b%20c/2/true/false",
                          render_args("a", "b c", 2, True, False))
 
+    def test_poll_key(self):
+        """Tuple with rendered prefix"""
+        k = PollKey(("a", "b c", True))
+        self.assertEqual(("a", "b c", True), k)
+        self.assertEqual(hash(("a", "b c", True)), hash(k))
+        self.assertEqual("a/b%20c/true ", k.prefix)
+        self.assertEqual("a/b%20c/true my%20phrase\n", ES.poll_dict_render({k: "my phrase"}))
+
     def test_poll_dict_render(self):
         """Simple: just one"""
         self.assertEqual("a 1\n", ES.poll_dict_render({("a",): 1}))
@@ -549,6 +776,173 @@ class TestExtensionService(unittest.TestCase):
         self.assertSetEqual({"a 1", "a/a%20b cc", "c/true dd"}, set(ES.poll_dict_render(
             {("a",): 1, ("a", "a b"): "cc", ("c", True): "dd"})[:-1].split("\n")))
 
+    def test_long_poll(self):
+        es = ES(E(), "MyName")
+        handler = Mock(path="/poll?wait=100")
+        with patch("scratch.extension.PollParker") as mock_parker:
+            self.assertIs(DETACHED, es._poll_cgi(handler))
+            mock_parker.return_value.park.assert_called_with(handler.request, 0, 0.1)
+            """Parker is created once"""
+            es._poll_cgi(handler)
+            self.assertEqual(1, mock_parker.call_count)
+            """Old version: answer immediately"""
+            es.extension.changed()
+            self.assertEqual("_version 1\n", es._poll_cgi(Mock(path="/poll?wait=100&since=0")))
+            mock_parker.return_value.park.reset_mock()
+            es._poll_cgi(Mock(path="/poll?wait=100&since=1"))
+            self.assertTrue(mock_parker.return_value.park.called)
+        """No wait: standard poll"""
+        self.assertEqual("", es._poll_cgi(Mock(path="/poll")))
+        self.assertEqual("", es._poll_cgi(Mock(path="/poll?wait=none")))
+        self.assertIsNotNone(es._get_cgi("/poll?wait=100"))
+
+    def test_invoke(self):
+        ed = ED("def")
+        ed.add_sensor("s", value="S")
+        ed.add_command("c")
+        es = EBS(ed, "MyName")
+        self.assertEqual("S", es.invoke("/s"))
+        self.assertEqual("", es.invoke("/c"))
+        self.assertEqual("s S\n", es.invoke("/poll"))
+        self.assertRaises(LookupError, es.invoke, "/nothing")
+        self.assertRaises(ValueError, es.invoke, "/poll?wait=1000")
+
+    def test_feed_snapshot(self):
+        ed = ED("def")
+        ed.add_sensor("my s", value="S S")
+        ed.add_waiter_command("w")
+        es = EBS(ed, "MyName")
+        self.assertDictEqual({("my s",): "my%20s S%20S", "_busy": "_busy "}, es._feed_snapshot())
+        es.extension.get_component("w")._busy_add(3)
+        es.extension.get_component("w")._busy_add(1)
+        self.assertEqual("_busy 1 3", es._feed_snapshot()["_busy"])
+        self.assertIs(es.feed, es.feed)
+
+    @unittest.skipUnless(shutil.which("node"), "node is not installed")
+    def test_websocket_js_keys(self):
+        """The JavaScript client must build the keys of the poll lines as the server"""
+        elements = ["a b", "it's", "(x)!*", "a/b", "~-_.", "è%"]
+        ed = ED("def")
+        ed.add_reporter("my r", description="r %m.m", m=elements)
+        es = EBS(ed, "MyName")
+        r = es.extension.get_component("my r")
+        for e in elements:
+            r.set(e, e)
+        script = es._websocket_js(None).decode("utf-8") + """
+            var ext = new ScratchExtensionSocket("ws://localhost/ws");
+            ext._receive({changes: %s});
+            console.log(JSON.stringify(%s.map(function (e) { return ext.value("my r", e); })));
+        """ % (json.dumps(list(es._feed_snapshot().values())), json.dumps(elements))
+        out = subprocess.run(["node"], input=script, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(elements, json.loads(out))
+
+    def test_websocket_dispatch(self):
+        ed = ED("def")
+        ed.add_sensor("s", value="S")
+        es = EBS(ed, "MyName")
+        ws = Mock()
+        es._websocket_dispatch(ws, '{"id": 3, "path": "/s"}')
+        ws.send.assert_called_with('{"id": 3, "result": "S"}')
+        es._websocket_dispatch(ws, '{"id": 4, "path": "/x"}')
+        ws.send.assert_called_with('{"id": 4, "error": "Not found /x"}')
+        es._websocket_dispatch(ws, 'no json')
+        ws.send.assert_called_with('{"error": "Invalid message"}')
+        es._websocket_dispatch(ws, '{"id": 5, "path": "/s", "async": true}')
+        for _ in range(100):
+            if ws.send.call_args[0][0] == '{"id": 5, "result": "S"}':
+                break
+            time.sleep(0.01)
+        ws.send.assert_called_with('{"id": 5, "result": "S"}')
+
+    def test_websocket_cgi_need_upgrade(self):
+        es = ES(E(), "MyName")
+        self.assertRaises(ValueError, es._websocket_cgi, Mock(headers={}))
+        self.assertIn("WebSocket", ES._websocket_cgi.__doc__)
+
+    def test_websocket_push_hats_and_results(self):
+        ed = ED("def")
+        ed.add_hat("h")
+        ed.add_requester("q", description="q %n")
+        es = EBS(ed, "MyName", address="127.0.0.1")
+        try:
+            es.start()
+            c, f = ws_connect(es.port)
+            try:
+                self.assertIn("_hat h 0", ws_changes(f))
+                es.extension.get_component("h").flag()
+                self.assertEqual(["_hat h 1"], ws_changes(f))
+                q = es.extension.get_component("q")
+                q.get_async(7, 3)
+                q.set("a b", 3)
+                lines = ws_changes(f)
+                while not [l for l in lines if l.startswith("_result")]:
+                    lines = ws_changes(f)
+                self.assertIn("_result 7 a%20b", lines)
+                """Results are still there for the poll path"""
+                self.assertIn("_result 7 a b", es.invoke("/poll"))
+            finally:
+                c.close()
+        finally:
+            es.close()
+
+    @unittest.skipUnless(shutil.which("node"), "node is not installed")
+    def test_websocket_js_hats_and_results(self):
+        script = ES._websocket_js(None, None).decode("utf-8") + """
+            var ext = new ScratchExtensionSocket("ws://localhost/ws"), fired = [];
+            ext.onhat = function (name) { fired.push(name); };
+            ext._receive({changes: ["_hat my%20h 2", "_busy "]});
+            ext._receive({changes: ["_hat my%20h 3", "_result 7 a%20b"]});
+            console.log(JSON.stringify([fired, ext.result(7)]));
+        """
+        out = subprocess.run(["node"], input=script, capture_output=True, text=True, check=True).stdout
+        self.assertEqual([["my h"], "a b"], json.loads(out))
+
+    def test_websocket_slow_client(self):
+        ed = ED("def")
+        ed.add_sensor("s", value=0)
+        es = EBS(ed, "MyName", address="127.0.0.1")
+        sending = threading.Event()
+        release = threading.Event()
+
+        def blocked_send(ws, message):
+            sending.set()
+            release.wait(5)
+
+        try:
+            es.start()
+            with patch("scratch.extension.WS_QUEUE_SIZE", 1), \
+                    patch("scratch.websocket.WebSocket.send", new=blocked_send):
+                c = socket.create_connection(("127.0.0.1", es.port))
+                c.settimeout(5)
+                c.sendall(b"GET /ws HTTP/1.1\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\nSec-WebSocket-Version: 13\r\n\r\n")
+                f = c.makefile("rb")
+                while f.readline() != b"\r\n":
+                    pass
+                """Sender is blocked on the first message: the second fill the queue, the third disconnect"""
+                self.assertTrue(sending.wait(5))
+                s = es.extension.get_component("s")
+                for i in range(1, 100):
+                    if not es.connections:
+                        break
+                    s.set(i)
+                    time.sleep(0.03)
+                self.assertEqual(0, es.connections)
+                self.assertEqual(0, es.feed.subscribers)
+                self.assertEqual(b"", f.read())
+                c.close()
+        finally:
+            release.set()
+            es.close()
+
+    def test_event_render(self):
+        self.assertEqual("id: 3\nevent: change\ndata: a 1\ndata: b 2\n\n", ES.event_render(3, ["a 1", "b 2"]))
+        self.assertEqual("id: 0\nevent: snapshot\n\n", ES.event_render(0, [], "snapshot"))
+
+    def test_events_cgi_need_connection(self):
+        es = ES(E(), "MyName")
+        self.assertRaises(ValueError, es.invoke, "/events")
+
     def test_busy_render(self):
         self.assertEqual("", ES.busy_render(set()))
         busy = {1, 2, 3, 4}
@@ -633,6 +1027,98 @@ class TestExtensionService(unittest.TestCase):
         """Do nothing .... but not exception"""
         es.stop()
 
+    def test_close(self):
+        es = ES(E(), "MyName", address="127.0.0.1")
+        es.start()
+        es.close()
+        self.assertFalse(es.running)
+        self.assertSetEqual(set(), ES.registered())
+        """Name can be reused"""
+        ES(E(), "MyName").close()
+
+    def test_events_stream(self):
+        ed = ED("def")
+        ed.add_sensor("s", value="S")
+        es = EBS(ed, "MyName", address="127.0.0.1")
+
+        def open_events(headers=b""):
+            s = socket.create_connection(("127.0.0.1", es.port))
+            s.settimeout(5)
+            s.sendall(b"GET /events HTTP/1.0\r\n" + headers + b"\r\n")
+            f = s.makefile("rb")
+            while f.readline() != b"\r\n":
+                pass
+            return s, f
+
+        def first_event(headers=b""):
+            s, f = open_events(headers)
+            try:
+                return int(f.readline().decode().split()[1]), f.readline()
+            finally:
+                s.close()
+
+        try:
+            es.start()
+            first, event = first_event()
+            self.assertEqual(b"event: snapshot\n", event)
+            """Restarted service has a running feed with new ids"""
+            es.stop()
+            es.start()
+            second, event = first_event()
+            self.assertEqual(b"event: snapshot\n", event)
+            self.assertLess(first, second)
+            """Resume by an id of the stopped feed: new snapshot"""
+            self.assertEqual((second, b"event: snapshot\n"), first_event(b"Last-Event-ID: %d\r\n" % first))
+            """Resume by the last id: changes are delivered"""
+            s, f = open_events(b"Last-Event-ID: %d\r\n" % second)
+            try:
+                self.assertEqual(b": keepalive\n", f.readline())
+                f.readline()
+                es.extension.get_component("s").set("T")
+                self.assertEqual(b"id: %d\n" % (second + 1), f.readline())
+                self.assertEqual(b"event: change\n", f.readline())
+                self.assertEqual(b"data: s T\n", f.readline())
+            finally:
+                s.close()
+            """A new service doesn't reuse the ids"""
+            es.close()
+            es = EBS(ed, "MyName", address="127.0.0.1")
+            es.start()
+            self.assertLess(second + 1, first_event(b"Last-Event-ID: %d\r\n" % (second + 1))[0])
+        finally:
+            es.close()
+
+    def test_port_pool(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        pool = PortPool(port, port, address="127.0.0.1")
+        try:
+            es = ES(E(), "MyName", port_pool=pool)
+            self.assertEqual(port, es.port)
+            self.assertEqual(0, len(pool))
+            self.assertRaises(RuntimeError, ES, E(), "Other", port_pool=pool)
+            es.start()
+            s = socket.create_connection(("127.0.0.1", es.port))
+            s.sendall(b"GET /poll HTTP/1.0\r\n\r\n")
+            self.assertIn(b"200", s.makefile("rb").readline())
+            s.close()
+            es.stop()
+            self.assertEqual(0, len(pool))
+            es.close()
+            self.assertEqual([port], pool.ports)
+        finally:
+            pool.close()
+
+    def test_last_access(self):
+        es = ES(E(), "MyName")
+        t = es.last_access
+        es.invoke("/poll")
+        self.assertLessEqual(t, es.last_access)
+        es.touch()
+        self.assertLessEqual(t, es.last_access)
+
     def test_running(self):
         es = ES(E(), "MyName")
         self.assertFalse(es.running)
@@ -713,10 +1199,15 @@ class TestExtension_HTTPHandler(unittest.TestCase):
         self.mock_request = MagicMock()
         self.mock_client_address = ("1.2.3.4", 34234)
         self.mock_wfile = self.mock_request.makefile.return_value
+        self.mock_request.sendmsg.side_effect = lambda buffers: sum(len(b) for b in buffers)
 
     def do_request(self):
         handler = ES.HTTPHandler(self.mock_request, self.mock_client_address, self.es._http)
 
+    def written(self):
+        """All data written by the gathered writes"""
+        return b"".join(bytes(b) for c in self.mock_request.sendmsg.call_args_list for b in c[0][0])
+
     @patch("scratch.extension.ExtensionService._poll_cgi", return_value="POLLER")
     def test_handle_poll(self, mock_cgi, mock_parse_request, mock_log_request,
                          mock_send_response, mock_send_header, mock_end_headers,
@@ -727,9 +1218,9 @@ class TestExtension_HTTPHandler(unittest.TestCase):
         self.do_request()
         self.assertTrue(mock_cgi.called)
         mock_send_response.assert_called_with(200)
-        self.mock_wfile.write.assert_called_with(bytes(mock_cgi.return_value, "utf-8"))
+        self.assertFalse(mock_end_headers.called)
+        self.assertEqual(b"\r\n" + bytes(mock_cgi.return_value, "utf-8"), self.written())
         mock_send_header.assert_called_with("Content-type", "text/html")
-        self.assertTrue(mock_end_headers.called)
 
         mock_send_response.reset_mock()
         mock_send_header.reset_mock()
@@ -740,6 +1231,29 @@ class TestExtension_HTTPHandler(unittest.TestCase):
         mock_send_header.assert_called_with("Content-type", "text/html")
         self.assertTrue(mock_end_headers.called)
 
+    @patch("scratch.extension.ExtensionService._poll_cgi", return_value=[b"a ", memoryview(b"b"), "\n"])
+    def test_handle_buffers(self, mock_cgi, mock_parse_request, mock_log_request,
+                            mock_send_response, mock_send_header, mock_end_headers,
+                            mock_request_version,
+                            mock_path, mock_command):
+        """CGI can return a list of buffers and all go out by one write"""
+        mock_path.return_value = "/poll"
+        mock_command.return_value = "GET"
+        self.do_request()
+        self.assertEqual(b"\r\na b\n", self.written())
+        self.assertEqual(1, self.mock_request.sendmsg.call_count)
+
+    @patch("scratch.extension.ExtensionService._poll_cgi", return_value=b"POLLER")
+    def test_handle_partial_write(self, mock_cgi, mock_parse_request, mock_log_request,
+                                  mock_send_response, mock_send_header, mock_end_headers,
+                                  mock_request_version,
+                                  mock_path, mock_command):
+        mock_path.return_value = "/poll"
+        mock_command.return_value = "GET"
+        self.mock_request.sendmsg.side_effect = lambda buffers: min(3, sum(len(b) for b in buffers))
+        self.do_request()
+        sent = [b"".join(bytes(b) for b in c[0][0])[:3] for c in self.mock_request.sendmsg.call_args_list]
+        self.assertEqual(b"\r\nPOLLER", b"".join(sent))
 
     def test_handle_not_exist(self, mock_parse_request, mock_log_request,
                               mock_send_response, mock_send_header, mock_end_headers,
@@ -749,7 +1263,7 @@ class TestExtension_HTTPHandler(unittest.TestCase):
         mock_command.return_value = "GET"
         self.do_request()
         mock_send_response.assert_called_with(404)
-        self.assertTrue(mock_end_headers.called)
+        self.assertEqual(b"\r\n", self.written())
 
         mock_send_response.reset_mock()
         mock_send_header.reset_mock()
@@ -770,9 +1284,8 @@ class TestExtension_HTTPHandler(unittest.TestCase):
         data = """<cross-domain-policy>
 <allow-access-from domain="*" to-ports="{}"/>
 </cross-domain-policy>""".format(self.es.port)
-        self.mock_wfile.write.assert_called_with(bytes(data, "utf-8"))
+        self.assertEqual(b"\r\n" + bytes(data, "utf-8"), self.written())
         mock_send_header.assert_called_with("Content-type", "text/xml")
-        self.assertTrue(mock_end_headers.called)
 
         mock_send_response.reset_mock()
         mock_send_header.reset_mock()
@@ -795,10 +1308,8 @@ class TestExtension_HTTPHandler(unittest.TestCase):
         self.do_request()
         mock_send_response.assert_called_with(200)
         mock_reset.asset_called_with(self.mock_request)
-        data = ""
-        self.mock_wfile.write.assert_called_with(bytes(data, "utf-8"))
+        self.assertEqual(b"\r\n", self.written())
         mock_send_header.assert_called_with("Content-type", "text/html")
-        self.assertTrue(mock_end_headers.called)
 
         mock_send_response.reset_mock()
         mock_send_header.reset_mock()
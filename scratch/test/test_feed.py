@@ -0,0 +1,158 @@
+import threading
+import time
+
+__author__ = 'michele'
+
+import unittest
+from scratch.portability.mock import Mock
+from scratch.extension import Extension as E
+from scratch.feed import ChangeFeed
+
+
+class TestChangeFeed(unittest.TestCase):
+    """One thread take snapshots on extension changes and dispatch the changed lines"""
+
+    def setUp(self):
+        self.e = E()
+        self.lines = {"a": "a 1", "b": "b 2"}
+        self.snapshot = Mock(side_effect=lambda: self.lines.copy())
+        self.feed = ChangeFeed(self.e, self.snapshot, min_interval=0)
+
+    def tearDown(self):
+        self.feed.stop()
+
+    def wait_for(self, predicate):
+        for _ in range(200):
+            if predicate():
+                return
+            time.sleep(0.005)
+
+    def test_subscribe_get_all_lines(self):
+        cb = Mock()
+        self.feed.subscribe(cb)
+        cb.assert_called_with(["a 1", "b 2"])
+        self.assertEqual(1, self.feed.subscribers)
+        self.assertEqual(["a 1", "b 2"], self.feed.lines)
+
+    def test_changes(self):
+        cbs = [Mock() for _ in range(5)]
+        for cb in cbs:
+            self.feed.subscribe(cb)
+        self.lines["b"] = "b 3"
+        self.lines["c"] = "c 4"
+        self.e.changed()
+        self.wait_for(lambda: all(cb.call_count == 2 for cb in cbs))
+        for cb in cbs:
+            cb.assert_called_with(["b 3", "c 4"])
+        """Snapshot taken once for all subscribers"""
+        self.assertEqual(2, self.snapshot.call_count)
+
+    def test_no_changes_no_call(self):
+        cb = Mock()
+        self.feed.subscribe(cb)
+        self.e.changed()
+        self.wait_for(lambda: self.snapshot.call_count == 2)
+        time.sleep(0.01)
+        self.assertEqual(1, cb.call_count)
+
+    def test_unsubscribe(self):
+        cb = Mock()
+        self.feed.subscribe(cb)
+        self.feed.unsubscribe(cb)
+        self.assertEqual(0, self.feed.subscribers)
+        self.feed.unsubscribe(cb)
+
+    def test_broken_subscriber(self):
+        cb = Mock(side_effect=[None, Exception("broken")])
+        good = Mock()
+        self.feed.subscribe(cb)
+        self.feed.subscribe(good)
+        self.lines["a"] = "a 0"
+        self.e.changed()
+        self.wait_for(lambda: self.feed.subscribers == 1)
+        self.assertEqual(1, self.feed.subscribers)
+        self.wait_for(lambda: good.call_count == 2)
+        good.assert_called_with(["a 0"])
+
+    def test_slow_subscriber_dont_lock_the_feed(self):
+        release = threading.Event()
+        called = threading.Event()
+
+        def slow(lines):
+            if lines == ["a 0"]:
+                called.set()
+                release.wait(5)
+
+        self.feed.subscribe(slow)
+        self.lines["a"] = "a 0"
+        self.e.changed()
+        self.assertTrue(called.wait(5))
+        try:
+            """Readers are not blocked by the delivery"""
+            start = time.monotonic()
+            self.assertEqual((1, ["a 0", "b 2"]), self.feed.state())
+            self.assertEqual([(1, ["a 0"])], self.feed.events_since(0, 0))
+            self.feed.unsubscribe(slow)
+            self.assertEqual(0, self.feed.subscribers)
+            self.assertLess(time.monotonic() - start, 1)
+        finally:
+            release.set()
+
+    def test_stop(self):
+        self.feed.subscribe(Mock())
+        self.feed.stop()
+        self.assertEqual(0, self.feed.subscribers)
+
+    def test_events_since(self):
+        self.assertEqual((0, ["a 1", "b 2"]), self.feed.state())
+        self.assertEqual([], self.feed.events_since(0, 0))
+        self.lines["a"] = "a 0"
+        self.e.changed()
+        self.assertEqual([(1, ["a 0"])], self.feed.events_since(0, 1))
+        self.lines["b"] = "b 0"
+        self.e.changed()
+        self.assertEqual([(2, ["b 0"])], self.feed.events_since(1, 1))
+        self.assertEqual([(1, ["a 0"]), (2, ["b 0"])], self.feed.events_since(0, 0))
+        self.assertEqual((2, ["a 0", "b 0"]), self.feed.state())
+        """Unknown id"""
+        self.assertIsNone(self.feed.events_since(5, 0))
+
+    def test_first_id(self):
+        feed = ChangeFeed(self.e, self.snapshot, min_interval=0, first_id=100)
+        try:
+            self.assertEqual((100, ["a 1", "b 2"]), feed.state())
+            self.assertEqual([], feed.events_since(100, 0))
+            """Ids of other feeds"""
+            self.assertIsNone(feed.events_since(99, 0))
+            self.assertIsNone(feed.events_since(0, 0))
+            self.lines["a"] = "a 0"
+            self.e.changed()
+            self.assertEqual([(101, ["a 0"])], feed.events_since(100, 1))
+        finally:
+            feed.stop()
+
+    def test_events_since_bounded_log(self):
+        feed = ChangeFeed(self.e, self.snapshot, min_interval=0, log_size=2)
+        try:
+            feed.start()
+            for i in range(4):
+                self.lines["a"] = "a {}".format(i + 10)
+                self.e.changed()
+                self.assertEqual(i + 1, feed.events_since(i, 1)[-1][0])
+            self.assertEqual([3, 4], [e[0] for e in feed.events_since(2, 0)])
+            self.assertIsNone(feed.events_since(1, 0))
+        finally:
+            feed.stop()
+
+    def test_stop_wake_up_events_since(self):
+        self.feed.start()
+        t = threading.Timer(0.05, self.feed.stop)
+        t.start()
+        start = time.monotonic()
+        self.assertEqual([], self.feed.events_since(0, 5))
+        self.assertLess(time.monotonic() - start, 2)
+        t.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+__author__ = 'michele'
+
+import unittest
+from scratch.portability.mock import Mock
+from scratch.history import History
+
+
+class TestHistory(unittest.TestCase):
+    """History is a ring buffer of numeric samples with timestamps"""
+
+    def test_base(self):
+        self.assertRaises(TypeError, History)
+        self.assertRaises(ValueError, History, 0)
+        h = History(3)
+        self.assertEqual(3, h.size)
+        self.assertEqual(0, len(h))
+        self.assertEqual([], h.last())
+
+    def test_append_overwrite_oldest(self):
+        h = History(3)
+        for v in range(5):
+            h.append(v, timestamp=v)
+        self.assertEqual(3, len(h))
+        self.assertEqual([2.0, 3.0, 4.0], h.last())
+        self.assertEqual([3.0, 4.0], h.last(2))
+        self.assertEqual([2.0, 3.0, 4.0], h.last(10))
+
+    def test_aggregates_count(self):
+        h = History(10)
+        for v in [3, 1, 4, 1, 5]:
+            h.append(v)
+        self.assertEqual(1, h.min())
+        self.assertEqual(5, h.max())
+        self.assertAlmostEqual(14 / 5, h.mean())
+        self.assertEqual(5, h.max(3))
+        self.assertEqual(3, h.mean(2))
+        self.assertEqual(1, h.min(2))
+        self.assertEqual(5, h.aggregate("max"))
+        self.assertRaises(ValueError, h.aggregate, "median")
+
+    def test_aggregates_empty(self):
+        h = History(10)
+        self.assertIsNone(h.min())
+        self.assertIsNone(h.max())
+        self.assertIsNone(h.mean())
+
+    def test_aggregates_seconds(self):
+        clock = Mock(return_value=100.0)
+        h = History(10, clock=clock)
+        for t, v in [(90, 10), (95, 20), (98, 30), (99, 40)]:
+            h.append(v, timestamp=t)
+        self.assertEqual([30.0, 40.0], h.last(seconds=3))
+        self.assertEqual(35, h.mean(seconds=3))
+        self.assertEqual(20, h.min(seconds=5))
+        self.assertEqual(40, h.max(count=1, seconds=5))
+        self.assertIsNone(h.mean(seconds=0.5))
+        """append use clock when timestamp is missing"""
+        h.append(50)
+        self.assertEqual([50.0], h.last(seconds=0))
+
+    def test_export(self):
+        h = History(3)
+        times, values = h.export()
+        self.assertEqual([], list(times))
+        h.append(1, 10)
+        h.append(2, 11)
+        times, values = h.export()
+        self.assertEqual([10.0, 11.0], list(times))
+        self.assertEqual([1.0, 2.0], list(values))
+        h.append(3, 12)
+        h.append(4, 13)
+        times, values = h.export()
+        self.assertEqual([11.0, 12.0, 13.0], list(times))
+        self.assertEqual([2.0, 3.0, 4.0], list(values))
+        self.assertEqual("d", values.typecode)
+
+    def test_clear(self):
+        h = History(3)
+        h.append(1)
+        h.clear()
+        self.assertEqual(0, len(h))
+        self.assertIsNone(h.mean())
+
+
+if __name__ == '__main__':
+    unittest.main()
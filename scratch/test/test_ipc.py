@@ -0,0 +1,163 @@
+import io
+import os
+import socket
+import tempfile
+import threading
+import time
+
+__author__ = 'michele'
+
+import unittest
+from scratch.bus import Bus
+from scratch.ipc import BusServer, BusLink, connect, encode_frame, encode_message, read_frame, LinkClosed, PUBLISH, \
+    SUBSCRIBE
+
+
+class TestFrames(unittest.TestCase):
+
+    def test_encode_read(self):
+        data = encode_message("tòpic", {"a": [1, 2]}) + encode_frame(SUBSCRIBE, "t")
+        rfile = io.BytesIO(data)
+        self.assertEqual((PUBLISH, "tòpic", b'{"a":[1,2]}'), read_frame(rfile))
+        self.assertEqual((SUBSCRIBE, "t", b""), read_frame(rfile))
+        self.assertRaises(LinkClosed, read_frame, rfile)
+        self.assertRaises(LinkClosed, read_frame, io.BytesIO(data[:5]))
+
+
+class TestBusLink(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "bus.sock")
+        self.server_bus, self.client_bus = Bus(), Bus()
+        self.server = BusServer(self.server_bus, self.path)
+        self.link = connect(self.client_bus, self.path)
+
+    def tearDown(self):
+        self.link.close()
+        self.server.close()
+        self.dir.cleanup()
+
+    def wait_for(self, predicate):
+        for _ in range(500):
+            if predicate():
+                return True
+            time.sleep(0.002)
+        return predicate()
+
+    def test_forward(self):
+        """Client messages go to the server bus"""
+        s = self.server_bus.subscribe("t")
+        self.link.forward("t")
+        for i in range(10):
+            self.client_bus.publish("t", [i, "x"])
+        self.assertTrue(self.wait_for(lambda: len(s) == 10))
+        self.assertEqual([[i, "x"] for i in range(10)], s.drain())
+
+    def test_subscribe(self):
+        """Server messages come to the client bus"""
+        s = self.client_bus.subscribe("t")
+        self.link.subscribe("t")
+        self.assertTrue(self.wait_for(lambda: self.server_bus.subscribers("t")))
+        self.server_bus.publish("t", "hello")
+        self.assertTrue(self.wait_for(lambda: len(s) == 1))
+        self.assertEqual(["hello"], s.drain())
+        self.assertRaises(ValueError, self.link.forward, "t")
+
+    def test_close(self):
+        self.link.forward("t")
+        self.assertTrue(self.wait_for(lambda: len(self.server.links) == 1))
+        self.link.close()
+        self.assertTrue(self.link.closed)
+        self.assertEqual(0, self.client_bus.subscribers("t"))
+        self.assertTrue(self.wait_for(lambda: not self.server.links))
+
+
+class GatedSocket():
+    """A socket that waits the gate before every write"""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.gate = threading.Event()
+        self.written = io.BytesIO()
+
+    def sendall(self, data):
+        self.gate.wait(5)
+        self.written.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class TestBackpressure(unittest.TestCase):
+
+    def setUp(self):
+        self.a, self.b = socket.socketpair()
+        self.sock = GatedSocket(self.a)
+        self.link = BusLink(Bus(), self.sock, buffer_size=2)
+
+    def tearDown(self):
+        self.sock.gate.set()
+        self.link.close()
+        self.b.close()
+
+    def wait_for(self, predicate, attempts=500):
+        for _ in range(attempts):
+            if predicate():
+                return True
+            time.sleep(0.002)
+        return predicate()
+
+    def test_producer_never_wait_and_control_frames_pass(self):
+        self.link._send_messages("t", [1])
+        """Writer is blocked on the first write: fill the buffer"""
+        self.assertTrue(self.wait_for(lambda: not self.link._out))
+        self.link._send_messages("t", [2, 3])
+        self.link.subscribe("x")
+        self.link._send_messages("t", [4])
+        self.assertEqual(1, self.link.dropped)
+        self.sock.gate.set()
+        expected = b"".join([encode_message("t", 1), encode_frame(SUBSCRIBE, "x"), encode_message("t", 3),
+                             encode_message("t", 4)])
+        self.assertTrue(self.wait_for(lambda: self.sock.written.tell() == len(expected)))
+        self.assertEqual(expected, self.sock.written.getvalue())
+
+    def test_slow_peer_is_disconnected(self):
+        """A peer that never reads doesn't stall the bus: it is disconnected after the send timeout"""
+        bus = Bus()
+        a, b = socket.socketpair()
+        link = BusLink(bus, a, send_timeout=0.1)
+        try:
+            link.forward("t")
+            other = bus.subscribe("other")
+            for i in range(200):
+                bus.publish("t", "x" * 65536)
+            bus.publish("other", "hello")
+            self.assertTrue(bus.flush(5))
+            self.assertEqual(["hello"], other.drain())
+            self.assertTrue(self.wait_for(lambda: link.closed, 2500))
+        finally:
+            link.close()
+            b.close()
+
+
+class TestBusServer(unittest.TestCase):
+
+    def test_dont_remove_other_files(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "bus.sock")
+            with open(path, "w") as f:
+                f.write("data")
+            self.assertRaises(FileExistsError, BusServer, Bus(), path)
+            self.assertTrue(os.path.isfile(path))
+            """A stale socket is replaced"""
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            os.unlink(path)
+            stale.bind(path)
+            stale.close()
+            BusServer(Bus(), path).close()
+            self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
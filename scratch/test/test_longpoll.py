@@ -0,0 +1,131 @@
+import socket
+import threading
+import time
+
+__author__ = 'michele'
+
+import unittest
+from scratch.portability.mock import Mock, patch
+from scratch.extension import Extension as E
+from scratch.longpoll import PollParker
+
+
+class TestPollParker(unittest.TestCase):
+    """Parker answers parked requests by one thread when extension changes or timeout expires"""
+
+    def setUp(self):
+        self.e = E()
+        self.render = Mock(return_value=b"body")
+        self.parker = PollParker(self.e, self.render)
+
+    @staticmethod
+    def sock():
+        """A socket that takes all data at once"""
+        s = Mock()
+        s.send.side_effect = len
+        return s
+
+    def wait_answered(self, *socks):
+        for s in socks:
+            for _ in range(200):
+                if s.close.called:
+                    break
+                time.sleep(0.005)
+
+    def test_timeout(self):
+        sock = self.sock()
+        self.parker.park(sock, self.e.version, 0.05)
+        self.assertEqual(1, len(self.parker))
+        self.assertFalse(sock.send.called)
+        self.wait_answered(sock)
+        sock.send.assert_called_with(b"HTTP/1.0 200 OK\r\nContent-type: text/html\r\nContent-Length: 4\r\n\r\nbody")
+        self.assertEqual(0, len(self.parker))
+
+    def test_change_wake_up_all(self):
+        socks = [self.sock() for _ in range(10)]
+        for s in socks:
+            self.parker.park(s, self.e.version, 10)
+        time.sleep(0.02)
+        self.assertFalse(any(s.send.called for s in socks))
+        self.e.changed()
+        self.wait_answered(*socks)
+        self.assertTrue(all(s.send.called for s in socks))
+        """Just one render"""
+        self.assertEqual(1, self.render.call_count)
+
+    def test_old_version_answer_immediately(self):
+        sock = self.sock()
+        self.e.changed()
+        self.parker.park(sock, 0, 10)
+        self.wait_answered(sock)
+        self.assertTrue(sock.send.called)
+
+    def test_just_one_thread(self):
+        n = threading.active_count()
+        for _ in range(20):
+            self.parker.park(self.sock(), self.e.version, 10)
+        self.assertEqual(n + 1, threading.active_count())
+        self.parker.stop()
+
+    def test_stop(self):
+        sock = self.sock()
+        self.parker.park(sock, self.e.version, 10)
+        self.parker.stop()
+        self.assertTrue(sock.close.called)
+        self.assertFalse(sock.send.called)
+        self.assertEqual(0, len(self.parker))
+
+    def test_render_error(self):
+        self.render.side_effect = Exception("Render problem")
+        sock = self.sock()
+        self.parker.park(sock, -1, 10)
+        self.wait_answered(sock)
+        self.assertIn(b"500", sock.send.call_args[0][0])
+
+    def test_slow_client_does_not_block_the_others(self):
+        stuck, peer = socket.socketpair()
+        self.addCleanup(peer.close)
+        self.addCleanup(stuck.close)
+        stuck.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.render.return_value = b"x" * 10000000
+        socks = [self.sock() for _ in range(10)]
+        for s in [stuck] + socks:
+            self.parker.park(s, self.e.version, 10)
+        start = time.monotonic()
+        self.e.changed()
+        self.wait_answered(*socks)
+        self.assertTrue(all(s.close.called for s in socks))
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.parker.stop()
+
+    def test_close_too_slow_client(self):
+        a, b = socket.socketpair()
+        self.addCleanup(b.close)
+        a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.render.return_value = b"x" * 10000000
+        with patch("scratch.longpoll.SEND_TIMEOUT", 0.1):
+            self.parker.park(a, -1, 10)
+            for _ in range(200):
+                if a.fileno() == -1:
+                    break
+                time.sleep(0.01)
+        self.assertEqual(-1, a.fileno())
+
+    def test_slow_client_get_all_body(self):
+        a, b = socket.socketpair()
+        self.addCleanup(b.close)
+        body = b"x" * 1000000
+        self.render.return_value = body
+        self.parker.park(a, -1, 10)
+        data = []
+        while True:
+            d = b.recv(65536)
+            if not d:
+                break
+            data.append(d)
+            time.sleep(0.001)
+        self.assertTrue(b"".join(data).endswith(b"\r\n\r\n" + body))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import threading
+import time
+
+__author__ = 'michele'
+
+import unittest
+from scratch.mailbox import Mailbox, DROP_NEWEST
+
+
+class TestMailbox(unittest.TestCase):
+
+    def test_put_get(self):
+        m = Mailbox()
+        self.assertTrue(m.empty())
+        self.assertIsNone(m.get(block=False))
+        m.put("a", 1)
+        m.put("b", 2)
+        m.put("a", 3)
+        self.assertEqual(3, len(m))
+        self.assertSetEqual({"a", "b"}, m.senders)
+        self.assertFalse(m.empty("b"))
+        self.assertTrue(m.empty("c"))
+        self.assertEqual(("b", 2), m.get("b"))
+        self.assertTrue(m.empty("b"))
+        self.assertEqual(("a", 1), m.get())
+        self.assertEqual(("a", 3), m.get("a"))
+        self.assertTrue(m.empty())
+        self.assertSetEqual(set(), m.senders)
+
+    def test_order(self):
+        m = Mailbox()
+        for i in range(10):
+            m.put("ab"[i % 2], i)
+        self.assertEqual(("b", 1), m.get("b"))
+        self.assertEqual([0, 2, 3, 4, 5, 6, 7, 8, 9], [m.get()[1] for _ in range(9)])
+
+    def test_drop_oldest(self):
+        m = Mailbox(size=2)
+        self.assertTrue(m.put("a", 1))
+        m.put("b", 2)
+        self.assertTrue(m.put("a", 3))
+        self.assertEqual(1, m.dropped)
+        self.assertEqual([("b", 2), ("a", 3)], [m.get(), m.get()])
+
+    def test_drop_newest(self):
+        m = Mailbox(size=2, drop=DROP_NEWEST)
+        m.put("a", 1)
+        m.put("b", 2)
+        self.assertFalse(m.put("a", 3))
+        self.assertEqual(1, m.dropped)
+        self.assertEqual([("a", 1), ("b", 2)], [m.get(), m.get()])
+        self.assertRaises(ValueError, Mailbox, drop="random")
+
+    def test_timeout(self):
+        m = Mailbox()
+        start = time.monotonic()
+        self.assertIsNone(m.get("a", timeout=0.02))
+        self.assertLessEqual(0.02, time.monotonic() - start)
+
+    def test_targeted_wakeup(self):
+        m = Mailbox()
+        results = {}
+
+        def read(sender):
+            results[sender] = m.get(sender, timeout=5)
+
+        readers = {s: threading.Thread(target=read, args=(s,)) for s in ["a", "b"]}
+        for t in readers.values():
+            t.start()
+        while len(m._waiters) < 2:
+            time.sleep(0.001)
+        m.put("b", "for b")
+        readers["b"].join(5)
+        self.assertEqual(("b", "for b"), results["b"])
+        self.assertTrue(readers["a"].is_alive())
+        m.put("a", "for a")
+        readers["a"].join(5)
+        self.assertEqual(("a", "for a"), results["a"])
+        self.assertEqual({}, m._waiters)
+
+    def test_reset(self):
+        m = Mailbox()
+        results = []
+        readers = [threading.Thread(target=lambda s=s: results.append(m.get(s))) for s in ["a", None]]
+        for t in readers:
+            t.start()
+        while len(m._waiters) < 2:
+            time.sleep(0.001)
+        m.reset()
+        for t in readers:
+            t.join(5)
+        self.assertEqual([None, None], results)
+        """No sentinel left behind"""
+        m.put("a", 1)
+        self.assertEqual(("a", 1), m.get())
+
+
+if __name__ == '__main__':
+    unittest.main()
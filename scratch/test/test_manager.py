@@ -0,0 +1,122 @@
+import base64
+import json
+import os
+import socket
+import time
+
+__author__ = 'michele'
+
+import unittest
+from scratch.extension import ExtensionDefinition as ED, ExtensionService as ES
+from scratch.manager import ExtensionManager as EM
+
+
+class TestExtensionManager(unittest.TestCase):
+
+    def setUp(self):
+        ES._unregister_all()
+        ED._unregister_all()
+        self.ed = ED("def")
+        self.ed.add_sensor("s", value="S")
+        self.m = EM(idle_timeout=60, address="127.0.0.1")
+
+    def tearDown(self):
+        self.m.close()
+
+    def test_lazy(self):
+        self.assertEqual(0, len(self.m))
+        s = self.m.get("def")
+        self.assertTrue(s.running)
+        self.assertIs(s, self.m.get("def"))
+        self.assertSetEqual({"def"}, ES.registered())
+        self.assertEqual("S", s.extension.get_component("s").get())
+        self.assertRaises(KeyError, self.m.get, "unknown")
+
+    def test_clients(self):
+        s0 = self.m.get("def", "10.0.0.1")
+        s1 = self.m.get("def", "10.0.0.2")
+        self.assertIsNot(s0, s1)
+        self.assertNotEqual(s0.port, s1.port)
+        self.assertSetEqual({"def [10.0.0.1]", "def [10.0.0.2]"}, set(self.m.services))
+
+    def test_reap(self):
+        s0 = self.m.get("def", "a")
+        s1 = self.m.get("def", "b")
+        now = time.monotonic()
+        self.assertEqual([], self.m.reap(now))
+        s1.invoke("/s")
+        """s0 idle from 2 minutes"""
+        s0._last_access -= 120
+        self.assertEqual(["def [a]"], self.m.reap())
+        self.assertFalse(s0.running)
+        self.assertSetEqual({"def [b]"}, ES.registered())
+        """A new one"""
+        self.assertIsNot(s0, self.m.get("def", "a"))
+
+    def test_reap_connected(self):
+        s = self.m.get("def", "a")
+        c = socket.create_connection(("127.0.0.1", s.port))
+        try:
+            c.settimeout(5)
+            key = base64.b64encode(os.urandom(16))
+            c.sendall(b"GET /ws HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      b"Sec-WebSocket-Key: " + key + b"\r\nSec-WebSocket-Version: 13\r\n\r\n")
+            response = b""
+            while b"\r\n\r\n" not in response:
+                response += c.recv(1024)
+            self.assertTrue(response.startswith(b"HTTP/1.1 101"))
+            payload = b'{"id": 1, "path": "/s"}'
+            mask = os.urandom(4)
+            c.sendall(bytes([0x81, 0x80 | len(payload)]) + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+            f = c.makefile("rb")
+            while True:
+                header = f.read(2)
+                message = json.loads(f.read(header[1]).decode())
+                if "id" in message:
+                    break
+            self.assertEqual({"id": 1, "result": "S"}, message)
+            self.assertEqual(1, s.connections)
+            """Quiet but connected: not idle"""
+            s._last_access -= 120
+            self.assertEqual([], self.m.reap())
+            self.assertTrue(s.running)
+            """Close drop the connection"""
+            self.m.release("def", "a")
+            while f.read(1024):
+                pass
+            self.assertEqual(0, s.connections)
+        finally:
+            c.close()
+
+    def test_release(self):
+        s = self.m.get("def")
+        self.m.release("def")
+        self.assertFalse(s.running)
+        self.assertEqual(0, len(self.m))
+        self.m.release("def")
+
+    def test_max_services(self):
+        m = EM(idle_timeout=60, address="127.0.0.1", max_services=1)
+        try:
+            m.get("def", "a")
+            self.assertRaises(RuntimeError, m.get, "def", "b")
+            m.get("def", "a")
+        finally:
+            m.close()
+
+    def test_reaper_thread(self):
+        m = EM(idle_timeout=0.05, address="127.0.0.1", reap_interval=0.01)
+        try:
+            s = m.get("def")
+            for _ in range(200):
+                if not s.running:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(0, len(m))
+            self.assertFalse(s.running)
+        finally:
+            m.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
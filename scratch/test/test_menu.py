@@ -0,0 +1,81 @@
+import copy
+
+__author__ = 'michele'
+
+import unittest
+from scratch.portability.mock import Mock
+from scratch.menu import Menu
+
+
+class TestMenu(unittest.TestCase):
+
+    def test_container(self):
+        m = Menu(["a", "b"])
+        self.assertEqual(frozenset(["a", "b"]), m.elements)
+        self.assertEqual("a", m["a"])
+        self.assertIn("b", m)
+        self.assertEqual(2, len(m))
+        self.assertSetEqual({"a", "b"}, set(m))
+
+    def test_mapping(self):
+        m = Menu({"Left": 1, "Right": 2})
+        self.assertEqual(1, m["Left"])
+        self.assertRaises(KeyError, m.__getitem__, "Up")
+        self.assertEqual(str, m.get(None, str))
+
+    def test_add_remove(self):
+        m = Menu(["a"])
+        e = m.elements
+        self.assertIs(e, m.elements)
+        v = m.version
+        m.add("b")
+        self.assertLess(v, m.version)
+        self.assertEqual(frozenset(["a", "b"]), m.elements)
+        """Snapshot don't change"""
+        self.assertEqual(frozenset(["a"]), e)
+        v = m.version
+        m.add("b")
+        self.assertEqual(v, m.version)
+        m.add("b", "B")
+        self.assertEqual("B", m["b"])
+        m.remove("a")
+        self.assertRaises(KeyError, m.remove, "a")
+        m.discard("a")
+        self.assertEqual(frozenset(["b"]), m.elements)
+
+    def test_listeners(self):
+        m = Menu()
+        cb = Mock()
+        m.add_listener(cb)
+        m.add("a")
+        cb.assert_called_with(m)
+        m.remove("a")
+        self.assertEqual(2, cb.call_count)
+
+    def test_bound_method_listener_is_weak(self):
+        class Owner():
+            def __init__(self):
+                self.calls = 0
+
+            def changed(self, menu):
+                self.calls += 1
+
+        m = Menu()
+        o = Owner()
+        m.add_listener(o.changed)
+        m.add("a")
+        self.assertEqual(1, o.calls)
+        del o
+        m.add("b")
+        self.assertEqual([], m._listeners)
+
+    def test_shared(self):
+        m = Menu(["a"])
+        self.assertIs(m, copy.deepcopy(m))
+        self.assertIs(m, copy.deepcopy({"m": m})["m"])
+        self.assertNotEqual(Menu(["a"]), m)
+        self.assertEqual({m: 1}[m], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import socket
+
+__author__ = 'michele'
+
+import unittest
+from scratch.ports import PortPool
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class TestPortPool(unittest.TestCase):
+
+    def setUp(self):
+        self.first = free_port()
+        self.pool = PortPool(self.first, self.first + 2, address="127.0.0.1")
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_acquire_release(self):
+        n = len(self.pool)
+        self.assertLessEqual(1, n)
+        sock = self.pool.acquire()
+        self.assertEqual(n - 1, len(self.pool))
+        self.assertEqual(1, self.pool.used)
+        port = sock.getsockname()[1]
+        self.assertNotIn(port, self.pool.ports)
+        """It is listening"""
+        socket.create_connection(("127.0.0.1", port)).close()
+        self.pool.release(sock)
+        self.assertIn(port, self.pool.ports)
+        self.assertEqual(0, self.pool.used)
+        self.assertRaises(ValueError, self.pool.release, sock)
+
+    def test_empty(self):
+        for _ in range(len(self.pool)):
+            self.pool.acquire()
+        self.assertRaises(RuntimeError, self.pool.acquire)
+
+    def test_skip_used_ports(self):
+        busy = socket.socket()
+        busy.bind(("127.0.0.1", 0))
+        busy.listen(1)
+        port = busy.getsockname()[1]
+        try:
+            pool = PortPool(port, port, address="127.0.0.1")
+            self.assertEqual(0, len(pool))
+            pool.close()
+        finally:
+            busy.close()
+
+    def test_drain_queued_connections(self):
+        sock = self.pool.acquire()
+        port = sock.getsockname()[1]
+        self.pool.release(sock)
+        c = socket.create_connection(("127.0.0.1", port))
+        while self.pool.acquire() is not sock:
+            pass
+        c.settimeout(1)
+        """Closed by the pool"""
+        self.assertEqual(b"", c.recv(10))
+        c.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
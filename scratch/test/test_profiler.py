@@ -0,0 +1,117 @@
+import time
+
+__author__ = 'michele'
+
+import unittest
+from scratch.portability.mock import patch, Mock
+from scratch.extension import ExtensionDefinition as ED, ExtensionBase as EB
+from scratch.profiler import Profiler, Histogram, BUCKETS
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_add(self):
+        h = Histogram()
+        self.assertEqual(0.0, h.percentile(50))
+        for w in [0.00001, 0.0001, 0.001, 0.01]:
+            h.add(w, w / 2)
+        h.add(100.0, 0.0, True)
+        self.assertEqual(5, h.count)
+        self.assertEqual(1, h.slow)
+        self.assertEqual(100.0, h.max)
+        self.assertEqual(1, h.buckets[-1])
+        self.assertEqual(1, h.buckets[0])
+        self.assertLessEqual(0.001, h.percentile(50))
+        self.assertGreater(BUCKETS[-1], h.percentile(50))
+        self.assertEqual(100.0, h.percentile(100))
+        self.assertEqual(5, sum(h.as_dict()["buckets"]))
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        ED._unregister_all()
+        self.ed = ED("def")
+        self.sensor = self.ed.add_sensor("s", value=0)
+        self.command = self.ed.add_command("c", description="c %n")
+        self.hat = self.ed.add_hat("h")
+
+    def test_disabled(self):
+        e = EB(self.ed)
+        self.assertIsNone(e.profiler)
+        e.get_component("s").get()
+        p = e.enable_profiling()
+        self.assertIs(p, e.profiler)
+        e.disable_profiling()
+        e.get_component("s").get()
+        self.assertEqual({}, p.stats())
+
+    def test_callbacks(self):
+        self.sensor.callback = lambda: 3
+        self.command.callback = Mock()
+        self.hat.callback = lambda: True
+        e = EB(self.ed)
+        p = e.enable_profiling()
+        self.assertEqual(3, e.get_component("s").get())
+        e.get_component("c").command(2)
+        e.get_component("c").command(3)
+        self.command.callback.assert_called_with(3)
+        self.assertTrue(e.get_component("h").state)
+        e.get_component("h").reset()
+        stats = p.stats()
+        self.assertEqual(1, stats["s"]["do_read"]["count"])
+        self.assertEqual(2, stats["c"]["do_command"]["count"])
+        self.assertEqual(1, stats["h"]["do_flag"]["count"])
+        self.assertEqual(1, stats["h"]["do_reset"]["count"])
+        self.assertEqual(4, len(p.slowest()))
+        p.reset()
+        self.assertEqual({}, p.stats())
+
+    def test_exception(self):
+        def boom():
+            raise ValueError()
+        self.sensor.callback = boom
+        e = EB(self.ed)
+        p = e.enable_profiling()
+        self.assertRaises(ValueError, e.get_component("s").get)
+        self.assertEqual(1, p.stats()["s"]["do_read"]["count"])
+
+    @patch("logging.warning")
+    def test_slow_on_poll(self, mock_warning):
+        self.sensor.callback = lambda: time.sleep(0.1) or 1
+        e = EB(self.ed)
+        p = e.enable_profiling(threshold=0.02)
+        e.poll()
+        self.assertEqual(1, p.warnings)
+        self.assertIn("Slow callback s.do_read", mock_warning.call_args[0][0])
+        self.assertIn("sleep", mock_warning.call_args[0][0])
+        self.assertEqual(1, p.stats()["s"]["do_read"]["slow"])
+
+        """Not on poll path and not locked: counted but not logged"""
+        mock_warning.reset_mock()
+        e.get_component("s").get()
+        time.sleep(0.05)
+        self.assertFalse(mock_warning.called)
+        self.assertEqual(2, p.stats()["s"]["do_read"]["slow"])
+
+    @patch("logging.warning")
+    def test_slow_locked(self, mock_warning):
+        e = EB(self.ed)
+        p = e.enable_profiling(threshold=0.02)
+        h = e.get_component("h")
+        h.do_reset = lambda: time.sleep(0.1)
+        h.reset()
+        self.assertEqual(1, p.warnings)
+        self.assertIn("Slow callback h.do_reset", mock_warning.call_args[0][0])
+
+    def test_watchdog_ends(self):
+        p = Profiler(threshold=0.01)
+        c = Mock()
+        c.name = "c"
+        p.call(c, "do_command", time.sleep, 0.001)
+        time.sleep(0.05)
+        self.assertIsNone(p._watchdog)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import threading
+
+__author__ = 'michele'
+
+import unittest
+from scratch.results import ResultsQueue
+
+
+class TestResultsQueue(unittest.TestCase):
+
+    def test_push_drain(self):
+        q = ResultsQueue()
+        self.assertEqual([], q.drain())
+        q.push("a", 1, "v")
+        q.push("b", 2, "w", "ex")
+        self.assertEqual(2, len(q))
+        self.assertEqual([("a", 1, "v", None), ("b", 2, "w", "ex")], q.peek())
+        self.assertEqual([("a", 1, "v", None), ("b", 2, "w", "ex")], q.drain())
+        self.assertEqual(0, len(q))
+
+    def test_owner(self):
+        a, b = object(), object()
+        q = ResultsQueue()
+        q.push(a, 1, "v")
+        q.push(b, 2, "w")
+        q.push(a, 3, "x")
+        self.assertEqual([(a, 1, "v", None), (a, 3, "x", None)], q.peek(a))
+        self.assertEqual([(a, 1, "v", None), (a, 3, "x", None)], q.drain(a))
+        """Others results are still there"""
+        self.assertEqual([(b, 2, "w", None)], q.drain())
+
+    def test_bounded(self):
+        q = ResultsQueue(3)
+        self.assertEqual(3, q.size)
+        for i in range(5):
+            q.push("a", i, i)
+        self.assertEqual(3, len(q))
+        self.assertEqual(2, q.dropped)
+        self.assertEqual([2, 3, 4], [r[1] for r in q.drain()])
+
+    def test_owner_drain_while_pushing(self):
+        a, b = object(), object()
+        q = ResultsQueue(50)
+        stop = threading.Event()
+        pushed = [0]
+
+        def produce():
+            while not stop.is_set():
+                q.push(b, 0, 0)
+                pushed[0] += 1
+
+        t = threading.Thread(target=produce)
+        t.start()
+        drained = 0
+        try:
+            for i in range(10000):
+                q.push(a, i, i)
+                drained += len(q.drain(a))
+        finally:
+            stop.set()
+            t.join()
+        """Every result is drained, still in the queue or counted as dropped"""
+        self.assertEqual(pushed[0] + 10000, drained + len(q) + q.dropped)
+
+    def test_concurrent_producers(self):
+        q = ResultsQueue(100000)
+        drained = []
+
+        def produce(n):
+            for i in range(1000):
+                q.push(n, i, i)
+
+        threads = [threading.Thread(target=produce, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        while any(t.is_alive() for t in threads):
+            drained += q.drain()
+        drained += q.drain()
+        self.assertEqual(8000, len(drained))
+        for n in range(8):
+            self.assertEqual(list(range(1000)), [r[1] for r in drained if r[0] == n])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import time
+
+__author__ = 'michele'
+
+import unittest
+from scratch.extension import ExtensionDefinition as ED, ExtensionBase as EB
+from scratch import snapshot
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        ED._unregister_all()
+        self.ed = ED("def")
+        self.ed.add_sensor("s", value=0)
+        self.ed.add_reporter("r", description="r %m.a %n", a=["x", "y"])
+        self.ed.add_hat("h")
+        self.ed.add_requester("q", value="")
+        self.ed.add_command("c")
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "state.json")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def populate(self, e):
+        e.get_component("s").set(12.5)
+        e.get_component("r").set("A", "x", 1)
+        e.get_component("r").set("B", "y", 2.5)
+        e.get_component("h").flag()
+        e.get_component("q")._new_result(33, "res")
+
+    def test_snapshot_restore(self):
+        e = EB(self.ed)
+        self.populate(e)
+        state = e.snapshot()
+        self.assertEqual({"value": 12.5}, state["s"])
+        self.assertNotIn("c", state)
+        other = EB(self.ed)
+        other.restore(state)
+        other.restore({"unknown": {}})
+        self.assertEqual(12.5, other.get_component("s").get())
+        self.assertEqual("A", other.get_component("r").get("x", 1))
+        self.assertEqual("B", other.get_component("r").get("y", 2.5))
+        self.assertTrue(other.get_component("h").state)
+        self.assertEqual([(33, "res")], other.results)
+
+    def test_save_load(self):
+        e = EB(self.ed)
+        self.populate(e)
+        snapshot.save(e, self.path)
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+        other = EB(self.ed)
+        self.assertTrue(snapshot.load(other, self.path))
+        self.assertEqual("B", other.get_component("r").get("y", 2.5))
+        self.assertEqual(e.get_component("r").value, other.get_component("r").value)
+        self.assertFalse(snapshot.load(other, self.path + ".none"))
+
+    def test_snapshotter(self):
+        e = EB(self.ed)
+        s = snapshot.Snapshotter(e, self.path, interval=0.01)
+        self.assertTrue(s.save())
+        self.assertFalse(s.save())
+        s.start()
+        e.get_component("s").set(3)
+        for _ in range(500):
+            other = EB(self.ed)
+            snapshot.load(other, self.path)
+            if other.get_component("s").get() == 3:
+                break
+            time.sleep(0.005)
+        self.assertEqual(3, other.get_component("s").get())
+        e.get_component("s").set(4)
+        s.stop()
+        snapshot.load(other, self.path)
+        self.assertEqual(4, other.get_component("s").get())
+
+
+if __name__ == '__main__':
+    unittest.main()
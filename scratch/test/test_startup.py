@@ -0,0 +1,72 @@
+import json
+import os
+import subprocess
+import sys
+
+__author__ = 'michele'
+
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Max ratio between the time to import scratch.extension after scratch.components and the scratch.components
+# import time (both measured in the same process, so the ratio is stable across machines and loads): measured
+# about 0.25, and 1.0 with the eager server imports.
+IMPORT_RATIO = 0.4
+
+# Modules that must be imported just when really used
+LAZY = ["http.server", "socketserver", "asyncio", "concurrent.futures", "scratch.httpd", "scratch.websocket",
+        "json", "socket", "queue", "scratch.bus", "scratch.events", "scratch.feed", "scratch.longpoll",
+        "scratch.profiler"]
+
+_CODE = """
+import importlib, sys, time
+times = []
+for m in {modules!r}:
+    t = time.perf_counter()
+    importlib.import_module(m)
+    times.append(time.perf_counter() - t)
+result = [times, [m for m in {lazy!r} if m in sys.modules]]
+import json
+print(json.dumps(result))
+"""
+
+
+def _import(modules):
+    """Import the comma separated modules in a new interpreter: return their import times and the loaded
+    LAZY modules"""
+    modules = [m.strip() for m in modules.split(",")]
+    p = subprocess.run([sys.executable, "-c", _CODE.format(modules=modules, lazy=LAZY)], cwd=ROOT,
+                       capture_output=True, text=True, check=True)
+    return json.loads(p.stdout)
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_lazy_imports(self):
+        for module in ["scratch.extension", "scratch.definition"]:
+            _t, imported = _import(module)
+            self.assertEqual([], imported, module)
+
+    def test_budget(self):
+        extension, components = [], []
+        for _ in range(5):
+            t, _imported = _import("scratch.components, scratch.extension")
+            components.append(t[0])
+            extension.append(t[1])
+        self.assertLess(min(extension) / min(components), IMPORT_RATIO)
+
+    def test_server_machinery(self):
+        """Still available from scratch.extension"""
+        import http.server
+        import scratch.extension
+        from scratch import httpd
+        self.assertIs(http.server.HTTPServer, scratch.extension.HTTPServer)
+        self.assertIs(httpd.HTTPHandler, scratch.extension.ExtensionService.HTTPHandler)
+        self.assertIs(httpd.MultithreadServer, scratch.extension._BaseHttpMultithreadServer)
+        self.assertEqual(httpd.DEFAULT_QUEUE_SIZE, scratch.extension.DEFAULT_QUEUE_SIZE)
+        self.assertRaises(AttributeError, getattr, scratch.extension, "none")
+
+
+if __name__ == '__main__':
+    unittest.main()
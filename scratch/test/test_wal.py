@@ -0,0 +1,126 @@
+import os
+import tempfile
+import threading
+
+__author__ = 'michele'
+
+import unittest
+from scratch.portability.mock import patch
+from scratch.extension import ExtensionDefinition as ED, ExtensionBase as EB
+from scratch import wal
+
+
+class TestWal(unittest.TestCase):
+
+    def setUp(self):
+        ED._unregister_all()
+        self.ed = ED("def")
+        self.ed.add_sensor("s", value=0)
+        self.ed.add_reporter("r", description="r %m.a %n", a=["x", "y"])
+        self.ed.add_hat("h")
+        self.ed.add_command("c", description="c %n")
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "state.wal")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_write_read(self):
+        w = wal.WalWriter(self.path, commit_interval=0.001)
+        w.append(wal.SET, "s", (), 1)
+        w.append(wal.SET, "r", ("x", 1), "A")
+        self.assertTrue(w.sync(5.0))
+        self.assertEqual(2, w.written)
+        w.close()
+        records = list(wal.read_records(self.path))
+        self.assertEqual([(wal.SET, "s", (), 1), (wal.SET, "r", ("x", 1), "A")], [r[1:] for r in records])
+
+        """Reopen append records"""
+        w = wal.WalWriter(self.path)
+        w.append(wal.FLAG, "h")
+        w.close()
+        self.assertEqual(3, len(list(wal.read_records(self.path))))
+
+    def test_append_after_close(self):
+        w = wal.WalWriter(self.path)
+        w.close()
+        self.assertRaises(ValueError, w.append, wal.SET, "s", (), 1)
+
+    def test_sync_wait_records_in_commit(self):
+        """Records already taken by the writer but not on disk yet are waited too"""
+        w = wal.WalWriter(self.path, commit_interval=0.001)
+        fsync = os.fsync
+        writing, release = threading.Event(), threading.Event()
+
+        def slow_fsync(fd):
+            writing.set()
+            release.wait(5)
+            fsync(fd)
+
+        try:
+            with patch("os.fsync", new=slow_fsync):
+                w.append(wal.SET, "s", (), 1)
+                self.assertTrue(writing.wait(5))
+                self.assertFalse(w.sync(0.05))
+                release.set()
+                self.assertTrue(w.sync(5))
+            self.assertEqual(1, w.written)
+        finally:
+            release.set()
+            w.close()
+
+    def test_truncated_tail(self):
+        w = wal.WalWriter(self.path)
+        w.append(wal.SET, "s", (), 1)
+        w.append(wal.SET, "s", (), 2)
+        w.close()
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 2)
+        self.assertEqual([1], [r[4] for r in wal.read_records(self.path)])
+
+    def test_not_wal(self):
+        with open(self.path, "wb") as f:
+            f.write(b"something")
+        self.assertRaises(ValueError, list, wal.read_records(self.path))
+
+    def test_components_log(self):
+        e = EB(self.ed)
+        e.wal = wal.WalWriter(self.path)
+        e.get_component("s").set(12)
+        e.get_component("s").set(12)
+        e.get_component("r").set("A", "x", 1)
+        e.get_component("r")._set_values([(("y", 2), "B")])
+        e.get_component("h").flag()
+        e.get_component("c").command(3)
+        e.wal.close()
+        self.assertEqual([(wal.SET, "s", (), 12),
+                          (wal.SET, "s", (), 12),
+                          (wal.SET, "r", ("x", 1), "A"),
+                          (wal.SET, "r", ("y", 2), "B"),
+                          (wal.FLAG, "h", (), None),
+                          (wal.COMMAND, "c", (3,), None)], [r[1:] for r in wal.read_records(self.path)])
+
+    def test_replay(self):
+        e = EB(self.ed)
+        e.wal = wal.WalWriter(self.path)
+        e.get_component("s").set(12)
+        e.get_component("r").set("A", "x", 1)
+        e.get_component("h").flag()
+        e.get_component("c").command(3)
+        e.wal.close()
+
+        other = EB(self.ed)
+        self.assertEqual(3, wal.replay(self.path, other))
+        self.assertIsNone(other.wal)
+        self.assertEqual(12, other.get_component("s").get())
+        self.assertEqual("A", other.get_component("r").get("x", 1))
+        self.assertTrue(other.get_component("h").state)
+        self.assertIsNone(other.get_component("c").value)
+
+        other = EB(self.ed)
+        self.assertEqual(4, wal.replay(self.path, other, commands=True))
+        self.assertEqual(3, other.get_component("c").value)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import io
+import struct
+
+__author__ = 'michele'
+
+import unittest
+from scratch.portability.mock import Mock
+from scratch.websocket import accept_key, encode_frame, is_upgrade_request, WebSocket, WebSocketClosed, \
+    OP_TEXT, OP_BINARY, OP_PING, OP_PONG, OP_CLOSE, OP_CONTINUATION, _unmask
+
+
+def client_frame(payload, opcode=OP_TEXT, fin=True, mask=b"\x01\x02\x03\x04"):
+    """Client frames are masked"""
+    l = len(payload)
+    b0 = (0x80 if fin else 0) | opcode
+    if l < 126:
+        header = struct.pack(">BB", b0, 0x80 | l)
+    elif l < (1 << 16):
+        header = struct.pack(">BBH", b0, 0x80 | 126, l)
+    else:
+        header = struct.pack(">BBQ", b0, 0x80 | 127, l)
+    return header + mask + _unmask(payload, mask)
+
+
+class TestWebSocket(unittest.TestCase):
+
+    def test_accept_key(self):
+        """RFC 6455 example"""
+        self.assertEqual("s3pPLMBiTxaQ9kYGzzhZRbK+xOo=", accept_key("dGhlIHNhbXBsZSBub25jZQ=="))
+
+    def test_is_upgrade_request(self):
+        self.assertTrue(is_upgrade_request({"Upgrade": "WebSocket", "Sec-WebSocket-Key": "k"}))
+        self.assertFalse(is_upgrade_request({"Upgrade": "WebSocket"}))
+        self.assertFalse(is_upgrade_request({"Sec-WebSocket-Key": "k"}))
+
+    def test_encode_frame(self):
+        self.assertEqual(b"\x81\x02hi", encode_frame(b"hi"))
+        self.assertEqual(b"\x82\x7e\x01\x00" + b"a" * 256, encode_frame(b"a" * 256, OP_BINARY))
+        self.assertEqual(b"\x81\x7f" + struct.pack(">Q", 70000), encode_frame(b"a" * 70000)[:10])
+
+    def test_receive(self):
+        rfile = io.BytesIO(client_frame(b"hello") + client_frame(b"\x00\x01", OP_BINARY) +
+                           client_frame(b"a" * 300))
+        ws = WebSocket(rfile, Mock())
+        self.assertEqual("hello", ws.receive())
+        self.assertEqual(b"\x00\x01", ws.receive())
+        self.assertEqual("a" * 300, ws.receive())
+        self.assertRaises(WebSocketClosed, ws.receive)
+
+    def test_receive_fragmented_and_control(self):
+        sock = Mock()
+        rfile = io.BytesIO(client_frame(b"hel", fin=False) + client_frame(b"p", OP_PING) +
+                           client_frame(b"lo", OP_CONTINUATION) + client_frame(b"", OP_PONG) +
+                           client_frame(b"", OP_CLOSE))
+        ws = WebSocket(rfile, sock)
+        self.assertEqual("hello", ws.receive())
+        sock.sendall.assert_called_with(encode_frame(b"p", OP_PONG))
+        self.assertRaises(WebSocketClosed, ws.receive)
+        sock.sendall.assert_called_with(encode_frame(b"", OP_CLOSE))
+        self.assertTrue(ws.closed)
+
+    def test_send(self):
+        sock = Mock()
+        ws = WebSocket(io.BytesIO(), sock)
+        ws.send("è")
+        sock.sendall.assert_called_with(encode_frame("è".encode("utf-8")))
+        ws.send(b"\x00")
+        sock.sendall.assert_called_with(encode_frame(b"\x00", OP_BINARY))
+        ws.close()
+        self.assertRaises(WebSocketClosed, ws.send, "a")
+        """Socket errors close the connection"""
+        sock.sendall.side_effect = OSError("broken")
+        ws = WebSocket(io.BytesIO(), sock)
+        self.assertRaises(WebSocketClosed, ws.send, "a")
+        self.assertTrue(ws.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,3 @@
-import json
-
 __author__ = 'michele'
 import socket
 
@@ -15,8 +13,6 @@ def get_local_address(destination, port=37852):
         return ""
 
 def save_service_description(service, fname, host='127.0.0.1'):
-    description = service.description
-    description["host"] = host
-    with open(fname, "w") as f:
-        json.dump(description, fp=f)
+    with open(fname, "wb") as f:
+        f.write(service.description_json(host))
 
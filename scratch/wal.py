@@ -0,0 +1,155 @@
+"""Append-only write-ahead log of the components updates.
+
+The file starts by MAGIC and then every record is a 4 bytes big endian length followed by the compact
+JSON [time, kind, component, args, value]. Kinds are SET (Reporter values), COMMAND and FLAG (hats).
+"""
+import collections
+import logging
+import os
+import struct
+import threading
+import time
+
+__author__ = 'michele'
+
+MAGIC = b"SWAL1\n"
+LENGTH = struct.Struct(">I")
+
+SET = "set"
+COMMAND = "command"
+FLAG = "flag"
+
+DEFAULT_COMMIT_INTERVAL = 0.005
+
+
+class WalWriter():
+    """append() just put the record in a queue: a writer thread takes all queued records, writes them
+    in the buffered file and fsync the file at most every commit_interval seconds (group commit), so
+    the callers never wait the disk."""
+
+    def __init__(self, path, commit_interval=DEFAULT_COMMIT_INTERVAL, clock=time.time):
+        self._path = path
+        self._commit_interval = commit_interval
+        self._clock = clock
+        self._queue = collections.deque()
+        self._pending = threading.Event()
+        self._closed = False
+        self._appended = 0
+        self._append_lock = threading.Lock()
+        self._written = 0
+        self._synced = threading.Condition()
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "ab")
+        if new:
+            self._file.write(MAGIC)
+        self._thread = threading.Thread(name="WAL writer {}".format(path), target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def written(self):
+        """How many records are on disk"""
+        return self._written
+
+    def append(self, kind, name, args=(), value=None):
+        """Queue the record: raise ValueError if the writer is closed"""
+        with self._append_lock:
+            if self._closed:
+                raise ValueError("WAL {} is closed".format(self._path))
+            self._appended += 1
+            self._queue.append([self._clock(), kind, name, list(args), value])
+        self._pending.set()
+
+    def sync(self, timeout=None):
+        """Wait until all appended records are on disk"""
+        target = self._appended
+        self._pending.set()
+        with self._synced:
+            return self._synced.wait_for(lambda: self._written >= target or self._closed, timeout)
+
+    def close(self):
+        with self._append_lock:
+            self._closed = True
+        self._pending.set()
+        self._thread.join()
+        self._file.close()
+
+    def _commit(self):
+        records = []
+        while self._queue:
+            records.append(self._queue.popleft())
+        if not records:
+            return
+        import json
+        chunks = []
+        for r in records:
+            data = json.dumps(r, separators=(",", ":"), default=str).encode("utf-8")
+            chunks += [LENGTH.pack(len(data)), data]
+        self._file.write(b"".join(chunks))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        with self._synced:
+            self._written += len(records)
+            self._synced.notify_all()
+
+    def _run(self):
+        while True:
+            self._pending.wait()
+            self._pending.clear()
+            closed = self._closed
+            try:
+                self._commit()
+            except Exception as e:
+                logging.exception(e)
+            if closed:
+                with self._synced:
+                    self._synced.notify_all()
+                return
+            time.sleep(self._commit_interval)
+
+
+def read_records(path):
+    """Iterate the (time, kind, component, args, value) records: a truncated last record is ignored"""
+    import json
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a WAL file".format(path))
+        while True:
+            header = f.read(LENGTH.size)
+            if len(header) < LENGTH.size:
+                return
+            length = LENGTH.unpack(header)[0]
+            data = f.read(length)
+            if len(data) < length:
+                return
+            t, kind, name, args, value = json.loads(data.decode("utf-8"))
+            yield t, kind, name, tuple(args), value
+
+
+def replay(path, extension, commands=False):
+    """Rebuild the extension state by the records in path. Commands are executed just if commands is
+    True. Return the number of applied records."""
+    wal, extension.wal = extension.wal, None
+    n = 0
+    try:
+        for _t, kind, name, args, value in read_records(path):
+            try:
+                c = extension.get_component(name)
+            except KeyError:
+                continue
+            if kind == SET:
+                c._set_value(value, *args)
+            elif kind == FLAG:
+                c.flag()
+            elif kind == COMMAND:
+                if not commands:
+                    continue
+                c.command(*args)
+            n += 1
+    finally:
+        extension.wal = wal
+    return n
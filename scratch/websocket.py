@@ -0,0 +1,132 @@
+"""Minimal server side WebSocket (RFC 6455) implementation: just what ExtensionService needs."""
+import base64
+import hashlib
+import struct
+import threading
+
+__author__ = 'michele'
+
+GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+MAX_MESSAGE_SIZE = 1 << 20
+
+
+class WebSocketClosed(Exception):
+    pass
+
+
+def accept_key(key):
+    """The Sec-WebSocket-Accept value for the client Sec-WebSocket-Key"""
+    return base64.b64encode(hashlib.sha1(key.encode("ascii") + GUID).digest()).decode("ascii")
+
+
+def is_upgrade_request(headers):
+    return headers.get("Upgrade", "").lower() == "websocket" and "Sec-WebSocket-Key" in headers
+
+
+def encode_frame(payload, opcode=OP_TEXT):
+    """Server frames: final and not masked"""
+    l = len(payload)
+    if l < 126:
+        header = struct.pack(">BB", 0x80 | opcode, l)
+    elif l < (1 << 16):
+        header = struct.pack(">BBH", 0x80 | opcode, 126, l)
+    else:
+        header = struct.pack(">BBQ", 0x80 | opcode, 127, l)
+    return header + payload
+
+
+def _unmask(payload, mask):
+    n = len(payload)
+    key = int.from_bytes((mask * (n // 4 + 1))[:n], "big")
+    return (int.from_bytes(payload, "big") ^ key).to_bytes(n, "big")
+
+
+class WebSocket():
+    """A server side connection. receive() must be called by just one thread; send() can be called
+    by any thread."""
+
+    def __init__(self, rfile, sock):
+        self._rfile = rfile
+        self._sock = sock
+        self._send_lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def _read(self, n):
+        data = self._rfile.read(n)
+        if len(data) < n:
+            raise WebSocketClosed("Connection closed")
+        return data
+
+    def _read_frame(self):
+        b0, b1 = self._read(2)
+        fin, opcode = b0 & 0x80, b0 & 0x0F
+        masked, l = b1 & 0x80, b1 & 0x7F
+        if l == 126:
+            l = struct.unpack(">H", self._read(2))[0]
+        elif l == 127:
+            l = struct.unpack(">Q", self._read(8))[0]
+        if l > MAX_MESSAGE_SIZE:
+            raise WebSocketClosed("Frame too big")
+        mask = self._read(4) if masked else None
+        payload = self._read(l) if l else b""
+        if mask is not None and payload:
+            payload = _unmask(payload, mask)
+        return fin, opcode, payload
+
+    def receive(self):
+        """Return the next text message (str) or binary message (bytes). Control frames are handled here.
+        Raise WebSocketClosed when the connection is closed."""
+        message, message_opcode = [], None
+        while True:
+            fin, opcode, payload = self._read_frame()
+            if opcode == OP_CLOSE:
+                self.close()
+                raise WebSocketClosed("Closed by peer")
+            if opcode == OP_PING:
+                self._send(payload, OP_PONG)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode != OP_CONTINUATION:
+                message_opcode = opcode
+            message.append(payload)
+            if sum(len(m) for m in message) > MAX_MESSAGE_SIZE:
+                raise WebSocketClosed("Message too big")
+            if fin:
+                data = b"".join(message)
+                return data.decode("utf-8") if message_opcode == OP_TEXT else data
+
+    def _send(self, payload, opcode):
+        with self._send_lock:
+            if self._closed:
+                raise WebSocketClosed("Connection closed")
+            try:
+                self._sock.sendall(encode_frame(payload, opcode))
+            except OSError as e:
+                self._closed = True
+                raise WebSocketClosed(str(e))
+
+    def send(self, message):
+        if isinstance(message, str):
+            self._send(message.encode("utf-8"), OP_TEXT)
+        else:
+            self._send(message, OP_BINARY)
+
+    def close(self):
+        try:
+            self._send(b"", OP_CLOSE)
+        except WebSocketClosed:
+            pass
+        self._closed = True